@@ -8,6 +8,9 @@ use PDO;
 use Psr\Http\Message\ResponseInterface as Response;
 use Psr\Http\Message\ServerRequestInterface as Request;
 use App\Models\LogModel;
+use App\Models\LogRollup;
+use App\Services\MessagePackBatch;
+use App\Services\RequestBodyDecoder;
 use Twig\Environment as TwigEnvironment; // Alias to avoid naming conflict if needed
 use OpenApi\Attributes as OA; // Import Swagger annotations
 
@@ -15,6 +18,11 @@ use OpenApi\Attributes as OA; // Import Swagger annotations
 #[OA\Info(title: "Simple Log Aggregation API", version: "1.0")]
 class LogController
 {
+    private const MAX_BATCH_SIZE = 5000;
+    // Longest a tail request (since_id) may wait for new entries, and how often it checks
+    private const MAX_WAIT_SECONDS = 30;
+    private const WAIT_POLL_MICROSECONDS = 250000;
+
     private $pdo;
     private $twig;
 
@@ -28,7 +36,7 @@ class LogController
     #[OA\Post(
         path: "/api/logs",
         summary: "Add a new log entry",
-        description: "Receives log data in JSON format and stores it.",
+        description: "Receives log data in JSON format and stores it. The body may be compressed with Content-Encoding gzip, deflate or zstd (if the zstd extension is installed).",
         requestBody: new OA\RequestBody(
             description: "Log data",
             required: true,
@@ -64,12 +72,32 @@ class LogController
                     ],
                     type: "object"
                 )
+            ),
+            new OA\Response(
+                response: 415,
+                description: "Unsupported Content-Encoding",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "Unsupported Content-Encoding: br")
+                    ],
+                    type: "object"
+                )
             )
         ]
     )]
     public function addLog(Request $request, Response $response): Response
     {
-        $body = $request->getBody();
+        try {
+            $body = RequestBodyDecoder::decode($request);
+        } catch (\InvalidArgumentException $e) {
+            $response = $response->withStatus(415);
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response;
+        } catch (\UnexpectedValueException $e) {
+            $response = $response->withStatus(400);
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response;
+        }
         $data = json_decode($body, true);
 
         if ($data === null && json_last_error() !== JSON_ERROR_NONE) {
@@ -78,12 +106,7 @@ class LogController
             return $response;
         }
 
-        $log = new LogModel($this->pdo);
-        $log->host = $data['host'] ?? 'unknown';
-        $log->host_process = $data['host_process'] ?? null;
-        $log->log_level = $data['log_level'] ?? 'INFO';
-        $log->log_message = $data['log_message'] ?? '';
-        $log->timestamp = $data['timestamp'] ?? date('Y-m-d H:i:s');
+        $log = $this->buildLog($data);
 
         $logId = $log->save();
 
@@ -93,67 +116,457 @@ class LogController
         return $response->withStatus(201);
     }
 
+    #[OA\Post(
+        path: "/api/logs/batch",
+        summary: "Add several log entries at once",
+        description: "Receives a JSON array, or newline-delimited JSON objects (Content-Type: application/x-ndjson), of log entries and stores them in a single transaction. NDJSON bodies are parsed line by line while they are inserted. If the msgpack extension is installed, it also takes the client's MessagePack batches (Content-Type: application/x-msgpack), which send the fields shared by many entries once; otherwise these are answered with 415. Bodies may be compressed with Content-Encoding gzip, deflate or zstd (if the zstd extension is installed). Each item is reported separately, so one bad item does not reject the others.",
+        requestBody: new OA\RequestBody(
+            description: "Array of log data objects, same fields as POST /api/logs",
+            required: true,
+            content: [
+                new OA\JsonContent(
+                    type: "array",
+                    items: new OA\Items(
+                        properties: [
+                            new OA\Property(property: "host", type: "string", example: "server1.example.com"),
+                            new OA\Property(property: "host_process", type: "string", example: "nginx"),
+                            new OA\Property(property: "log_level", type: "string", example: "ERROR"),
+                            new OA\Property(property: "log_message", type: "string", example: "Failed to connect to database."),
+                            new OA\Property(property: "timestamp", type: "string", format: "date-time", example: "2023-10-27T10:00:00Z")
+                        ],
+                        type: "object"
+                    )
+                ),
+                new OA\MediaType(
+                    mediaType: "application/x-ndjson",
+                    schema: new OA\Schema(type: "string", description: "One log data object per line")
+                ),
+                new OA\MediaType(
+                    mediaType: "application/x-msgpack",
+                    schema: new OA\Schema(type: "string", format: "binary", description: "MessagePack batch: shared contexts and records referring to them, see App\\Services\\MessagePackBatch")
+                )
+            ]
+        ),
+        tags: ["Logs"],
+        responses: [
+            new OA\Response(
+                response: 200,
+                description: "Per-item results, in request order",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "inserted", type: "integer", example: 2),
+                        new OA\Property(property: "failed", type: "integer", example: 1),
+                        new OA\Property(
+                            property: "results",
+                            type: "array",
+                            items: new OA\Items(
+                                properties: [
+                                    new OA\Property(property: "id", type: "integer", example: 123),
+                                    new OA\Property(property: "error", type: "string", example: "Item is not a JSON object")
+                                ],
+                                type: "object"
+                            )
+                        )
+                    ],
+                    type: "object"
+                )
+            ),
+            new OA\Response(
+                response: 400,
+                description: "Body is not a JSON array, or is corrupt for its Content-Encoding",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "Expected a JSON array")
+                    ],
+                    type: "object"
+                )
+            ),
+            new OA\Response(
+                response: 413,
+                description: "Too many items in one batch",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "Batch exceeds 5000 items")
+                    ],
+                    type: "object"
+                )
+            ),
+            new OA\Response(
+                response: 415,
+                description: "Unsupported Content-Encoding, or a MessagePack body without the msgpack extension",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "Unsupported Content-Encoding: br")
+                    ],
+                    type: "object"
+                )
+            )
+        ]
+    )]
+    public function addLogs(Request $request, Response $response): Response
+    {
+        $response = $response->withHeader('Content-Type', 'application/json');
+
+        $results = [];
+        try {
+            if ($this->isNdjson($request)) {
+                // Streamed: rows are inserted while the body is still being decoded
+                $logs = $this->ndjsonLogs($request, $results);
+            } else {
+                $body = RequestBodyDecoder::decode($request);
+                $data = MessagePackBatch::matches($request->getHeaderLine('Content-Type'))
+                    ? MessagePackBatch::decode($body)
+                    : json_decode($body, true);
+                if (!is_array($data) || !array_is_list($data)) {
+                    $response->getBody()->write(json_encode(['error' => 'Expected a JSON array']));
+                    return $response->withStatus(400);
+                }
+                if (count($data) > self::MAX_BATCH_SIZE) {
+                    $response->getBody()->write(json_encode(['error' => 'Batch exceeds ' . self::MAX_BATCH_SIZE . ' items']));
+                    return $response->withStatus(413);
+                }
+                $logs = $this->arrayLogs($data, $results);
+            }
+
+            $saved = LogModel::saveBatch($this->pdo, $logs);
+        } catch (\InvalidArgumentException $e) {
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response->withStatus(415);
+        } catch (\UnexpectedValueException $e) {
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response->withStatus(400);
+        } catch (\LengthException $e) {
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response->withStatus(413);
+        }
+
+        $results = $results + $saved;
+        ksort($results);
+
+        $failed = count(array_filter($results, fn($result) => isset($result['error'])));
+        $response->getBody()->write(json_encode([
+            'inserted' => count($results) - $failed,
+            'failed' => $failed,
+            'results' => array_values($results),
+        ]));
+
+        return $response->withStatus(200);
+    }
+
+    private function isNdjson(Request $request): bool
+    {
+        $contentType = strtolower($request->getHeaderLine('Content-Type'));
+        return str_starts_with($contentType, 'application/x-ndjson') || str_starts_with($contentType, 'application/ndjson');
+    }
+
+    private function isLogObject($item): bool
+    {
+        return is_array($item) && (!array_is_list($item) || $item === []);
+    }
+
+    /**
+     * Yield a LogModel per valid array item, recording invalid items in $results.
+     */
+    private function arrayLogs(array $data, array &$results): \Generator
+    {
+        foreach ($data as $index => $item) {
+            if (!$this->isLogObject($item)) {
+                $results[$index] = ['error' => 'Item is not a JSON object'];
+                continue;
+            }
+            yield $index => $this->buildLog($item);
+        }
+    }
+
+    /**
+     * Yield a LogModel per NDJSON line, recording invalid lines in $results.
+     */
+    private function ndjsonLogs(Request $request, array &$results): \Generator
+    {
+        $index = 0;
+        foreach (RequestBodyDecoder::lines($request) as $line) {
+            if ($index >= self::MAX_BATCH_SIZE) {
+                throw new \LengthException('Batch exceeds ' . self::MAX_BATCH_SIZE . ' items');
+            }
+            $item = json_decode($line, true);
+            if (!$this->isLogObject($item)) {
+                $results[$index] = ['error' => 'Item is not a JSON object'];
+            } else {
+                yield $index => $this->buildLog($item);
+            }
+            $index++;
+        }
+    }
+
+    private function buildLog(array $data): LogModel
+    {
+        $log = new LogModel($this->pdo);
+        $log->host = $data['host'] ?? 'unknown';
+        $log->host_process = $data['host_process'] ?? null;
+        $log->log_level = $data['log_level'] ?? 'INFO';
+        $log->log_message = $data['log_message'] ?? '';
+        $log->timestamp = $data['timestamp'] ?? date('Y-m-d H:i:s');
+
+        return $log;
+    }
+
     #[OA\Get(
         path: "/api/logs",
         summary: "Retrieve log entries",
-        description: "Returns a list of log entries, optionally filtered by query parameters.",
+        description: "Returns one page of log entries, newest first, optionally filtered by query parameters. If there are more entries, the X-Next-Cursor response header holds the cursor of the next page. With q, returns the entries whose message contains all of its words instead, best match first, each with a relevance score. With since_id, returns the entries added after that id instead, oldest first, which is how clients tail the logs. With Accept: application/x-ndjson the entries are returned one JSON object per line, encoded one row at a time; the page is still sent as a whole, once X-Next-Cursor is known.",
         tags: ["Logs"],
         parameters: [
             new OA\Parameter(name: "host", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by host name"),
             new OA\Parameter(name: "host_process", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by host process"),
             new OA\Parameter(name: "log_level", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by log level"),
             new OA\Parameter(name: "timestamp_from", in: "query", required: false, schema: new OA\Schema(type: "string", format: "date-time"), description: "Filter logs from this timestamp (inclusive)"),
-            new OA\Parameter(name: "timestamp_to", in: "query", required: false, schema: new OA\Schema(type: "string", format: "date-time"), description: "Filter logs up to this timestamp (inclusive)")
+            new OA\Parameter(name: "timestamp_to", in: "query", required: false, schema: new OA\Schema(type: "string", format: "date-time"), description: "Filter logs up to this timestamp (inclusive)"),
+            new OA\Parameter(name: "limit", in: "query", required: false, schema: new OA\Schema(type: "integer", default: 100, maximum: 1000, minimum: 1), description: "Maximum number of entries to return; larger values are capped at 1000"),
+            new OA\Parameter(name: "cursor", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Opaque cursor from the X-Next-Cursor header of the previous page"),
+            new OA\Parameter(name: "q", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Full-text search: entries whose message contains all of these words, best match first. Combines with the other filters but not with since_id"),
+            new OA\Parameter(name: "since_id", in: "query", required: false, schema: new OA\Schema(type: "integer", minimum: 0), description: "Only entries with a higher id, oldest first; cursor is ignored"),
+            new OA\Parameter(name: "wait", in: "query", required: false, schema: new OA\Schema(type: "number", maximum: 30, minimum: 0), description: "With since_id, seconds to wait for new entries before answering with an empty list")
         ],
         responses: [
             new OA\Response(
                 response: 200,
                 description: "List of log entries",
-                content: new OA\JsonContent(
-                    type: "array",
-                    items: new OA\Items(
-                        properties: [
-                            new OA\Property(property: "id", type: "integer"),
-                            new OA\Property(property: "host", type: "string"),
-                            new OA\Property(property: "host_process", type: "string"),
-                            new OA\Property(property: "log_level", type: "string"),
-                            new OA\Property(property: "log_message", type: "string"),
-                            new OA\Property(property: "timestamp", type: "string", format: "date-time")
-                        ],
-                        type: "object"
+                headers: [
+                    new OA\Header(header: "X-Next-Cursor", description: "Cursor of the next page; absent on the last page", schema: new OA\Schema(type: "string"))
+                ],
+                content: [
+                    new OA\JsonContent(
+                        type: "array",
+                        items: new OA\Items(
+                            properties: [
+                                new OA\Property(property: "id", type: "integer"),
+                                new OA\Property(property: "host", type: "string"),
+                                new OA\Property(property: "host_process", type: "string"),
+                                new OA\Property(property: "log_level", type: "string"),
+                                new OA\Property(property: "log_message", type: "string"),
+                                new OA\Property(property: "timestamp", type: "string", format: "date-time"),
+                                new OA\Property(property: "score", type: "number", description: "Relevance, higher is better; only with q")
+                            ],
+                            type: "object"
+                        )
+                    ),
+                    new OA\MediaType(
+                        mediaType: "application/x-ndjson",
+                        schema: new OA\Schema(type: "string", description: "One log entry object per line")
                     )
+                ]
+            ),
+            new OA\Response(
+                response: 400,
+                description: "Invalid limit, cursor, since_id or wait, or q combined with since_id",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "Invalid cursor")
+                    ],
+                    type: "object"
                 )
             )
         ]
     )]
     public function getLogs(Request $request, Response $response): Response
     {
+        $response = $response->withHeader('Content-Type', 'application/json');
         $queryParams = $request->getQueryParams();
 
-        $host = $queryParams['host'] ?? null;
-        $hostProcess = $queryParams['host_process'] ?? null;
-        $logLevel = $queryParams['log_level'] ?? null;
-        $timestampFrom = $queryParams['timestamp_from'] ?? null;
-        $timestampTo = $queryParams['timestamp_to'] ?? null;
+        try {
+            [$filters, $limit, $cursor, $q] = $this->listingParams($queryParams);
+            if (isset($queryParams['since_id']) && $queryParams['since_id'] !== '') {
+                if ($q !== null) {
+                    throw new \InvalidArgumentException('q cannot be combined with since_id');
+                }
+                $rows = $this->logsSince($queryParams, $filters, $limit);
+            } else {
+                $rows = LogModel::iterLogPage($this->pdo, $filters, $limit, $cursor, $q);
+            }
+        } catch (\InvalidArgumentException $e) {
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response->withStatus(400);
+        }
 
-        $logs = LogModel::getLogs($this->pdo, $host, $hostProcess, $logLevel, $timestampFrom, $timestampTo);
+        if ($this->acceptsNdjson($request)) {
+            // One entry per line, encoded into the body as the rows are fetched, so the page is
+            // never held as an array; the body is sent complete, after the X-Next-Cursor header
+            $response = $response->withHeader('Content-Type', 'application/x-ndjson');
+            $body = $response->getBody();
+            foreach ($rows as $row) {
+                $body->write(json_encode($row) . "\n");
+            }
+        } else {
+            $response->getBody()->write(json_encode(is_array($rows) ? $rows : iterator_to_array($rows, false)));
+        }
 
-        $response = $response->withHeader('Content-Type', 'application/json');
-        $response->getBody()->write(json_encode($logs));
+        $nextCursor = $rows instanceof \Generator ? $rows->getReturn() : null;
+        if ($nextCursor !== null) {
+            $response = $response->withHeader('X-Next-Cursor', $nextCursor);
+        }
 
         return $response;
     }
 
+    /**
+     * Entries after since_id, oldest first. With wait, hold the request until there
+     * is at least one, checking the database a few times per second.
+     *
+     * @throws \InvalidArgumentException if since_id or wait is invalid
+     */
+    private function logsSince(array $queryParams, array $filters, int $limit): array
+    {
+        $sinceId = filter_var($queryParams['since_id'], FILTER_VALIDATE_INT, ['options' => ['min_range' => 0]]);
+        if ($sinceId === false) {
+            throw new \InvalidArgumentException('since_id must be a non-negative integer');
+        }
+        $wait = 0.0;
+        if (isset($queryParams['wait']) && $queryParams['wait'] !== '') {
+            $wait = filter_var($queryParams['wait'], FILTER_VALIDATE_FLOAT);
+            if ($wait === false || $wait < 0) {
+                throw new \InvalidArgumentException('wait must be a non-negative number of seconds');
+            }
+            $wait = min($wait, self::MAX_WAIT_SECONDS);
+            set_time_limit((int) ceil($wait) + 30);
+        }
+
+        $deadline = microtime(true) + $wait;
+        while (true) {
+            $logs = LogModel::getLogsSince($this->pdo, $sinceId, $filters, $limit);
+            if ($logs || microtime(true) >= $deadline || connection_aborted()) {
+                return $logs;
+            }
+            usleep(self::WAIT_POLL_MICROSECONDS);
+        }
+    }
+
     public function viewLogs(Request $request, Response $response): Response
     {
-        $logs = LogModel::getLogs($this->pdo);
+        $queryParams = $request->getQueryParams();
+
+        try {
+            [$filters, $limit, $cursor, $q] = $this->listingParams($queryParams);
+            $page = LogModel::getLogPage($this->pdo, $filters, $limit, $cursor, $q);
+        } catch (\InvalidArgumentException $e) {
+            $response->getBody()->write(htmlspecialchars($e->getMessage()));
+            return $response->withStatus(400);
+        }
 
         // Use the injected twig environment
         $template = $this->twig->load('logs.twig');
-        $response->getBody()->write($template->render(['logs' => $logs]));
+        $response->getBody()->write($template->render([
+            'logs' => $page['logs'],
+            'next_cursor' => $page['next_cursor'],
+            'query' => array_diff_key($queryParams, ['cursor' => true]),
+            'paged' => !empty($queryParams['cursor']),
+            'q' => $q,
+        ]));
         return $response;
     }
 
+    /**
+     * Read the filters, limit, cursor and search query of a log listing from query parameters.
+     *
+     * @throws \InvalidArgumentException if the limit is invalid
+     */
+    private function listingParams(array $queryParams): array
+    {
+        $limit = LogModel::DEFAULT_LIMIT;
+        if (isset($queryParams['limit']) && $queryParams['limit'] !== '') {
+            $limit = filter_var($queryParams['limit'], FILTER_VALIDATE_INT, ['options' => ['min_range' => 1]]);
+            if ($limit === false) {
+                throw new \InvalidArgumentException('limit must be a positive integer');
+            }
+        }
+        $cursor = $queryParams['cursor'] ?? null;
+
+        $filters = [];
+        foreach (['host', 'host_process', 'log_level', 'timestamp_from', 'timestamp_to'] as $name) {
+            if (isset($queryParams[$name]) && is_string($queryParams[$name])) {
+                $filters[$name] = $queryParams[$name];
+            }
+        }
+
+        $q = isset($queryParams['q']) && is_string($queryParams['q']) && trim($queryParams['q']) !== '' ? $queryParams['q'] : null;
+
+        return [$filters, $limit, is_string($cursor) && $cursor !== '' ? $cursor : null, $q];
+    }
+
+    private function acceptsNdjson(Request $request): bool
+    {
+        $accept = strtolower($request->getHeaderLine('Accept'));
+        return str_contains($accept, 'application/x-ndjson') || str_contains($accept, 'application/ndjson');
+    }
+
+    #[OA\Get(
+        path: "/api/logs/stats",
+        summary: "Count log entries over time",
+        description: "Returns the number of log entries per time bucket, oldest first, optionally per host, host process and/or log level. Answered from per-minute counts kept up to date on insert, so it does not read the log entries themselves. Counts of entries removed by retention are kept longer than the entries.",
+        tags: ["Logs"],
+        parameters: [
+            new OA\Parameter(name: "bucket", in: "query", required: false, schema: new OA\Schema(type: "string", default: "minute", enum: ["minute", "hour", "day"]), description: "Width of a time bucket"),
+            new OA\Parameter(name: "group_by", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Comma-separated columns to count separately: host, host_process, log_level"),
+            new OA\Parameter(name: "host", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by host name"),
+            new OA\Parameter(name: "host_process", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by host process"),
+            new OA\Parameter(name: "log_level", in: "query", required: false, schema: new OA\Schema(type: "string"), description: "Filter by log level"),
+            new OA\Parameter(name: "timestamp_from", in: "query", required: false, schema: new OA\Schema(type: "string", format: "date-time"), description: "Count from the minute of this timestamp (inclusive)"),
+            new OA\Parameter(name: "timestamp_to", in: "query", required: false, schema: new OA\Schema(type: "string", format: "date-time"), description: "Count up to the minute of this timestamp (inclusive)")
+        ],
+        responses: [
+            new OA\Response(
+                response: 200,
+                description: "Counts per bucket",
+                content: new OA\JsonContent(
+                    type: "array",
+                    items: new OA\Items(
+                        properties: [
+                            new OA\Property(property: "bucket", type: "string", example: "2023-10-27 10:00:00", description: "Start of the bucket"),
+                            new OA\Property(property: "host", type: "string", description: "Only with group_by=host"),
+                            new OA\Property(property: "host_process", type: "string", nullable: true, description: "Only with group_by=host_process"),
+                            new OA\Property(property: "log_level", type: "string", description: "Only with group_by=log_level"),
+                            new OA\Property(property: "count", type: "integer", example: 42)
+                        ],
+                        type: "object"
+                    )
+                )
+            ),
+            new OA\Response(
+                response: 400,
+                description: "Invalid bucket or group_by, or too many buckets",
+                content: new OA\JsonContent(
+                    properties: [
+                        new OA\Property(property: "error", type: "string", example: "bucket must be one of: minute, hour, day")
+                    ],
+                    type: "object"
+                )
+            )
+        ]
+    )]
+    public function getStats(Request $request, Response $response): Response
+    {
+        $queryParams = $request->getQueryParams();
+        $filters = [];
+        foreach (['host', 'host_process', 'log_level', 'timestamp_from', 'timestamp_to'] as $name) {
+            if (isset($queryParams[$name]) && is_string($queryParams[$name])) {
+                $filters[$name] = $queryParams[$name];
+            }
+        }
+        $bucket = is_string($queryParams['bucket'] ?? null) ? $queryParams['bucket'] : 'minute';
+        $groupBy = is_string($queryParams['group_by'] ?? null) && $queryParams['group_by'] !== ''
+            ? array_map('trim', explode(',', $queryParams['group_by']))
+            : [];
+
+        try {
+            $stats = LogRollup::getStats($this->pdo, $filters, $bucket, $groupBy);
+        } catch (\InvalidArgumentException $e) {
+            $response->getBody()->write(json_encode(['error' => $e->getMessage()]));
+            return $response->withHeader('Content-Type', 'application/json')->withStatus(400);
+        }
+
+        $response->getBody()->write(json_encode($stats));
+        return $response->withHeader('Content-Type', 'application/json');
+    }
+
     #[OA\Get(
         path: "/api/health",
         summary: "Check the health of the API",
@@ -6,6 +6,11 @@ use PDO;
 
 class LogModel
 {
+    public const DEFAULT_LIMIT = 100;
+    public const MAX_LIMIT = 1000;
+
+    private const INSERT_SQL = "INSERT INTO logs (host, host_process, log_level, log_message, timestamp) VALUES (:host, :host_process, :log_level, :log_message, :timestamp)";
+
     public $id;
     public $host;
     public $host_process;
@@ -23,60 +28,358 @@ class LogModel
 
     public function save(): int
     {
-        $sql = "INSERT INTO logs (host, host_process, log_level, log_message, timestamp) VALUES (:host, :host_process, :log_level, :log_message, :timestamp)";
-        $stmt = $this->db->prepare($sql);
-        $stmt->execute([
+        $rollup = new LogRollup();
+        $this->db->beginTransaction();
+        try {
+            $stmt = $this->db->prepare(self::INSERT_SQL);
+            $stmt->execute($this->insertParams());
+            $id = (int) $this->db->lastInsertId();
+            $rollup->add($this);
+            $rollup->flush($this->db);
+            $this->db->commit();
+        } catch (\Throwable $e) {
+            $this->db->rollBack();
+            throw $e;
+        }
+
+        return $id;
+    }
+
+    /**
+     * Insert several logs in a single transaction, reusing one prepared statement.
+     *
+     * $logs may be a generator, so rows can be inserted while the request body is
+     * still being read. A row that fails to insert does not abort the others; an
+     * exception thrown by the iterable rolls the whole batch back. Returns one entry
+     * per input log, keyed like the input: ['id' => int] or ['error' => string].
+     * The per-minute counts of the inserted logs are added to the rollups before
+     * the commit, one upsert per (minute, host, host_process, log_level).
+     */
+    public static function saveBatch(PDO $db, iterable $logs): array
+    {
+        $results = [];
+        $rollup = new LogRollup();
+
+        $db->beginTransaction();
+        try {
+            $stmt = $db->prepare(self::INSERT_SQL);
+            foreach ($logs as $key => $log) {
+                try {
+                    $stmt->execute($log->insertParams());
+                    $log->id = (int) $db->lastInsertId();
+                    $results[$key] = ['id' => $log->id];
+                    $rollup->add($log);
+                } catch (\PDOException $e) {
+                    $results[$key] = ['error' => $e->getMessage()];
+                }
+            }
+            $rollup->flush($db);
+            $db->commit();
+        } catch (\Throwable $e) {
+            $db->rollBack();
+            throw $e;
+        }
+
+        return $results;
+    }
+
+    private function insertParams(): array
+    {
+        return [
             ':host' => $this->host,
             ':host_process' => $this->host_process,
             ':log_level' => $this->log_level,
             ':log_message' => $this->log_message,
             ':timestamp' => $this->timestamp,
-        ]);
+        ];
+    }
+
+    /**
+     * Delete the logs with a timestamp before $cutoff, oldest first, in transactions
+     * of at most $batchSize rows.
+     *
+     * Each batch is found through the timestamp index and committed on its own, so
+     * inserts wait for one short batch at a time rather than for the whole purge.
+     * The rollups of those logs are kept; see LogRollup::purgeBefore(). Returns the
+     * number of logs deleted.
+     */
+    public static function purgeBefore(PDO $db, string $cutoff, int $batchSize = 5000): int
+    {
+        $batchSize = max(1, $batchSize);
+        $select = $db->prepare("SELECT id FROM logs WHERE timestamp < :cutoff ORDER BY timestamp LIMIT " . $batchSize);
+        $deleted = 0;
+
+        do {
+            $select->execute([':cutoff' => $cutoff]);
+            $ids = array_map('intval', $select->fetchAll(PDO::FETCH_COLUMN));
+            if (!$ids) {
+                break;
+            }
+            $db->beginTransaction();
+            try {
+                // The ids are integers read from the table, safe to inline
+                $db->exec("DELETE FROM logs WHERE id IN (" . implode(',', $ids) . ")");
+                $db->commit();
+            } catch (\Throwable $e) {
+                $db->rollBack();
+                throw $e;
+            }
+            $deleted += count($ids);
+        } while (count($ids) === $batchSize);
+
+        return $deleted;
+    }
+
+    /**
+     * Fetch one page of logs, newest first (ordered by timestamp, then id).
+     *
+     * $limit is clamped to 1..MAX_LIMIT. $cursor is the opaque value returned by
+     * encodeCursor() for the last row of the previous page; the page then starts
+     * right after that row, so each page is an index range scan however deep it is.
+     *
+     * @throws \InvalidArgumentException if $cursor is malformed
+     */
+    public static function getLogs(PDO $db, string $host = null, string $hostProcess = null, string $logLevel = null, string $timestampFrom = null, string $timestampTo = null, int $limit = self::DEFAULT_LIMIT, string $cursor = null): array
+    {
+        $limit = max(1, min($limit, self::MAX_LIMIT));
+        $filters = [
+            'host' => $host,
+            'host_process' => $hostProcess,
+            'log_level' => $logLevel,
+            'timestamp_from' => $timestampFrom,
+            'timestamp_to' => $timestampTo,
+        ];
+        return self::queryLogs($db, $filters, $limit, $cursor)->fetchAll(PDO::FETCH_ASSOC);
+    }
+
+    /**
+     * Fetch logs added after the row with id $sinceId, oldest first (ordered by id).
+     *
+     * Meant for tailing: the caller passes the highest id it has seen. The rows are
+     * read by a primary key range scan, so the cost grows with the number of new
+     * rows, not with the size of the table. $filters is as for getLogPage().
+     */
+    public static function getLogsSince(PDO $db, int $sinceId, array $filters = [], int $limit = self::DEFAULT_LIMIT): array
+    {
+        $limit = max(1, min($limit, self::MAX_LIMIT));
+        $params = [':since_id' => $sinceId];
+
+        // Keep the planner off the filter indexes, which would scan every row of a host or level
+        $table = match ($db->getAttribute(PDO::ATTR_DRIVER_NAME)) {
+            'sqlite' => 'logs NOT INDEXED',
+            'mysql' => 'logs FORCE INDEX (PRIMARY)',
+            default => 'logs',
+        };
+        $sql = "SELECT * FROM $table WHERE id > :since_id" . self::filterSql($filters, $params)
+            . " ORDER BY id ASC LIMIT " . $limit;
+
+        $stmt = $db->prepare($sql);
+        $stmt->execute($params);
+
+        return $stmt->fetchAll(PDO::FETCH_ASSOC);
+    }
+
+    private static function queryLogs(PDO $db, array $filters, int $limit, ?string $cursor): \PDOStatement
+    {
+        $params = [];
+        $sql = "SELECT * FROM logs WHERE 1=1" . self::filterSql($filters, $params);
+
+        if ($cursor) {
+            [$afterTimestamp, $afterId] = self::decodeCursor($cursor);
+            // Spelled out rather than (timestamp, id) < (...), which MySQL does not use indexes for
+            $sql .= " AND (timestamp < :after_timestamp OR (timestamp = :after_timestamp_eq AND id < :after_id))";
+            $params[':after_timestamp'] = $afterTimestamp;
+            $params[':after_timestamp_eq'] = $afterTimestamp;
+            $params[':after_id'] = $afterId;
+        }
+
+        $sql .= " ORDER BY timestamp DESC, id DESC LIMIT " . $limit;
 
-        return $this->db->lastInsertId();
+        $stmt = $db->prepare($sql);
+        $stmt->execute($params);
+
+        return $stmt;
     }
 
-    public static function getLogs(PDO $db, string $host = null, string $hostProcess = null, string $logLevel = null, string $timestampFrom = null, string $timestampTo = null): array
+    /**
+     * SQL conditions for the listing filters, each starting with " AND ". Adds the bound values to $params.
+     */
+    private static function filterSql(array $filters, array &$params): string
     {
-        $sql = "SELECT * FROM logs WHERE 1=1";
+        $sql = "";
 
-        if ($host) {
+        if (!empty($filters['host'])) {
             $sql .= " AND host = :host";
+            $params[':host'] = $filters['host'];
         }
-        if ($hostProcess) {
+        if (!empty($filters['host_process'])) {
             $sql .= " AND host_process = :host_process";
+            $params[':host_process'] = $filters['host_process'];
         }
-        if ($logLevel) {
+        if (!empty($filters['log_level'])) {
             $sql .= " AND log_level = :log_level";
+            $params[':log_level'] = $filters['log_level'];
         }
-        if ($timestampFrom) {
+        if (!empty($filters['timestamp_from'])) {
             $sql .= " AND timestamp >= :timestamp_from";
+            $params[':timestamp_from'] = $filters['timestamp_from'];
         }
-        if ($timestampTo) {
+        if (!empty($filters['timestamp_to'])) {
             $sql .= " AND timestamp <= :timestamp_to";
+            $params[':timestamp_to'] = $filters['timestamp_to'];
         }
 
-        $stmt = $db->prepare($sql);
+        return $sql;
+    }
 
-        $params = [];
-        if ($host) {
-            $params[':host'] = $host;
-        }
-        if ($hostProcess) {
-            $params[':host_process'] = $hostProcess;
-        }
-        if ($logLevel) {
-            $params[':log_level'] = $logLevel;
+    /**
+     * Fetch one page of logs and the cursor of the page after it.
+     *
+     * $filters uses the query parameter names: host, host_process, log_level,
+     * timestamp_from and timestamp_to. Returns ['logs' => array, 'next_cursor' =>
+     * string|null]; next_cursor is null on the last page. $q is a full-text
+     * search, as for iterLogPage().
+     *
+     * @throws \InvalidArgumentException if $cursor is malformed
+     */
+    public static function getLogPage(PDO $db, array $filters, int $limit = self::DEFAULT_LIMIT, string $cursor = null, string $q = null): array
+    {
+        $rows = self::iterLogPage($db, $filters, $limit, $cursor, $q);
+        $logs = iterator_to_array($rows, false);
+
+        return ['logs' => $logs, 'next_cursor' => $rows->getReturn()];
+    }
+
+    /**
+     * Like getLogPage(), but yields the rows one at a time as they are fetched.
+     *
+     * With a search query $q, only logs whose message contains all its words are
+     * returned, best match first, each with a relevance 'score'. The generator
+     * returns the cursor of the next page (null on the last page), available
+     * through getReturn() once it is exhausted.
+     *
+     * @throws \InvalidArgumentException if $cursor is malformed
+     */
+    public static function iterLogPage(PDO $db, array $filters, int $limit = self::DEFAULT_LIMIT, string $cursor = null, string $q = null): \Generator
+    {
+        $limit = max(1, min($limit, self::MAX_LIMIT));
+        $q = $q !== null ? trim($q) : '';
+        $sortColumn = $q !== '' ? 'score' : 'timestamp';
+        // Validated here rather than on the first iteration, so callers can still answer 400
+        if ($cursor) {
+            self::decodeCursor($cursor, $sortColumn);
         }
-        if ($timestampFrom) {
-            $params[':timestamp_from'] = $timestampFrom;
+
+        return (function () use ($db, $filters, $limit, $cursor, $q, $sortColumn) {
+            // One extra row tells whether there is a next page
+            $stmt = $q !== ''
+                ? self::querySearch($db, $q, $filters, $limit + 1, $cursor)
+                : self::queryLogs($db, $filters, $limit + 1, $cursor);
+
+            $count = 0;
+            $last = null;
+            while (($row = $stmt->fetch(PDO::FETCH_ASSOC)) !== false) {
+                if (++$count > $limit) {
+                    $stmt->closeCursor();
+                    return self::encodeCursor($last, $sortColumn);
+                }
+                yield $row;
+                $last = $row;
+            }
+
+            return null;
+        })();
+    }
+
+    /**
+     * Full-text search over log_message, best match first (by score, then id).
+     *
+     * SQLite uses the logs_fts FTS5 table, MySQL the FULLTEXT index on log_message;
+     * both are kept up to date on insert (see database/create_table.php). The
+     * score is higher for better matches; it is only comparable within one query.
+     */
+    private static function querySearch(PDO $db, string $q, array $filters, int $limit, ?string $cursor): \PDOStatement
+    {
+        $mysql = $db->getAttribute(PDO::ATTR_DRIVER_NAME) === 'mysql';
+        $params = [];
+        // Each use of the score needs its own placeholder: PDO does not allow repeating one
+        $score = function () use ($mysql, $q, &$params): string {
+            if (!$mysql) {
+                return "-bm25(logs_fts)";  // bm25() is lower for better matches
+            }
+            $name = ':q' . count($params);
+            $params[$name] = self::ftsQuery($q, '+');
+            return "MATCH(logs.log_message) AGAINST ($name IN BOOLEAN MODE)";
+        };
+
+        if ($mysql) {
+            $sql = "SELECT logs.*, " . $score() . " AS score FROM logs WHERE " . $score();
+        } else {
+            $sql = "SELECT logs.*, " . $score() . " AS score FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid"
+                . " WHERE logs_fts MATCH :q";
+            $params[':q'] = self::ftsQuery($q);
         }
-        if ($timestampTo) {
-            $params[':timestamp_to'] = $timestampTo;
+        $sql .= self::filterSql($filters, $params);
+
+        if ($cursor) {
+            [$afterScore, $afterId] = self::decodeCursor($cursor, 'score');
+            $sql .= " AND (" . $score() . " < :after_score OR (" . $score() . " = :after_score_eq AND logs.id > :after_id))";
+            $params[':after_score'] = $afterScore;
+            $params[':after_score_eq'] = $afterScore;
+            $params[':after_id'] = $afterId;
         }
 
+        $sql .= " ORDER BY score DESC, logs.id ASC LIMIT " . $limit;
+
+        $stmt = $db->prepare($sql);
         $stmt->execute($params);
 
-        return $stmt->fetchAll(PDO::FETCH_ASSOC);
+        return $stmt;
+    }
+
+    /**
+     * Full-text query matching messages that contain every word of $q, each taken literally.
+     *
+     * FTS5 treats quoted terms next to each other as all required; MySQL's boolean
+     * mode needs a '+' $required prefix on each, and has no way to escape a quote.
+     */
+    private static function ftsQuery(string $q, string $required = ''): string
+    {
+        $terms = preg_split('/\s+/u', $q, -1, PREG_SPLIT_NO_EMPTY);
+        $quote = $required === '' ? '""' : '';
+        return implode(' ', array_map(fn($term) => $required . '"' . str_replace('"', $quote, $term) . '"', $terms));
+    }
+
+    /**
+     * Opaque cursor pointing at a row: base64url-encoded JSON of [sort value, id].
+     *
+     * The sort value is the timestamp for listings, and the score for searches.
+     */
+    public static function encodeCursor(array $row, string $sortColumn = 'timestamp'): string
+    {
+        $sortValue = $sortColumn === 'score' ? (float) $row['score'] : (string) $row['timestamp'];
+        $json = json_encode([$sortValue, (int) $row['id']]);
+        return rtrim(strtr(base64_encode($json), '+/', '-_'), '=');
+    }
+
+    /**
+     * Decode a cursor made by encodeCursor() into [sort value, id].
+     *
+     * @throws \InvalidArgumentException if $cursor is malformed or was made for the other sort order
+     */
+    public static function decodeCursor(string $cursor, string $sortColumn = 'timestamp'): array
+    {
+        $json = base64_decode(strtr($cursor, '-_', '+/'), true);
+        $position = $json === false ? null : json_decode($json, true);
+        if (!is_array($position) || count($position) !== 2 || !is_int($position[1] ?? null)) {
+            throw new \InvalidArgumentException('Invalid cursor');
+        }
+        $sortValue = $position[0] ?? null;
+        $valid = $sortColumn === 'score' ? is_int($sortValue) || is_float($sortValue) : is_string($sortValue);
+        if (!$valid) {
+            throw new \InvalidArgumentException('Invalid cursor');
+        }
+
+        return $position;
     }
 }
@@ -0,0 +1,150 @@
+<?php
+
+namespace App\Models;
+
+use PDO;
+
+/**
+ * Counts of logs per (minute, host, host_process, log_level), kept in the
+ * log_rollups table as logs are inserted.
+ *
+ * Histograms are answered from these counts instead of from the logs table,
+ * so their cost depends on the time range and the number of hosts and levels,
+ * not on how many logs there are. They also outlive the logs removed by
+ * LogModel::purgeBefore().
+ */
+class LogRollup
+{
+    public const BUCKETS = ['minute' => 16, 'hour' => 13, 'day' => 10];
+    public const GROUP_COLUMNS = ['host', 'host_process', 'log_level'];
+    public const MAX_ROWS = 10000;
+
+    /** @var array<string, array> pending counts keyed by their group */
+    private array $counts = [];
+
+    /**
+     * Count one inserted log.
+     */
+    public function add(LogModel $log): void
+    {
+        $row = [self::minute($log->timestamp), $log->host, (string) $log->host_process, $log->log_level];
+        $key = implode("\0", $row);
+        if (isset($this->counts[$key])) {
+            $this->counts[$key][4]++;
+        } else {
+            $this->counts[$key] = [...$row, 1];
+        }
+    }
+
+    /**
+     * Add the pending counts to log_rollups, one upsert per group, and clear them.
+     *
+     * Call it in the transaction that inserted the logs, so the counts and the logs
+     * are committed together. A batch from one host usually needs only a few upserts.
+     */
+    public function flush(PDO $db): void
+    {
+        if (!$this->counts) {
+            return;
+        }
+        $sql = "INSERT INTO log_rollups (minute, host, host_process, log_level, count) VALUES (?, ?, ?, ?, ?)";
+        $sql .= $db->getAttribute(PDO::ATTR_DRIVER_NAME) === 'mysql'
+            ? " ON DUPLICATE KEY UPDATE count = count + VALUES(count)"
+            : " ON CONFLICT (minute, host, host_process, log_level) DO UPDATE SET count = count + excluded.count";
+        $stmt = $db->prepare($sql);
+        foreach ($this->counts as $row) {
+            $stmt->execute($row);
+        }
+        $this->counts = [];
+    }
+
+    /**
+     * Log counts per time bucket, oldest first.
+     *
+     * $filters is as for LogModel::getLogPage(); the timestamp range is applied at
+     * minute resolution. Each row has 'bucket' (the bucket's start, "Y-m-d H:i:s"),
+     * the $groupBy columns and 'count'.
+     *
+     * @throws \InvalidArgumentException if $bucket or $groupBy is unknown, or the result would have more than MAX_ROWS rows
+     */
+    public static function getStats(PDO $db, array $filters = [], string $bucket = 'minute', array $groupBy = []): array
+    {
+        if (!isset(self::BUCKETS[$bucket])) {
+            throw new \InvalidArgumentException('bucket must be one of: ' . implode(', ', array_keys(self::BUCKETS)));
+        }
+        $unknown = array_diff($groupBy, self::GROUP_COLUMNS);
+        if ($unknown) {
+            throw new \InvalidArgumentException('Cannot group by: ' . implode(', ', $unknown));
+        }
+        $groupBy = array_values(array_unique($groupBy));
+
+        $params = [];
+        $where = "1=1";
+        foreach (self::GROUP_COLUMNS as $column) {
+            if (!empty($filters[$column])) {
+                $where .= " AND $column = :$column";
+                $params[":$column"] = $filters[$column];
+            }
+        }
+        if (!empty($filters['timestamp_from'])) {
+            $where .= " AND minute >= :minute_from";
+            $params[':minute_from'] = self::minute($filters['timestamp_from']);
+        }
+        if (!empty($filters['timestamp_to'])) {
+            $where .= " AND minute <= :minute_to";
+            $params[':minute_to'] = self::minute($filters['timestamp_to']);
+        }
+
+        $columns = implode('', array_map(fn($column) => ", $column", $groupBy));
+        $sql = "SELECT SUBSTR(minute, 1, " . self::BUCKETS[$bucket] . ") AS bucket$columns, SUM(count) AS count"
+            . " FROM log_rollups WHERE $where"
+            . " GROUP BY bucket$columns ORDER BY bucket$columns LIMIT " . (self::MAX_ROWS + 1);
+
+        $stmt = $db->prepare($sql);
+        $stmt->execute($params);
+        $rows = $stmt->fetchAll(PDO::FETCH_ASSOC);
+        if (count($rows) > self::MAX_ROWS) {
+            throw new \InvalidArgumentException('Too many buckets; narrow the time range or use a larger bucket');
+        }
+
+        $suffix = substr('0000-00-00 00:00:00', self::BUCKETS[$bucket]);
+        foreach ($rows as &$row) {
+            $row['bucket'] .= $suffix;
+            $row['count'] = (int) $row['count'];
+            if (array_key_exists('host_process', $row) && $row['host_process'] === '') {
+                $row['host_process'] = null;
+            }
+        }
+
+        return $rows;
+    }
+
+    /**
+     * Delete the counts of minutes before $cutoff. Returns the number of rows deleted.
+     */
+    public static function purgeBefore(PDO $db, string $cutoff): int
+    {
+        $stmt = $db->prepare("DELETE FROM log_rollups WHERE minute < :cutoff");
+        $stmt->execute([':cutoff' => self::minute($cutoff)]);
+
+        return $stmt->rowCount();
+    }
+
+    /**
+     * The minute a timestamp falls in, as "Y-m-d H:i:00".
+     *
+     * Timestamps are stored as the clients sent them and compared as strings, so
+     * this only takes the leading date and time; it does not convert time zones.
+     * Timestamps it cannot read are counted in the current minute.
+     */
+    public static function minute(?string $timestamp): string
+    {
+        if ($timestamp !== null && preg_match('/^(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2})/', $timestamp, $m)) {
+            return "{$m[1]} {$m[2]}:00";
+        }
+        if ($timestamp !== null && preg_match('/^\d{4}-\d{2}-\d{2}$/', $timestamp)) {
+            return "$timestamp 00:00:00";
+        }
+        return date('Y-m-d H:i:00');
+    }
+}
@@ -13,7 +13,9 @@ return function (App $app) {
     })->setName('home');
 
     $app->post('/api/logs', [LogController::class, 'addLog'])->setName('addLog');
+    $app->post('/api/logs/batch', [LogController::class, 'addLogs'])->setName('addLogs');
     $app->get('/api/logs', [LogController::class, 'getLogs'])->setName('getLogs');
+    $app->get('/api/logs/stats', [LogController::class, 'getStats'])->setName('getStats');
     $app->get('/logs', [LogController::class, 'viewLogs'])->setName('viewLogs');
     $app->get('/api/health', [LogController::class, 'healthCheck'])->setName('healthCheck');
 };
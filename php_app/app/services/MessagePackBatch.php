@@ -0,0 +1,96 @@
+<?php
+
+namespace App\Services;
+
+/**
+ * Decodes the MessagePack batch format of the Python client.
+ *
+ * A batch is a map with the fields shared by many records sent once, and
+ * records that refer to them by index:
+ *
+ *     {"version": 1,
+ *      "context_fields": ["host", "host_process", ...],
+ *      "contexts": [["web-1", "app.db", ...], ...],
+ *      "records": [[context index, timestamp, level, message, lineno, {other fields}], ...]}
+ *
+ * Timestamps are integer microseconds since the epoch (UTC). Decoding needs
+ * the msgpack extension; without it the batch endpoint answers 415 and the
+ * client sends JSON instead.
+ */
+class MessagePackBatch
+{
+    public const CONTENT_TYPES = ['application/x-msgpack', 'application/msgpack', 'application/vnd.msgpack'];
+
+    public static function isSupported(): bool
+    {
+        return function_exists('msgpack_unpack');
+    }
+
+    public static function matches(string $contentType): bool
+    {
+        $mediaType = strtolower(trim(explode(';', $contentType, 2)[0]));
+        return in_array($mediaType, self::CONTENT_TYPES, true);
+    }
+
+    /**
+     * Expand a batch into one entry per record, with the same fields as a
+     * JSON entry of the client. Records that cannot be read are null.
+     *
+     * @throws \InvalidArgumentException if the msgpack extension is not installed
+     * @throws \UnexpectedValueException if the body is not a batch
+     */
+    public static function decode(string $body): array
+    {
+        if (!self::isSupported()) {
+            throw new \InvalidArgumentException('Unsupported Content-Type: MessagePack needs the msgpack extension');
+        }
+        $batch = @msgpack_unpack($body);
+        if (!is_array($batch) || ($batch['version'] ?? null) !== 1
+            || !isset($batch['context_fields'], $batch['contexts'], $batch['records'])
+            || !is_array($batch['context_fields']) || !is_array($batch['contexts']) || !is_array($batch['records'])
+            || !array_is_list($batch['records'])) {
+            throw new \UnexpectedValueException('Invalid MessagePack batch');
+        }
+
+        $fields = $batch['context_fields'];
+        $contexts = [];
+        foreach ($batch['contexts'] as $index => $context) {
+            if (is_array($context) && count($context) === count($fields)) {
+                $contexts[$index] = array_combine($fields, $context);
+            }
+        }
+
+        $entries = [];
+        foreach ($batch['records'] as $record) {
+            if (!is_array($record) || count($record) < 5 || !is_int($record[0]) || !isset($contexts[$record[0]])) {
+                $entries[] = null;
+                continue;
+            }
+            $entry = $contexts[$record[0]];
+            $entry['timestamp'] = is_int($record[1]) ? self::timestamp($record[1]) : $record[1];
+            $entry['level'] = $record[2];
+            $entry['message'] = $record[3];
+            $entry['lineno'] = $record[4];
+            if (isset($record[5]) && is_array($record[5])) {
+                $entry += $record[5];
+            }
+            $entries[] = $entry;
+        }
+
+        return $entries;
+    }
+
+    /**
+     * Epoch microseconds as the ISO 8601 timestamp the client sends in JSON.
+     */
+    public static function timestamp(int $micros): string
+    {
+        $seconds = intdiv($micros, 1000000);
+        $fraction = $micros % 1000000;
+        if ($fraction < 0) {
+            $seconds--;
+            $fraction += 1000000;
+        }
+        return gmdate('Y-m-d\TH:i:s', $seconds) . sprintf('.%06d+00:00', $fraction);
+    }
+}
@@ -0,0 +1,122 @@
+<?php
+
+namespace App\Services;
+
+use Psr\Http\Message\ServerRequestInterface as Request;
+
+/**
+ * Reads request bodies in chunks, undoing any Content-Encoding on the fly,
+ * so large uploads never have to be held in memory in one piece.
+ */
+class RequestBodyDecoder
+{
+    private const CHUNK_SIZE = 65536;
+
+    public static function isSupported(string $encoding): bool
+    {
+        switch (self::normalize($encoding)) {
+            case 'identity':
+                return true;
+            case 'gzip':
+            case 'deflate':
+                return function_exists('inflate_init');
+            case 'zstd':
+                return function_exists('zstd_uncompress_init');
+            default:
+                return false;
+        }
+    }
+
+    /**
+     * Yield the decompressed request body chunk by chunk.
+     *
+     * @throws \InvalidArgumentException if the Content-Encoding is not supported
+     * @throws \UnexpectedValueException if the body is not valid for its encoding
+     */
+    public static function chunks(Request $request): \Generator
+    {
+        $encoding = self::normalize($request->getHeaderLine('Content-Encoding'));
+        if (!self::isSupported($encoding)) {
+            throw new \InvalidArgumentException("Unsupported Content-Encoding: $encoding");
+        }
+
+        $body = $request->getBody();
+        if ($body->isSeekable()) {
+            $body->rewind();
+        }
+
+        if ($encoding === 'identity') {
+            while (!$body->eof()) {
+                $chunk = $body->read(self::CHUNK_SIZE);
+                if ($chunk !== '') {
+                    yield $chunk;
+                }
+            }
+            return;
+        }
+
+        if ($encoding === 'zstd') {
+            $context = zstd_uncompress_init();
+            $decompress = fn(string $chunk) => zstd_uncompress_add($context, $chunk);
+        } else {
+            $context = inflate_init($encoding === 'gzip' ? ZLIB_ENCODING_GZIP : ZLIB_ENCODING_DEFLATE);
+            $decompress = fn(string $chunk) => @inflate_add($context, $chunk, ZLIB_SYNC_FLUSH);
+        }
+
+        while (!$body->eof()) {
+            $chunk = $body->read(self::CHUNK_SIZE);
+            if ($chunk === '') {
+                continue;
+            }
+            $decoded = $decompress($chunk);
+            if ($decoded === false) {
+                throw new \UnexpectedValueException("Corrupt $encoding request body");
+            }
+            if ($decoded !== '') {
+                yield $decoded;
+            }
+        }
+    }
+
+    /**
+     * Read the whole decompressed request body into a string.
+     */
+    public static function decode(Request $request): string
+    {
+        return implode('', iterator_to_array(self::chunks($request), false));
+    }
+
+    /**
+     * Yield the non-empty lines of the decompressed request body (for NDJSON),
+     * keeping at most one partial line buffered.
+     */
+    public static function lines(Request $request): \Generator
+    {
+        $buffer = '';
+        foreach (self::chunks($request) as $chunk) {
+            $buffer .= $chunk;
+            $start = 0;
+            while (($end = strpos($buffer, "\n", $start)) !== false) {
+                $line = rtrim(substr($buffer, $start, $end - $start), "\r");
+                if ($line !== '') {
+                    yield $line;
+                }
+                $start = $end + 1;
+            }
+            $buffer = substr($buffer, $start);
+        }
+        $buffer = rtrim($buffer, "\r");
+        if ($buffer !== '') {
+            yield $buffer;
+        }
+    }
+
+    private static function normalize(string $encoding): string
+    {
+        $encoding = strtolower(trim($encoding));
+        if ($encoding === '') {
+            return 'identity';
+        }
+        return $encoding === 'x-gzip' ? 'gzip' : $encoding;
+    }
+}
@@ -40,6 +40,10 @@ return function (App $app) {
             case 'sqlite':
                 $dsn = "sqlite:" . $connection['database'];
                 $pdo = new PDO($dsn);
+                // WAL lets readers run alongside the writer; wait for locks instead of failing at once
+                $pdo->exec('PRAGMA journal_mode=WAL');
+                $pdo->exec('PRAGMA busy_timeout=5000');
+                $pdo->exec('PRAGMA synchronous=NORMAL');
                 break;
         }
 
@@ -30,6 +30,11 @@ if ($dbConnection === 'sqlite') {
 
 $db->setAttribute(PDO::ATTR_ERRMODE, PDO::ERRMODE_EXCEPTION);
 
+if ($dbConnection === 'sqlite') {
+    // Write-ahead logging, so reading logs does not block ingestion. Stored in the database file.
+    $db->exec('PRAGMA journal_mode=WAL');
+}
+
 $sql = "
 CREATE TABLE IF NOT EXISTS logs (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -42,9 +47,110 @@ CREATE TABLE IF NOT EXISTS logs (
 );
 ";
 
+// Listings filter on these columns and page through them newest first by
+// (timestamp, id); the id is part of every index as the row key.
+$indexes = [
+    'idx_logs_timestamp' => 'timestamp',
+    'idx_logs_host_timestamp' => 'host, timestamp',
+    'idx_logs_host_process_timestamp' => 'host_process, timestamp',
+    'idx_logs_log_level_timestamp' => 'log_level, timestamp',
+];
+$ifNotExists = $dbConnection === 'sqlite' ? 'IF NOT EXISTS ' : '';
+
 try {
     $db->exec($sql);
     echo "Table 'logs' created successfully!\n";
 } catch (PDOException $e) {
     echo "Error creating table: " . $e->getMessage() . "\n";
 }
+
+foreach ($indexes as $name => $columns) {
+    try {
+        $db->exec("CREATE INDEX {$ifNotExists}$name ON logs ($columns)");
+        echo "Index '$name' created successfully!\n";
+    } catch (PDOException $e) {
+        echo "Error creating index '$name': " . $e->getMessage() . "\n";
+    }
+}
+
+// Full-text index over log_message for the q search parameter
+if ($dbConnection === 'sqlite') {
+    // External-content FTS5 table: stores only the index, the text stays in logs.
+    // Triggers keep it in step with inserts, deletes and updates.
+    $ftsStatements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(log_message, content='logs', content_rowid='id')",
+        "CREATE TRIGGER IF NOT EXISTS logs_ai AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+        END",
+        "CREATE TRIGGER IF NOT EXISTS logs_ad AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+        END",
+        "CREATE TRIGGER IF NOT EXISTS logs_au AFTER UPDATE OF log_message ON logs BEGIN
+            INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+            INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+        END",
+    ];
+} else {
+    $ftsStatements = ['ALTER TABLE logs ADD FULLTEXT INDEX ft_logs_log_message (log_message)'];
+}
+
+try {
+    $ftsExisted = $dbConnection === 'sqlite'
+        && $db->query("SELECT 1 FROM sqlite_master WHERE name = 'logs_fts'")->fetchColumn() !== false;
+    foreach ($ftsStatements as $statement) {
+        $db->exec($statement);
+    }
+    if ($dbConnection === 'sqlite' && !$ftsExisted) {
+        // Index the entries logged before the search index existed
+        $db->exec("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')");
+    }
+    echo "Full-text index on 'log_message' created successfully!\n";
+} catch (PDOException $e) {
+    echo "Error creating full-text index: " . $e->getMessage() . "\n";
+}
+
+// Per-minute log counts, kept up to date on insert by LogRollup (see /api/logs/stats)
+$rollupSql = "
+CREATE TABLE IF NOT EXISTS log_rollups (
+  minute CHAR(19) NOT NULL,
+  host VARCHAR(100) NOT NULL,
+  host_process VARCHAR(100) NOT NULL DEFAULT '',
+  log_level VARCHAR(20) NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (minute, host, host_process, log_level)
+);
+";
+
+try {
+    $rollupsExisted = $dbConnection === 'sqlite'
+        ? $db->query("SELECT 1 FROM sqlite_master WHERE name = 'log_rollups'")->fetchColumn() !== false
+        : $db->query("SHOW TABLES LIKE 'log_rollups'")->fetchColumn() !== false;
+    $db->exec($rollupSql);
+    if (!$rollupsExisted) {
+        // Count the entries logged before the rollups existed, at the minute LogRollup::minute() gives them
+        $minute = $dbConnection === 'sqlite'
+            ? "SUBSTR(REPLACE(timestamp, 'T', ' '), 1, 16) || ':00'"
+            : "CONCAT(SUBSTR(REPLACE(timestamp, 'T', ' '), 1, 16), ':00')";
+        $db->exec("INSERT INTO log_rollups (minute, host, host_process, log_level, count)
+            SELECT $minute, host, COALESCE(host_process, ''), log_level, COUNT(*) FROM logs
+            GROUP BY 1, 2, 3, 4");
+    }
+    echo "Table 'log_rollups' created successfully!\n";
+} catch (PDOException $e) {
+    echo "Error creating table 'log_rollups': " . $e->getMessage() . "\n";
+}
+
+// Stats filter on these columns over a range of minutes
+$rollupIndexes = [
+    'idx_log_rollups_host_minute' => 'host, minute',
+    'idx_log_rollups_host_process_minute' => 'host_process, minute',
+    'idx_log_rollups_log_level_minute' => 'log_level, minute',
+];
+foreach ($rollupIndexes as $name => $columns) {
+    try {
+        $db->exec("CREATE INDEX {$ifNotExists}$name ON log_rollups ($columns)");
+        echo "Index '$name' created successfully!\n";
+    } catch (PDOException $e) {
+        echo "Error creating index '$name': " . $e->getMessage() . "\n";
+    }
+}
@@ -0,0 +1,28 @@
+<?php
+
+// Retention: delete logs older than LOG_RETENTION_DAYS (default 30) and their
+// per-minute counts older than ROLLUP_RETENTION_DAYS (default 365).
+// Run it daily, e.g. from cron: php database/purge_logs.php [--days=N] [--rollup-days=N]
+
+use App\Models\LogModel;
+use App\Models\LogRollup;
+
+// Also loads .env
+$app = require __DIR__ . '/../app/bootstrap.php';
+$db = $app->getContainer()->get(PDO::class);
+
+$options = getopt('', ['days:', 'rollup-days:']);
+$days = (int) ($options['days'] ?? $_ENV['LOG_RETENTION_DAYS'] ?? 30);
+$rollupDays = (int) ($options['rollup-days'] ?? $_ENV['ROLLUP_RETENTION_DAYS'] ?? 365);
+if ($days < 1 || $rollupDays < 1) {
+    echo "Retention must be at least one day\n";
+    exit(1);
+}
+
+$cutoff = date('Y-m-d H:i:s', strtotime("-$days days"));
+$deleted = LogModel::purgeBefore($db, $cutoff);
+echo "Deleted $deleted logs before $cutoff\n";
+
+$rollupCutoff = date('Y-m-d H:i:s', strtotime("-$rollupDays days"));
+$deleted = LogRollup::purgeBefore($db, $rollupCutoff);
+echo "Deleted $deleted rollup rows before $rollupCutoff\n";
@@ -2,6 +2,7 @@
 
 use PHPUnit\Framework\TestCase;
 use App\Models\LogModel;
+use App\Models\LogRollup;
 
 class LogModelTest extends TestCase
 {
@@ -53,4 +54,167 @@ class LogModelTest extends TestCase
         $this->assertEquals('INFO', $logs[0]['log_level']);
         $this->assertEquals('Test message', $logs[0]['log_message']);
     }
+
+    public function testSaveBatch(): void
+    {
+        $logs = [];
+        foreach (['first', 'second', 'third'] as $message) {
+            $log = new LogModel($this->pdo);
+            $log->host = 'test-server';
+            $log->host_process = 'batch';
+            $log->log_level = 'INFO';
+            $log->log_message = $message;
+            $log->timestamp = date('Y-m-d H:i:s');
+            $logs[] = $log;
+        }
+
+        $results = LogModel::saveBatch($this->pdo, $logs);
+
+        $this->assertCount(3, $results);
+        foreach ($results as $index => $result) {
+            $this->assertArrayHasKey('id', $result);
+            $this->assertGreaterThan(0, $result['id']);
+            $this->assertEquals($logs[$index]->id, $result['id']);
+        }
+        $this->assertLessThan($results[1]['id'], $results[0]['id']);
+        $this->assertFalse($this->pdo->inTransaction());
+    }
+
+    public function testGetLogPageUsesCursor(): void
+    {
+        $host = 'page-test-' . uniqid();
+        $ids = [];
+        foreach (['first', 'second', 'third'] as $message) {
+            $log = new LogModel($this->pdo);
+            $log->host = $host;
+            $log->host_process = 'api';
+            $log->log_level = 'INFO';
+            $log->log_message = $message;
+            $log->timestamp = '2024-01-01 00:00:00';  // Same timestamp: the id breaks the tie
+            $ids[] = $log->save();
+        }
+
+        $page = LogModel::getLogPage($this->pdo, ['host' => $host], 2);
+
+        $this->assertCount(2, $page['logs']);
+        $this->assertEquals($ids[2], $page['logs'][0]['id']);
+        $this->assertEquals($ids[1], $page['logs'][1]['id']);
+        $this->assertNotNull($page['next_cursor']);
+
+        $page = LogModel::getLogPage($this->pdo, ['host' => $host], 2, $page['next_cursor']);
+
+        $this->assertCount(1, $page['logs']);
+        $this->assertEquals($ids[0], $page['logs'][0]['id']);
+        $this->assertNull($page['next_cursor']);
+    }
+
+    public function testDecodeCursorRejectsGarbage(): void
+    {
+        $this->expectException(\InvalidArgumentException::class);
+        LogModel::decodeCursor('not-a-cursor');
+    }
+
+    public function testGetLogsSince(): void
+    {
+        $host = 'since-test-' . uniqid();
+        $ids = [];
+        foreach (['first', 'second', 'third'] as $message) {
+            $log = new LogModel($this->pdo);
+            $log->host = $host;
+            $log->host_process = 'api';
+            $log->log_level = 'INFO';
+            $log->log_message = $message;
+            $log->timestamp = date('Y-m-d H:i:s');
+            $ids[] = $log->save();
+        }
+
+        $logs = LogModel::getLogsSince($this->pdo, $ids[0], ['host' => $host]);
+
+        $this->assertEquals([$ids[1], $ids[2]], array_map('intval', array_column($logs, 'id')));
+        $this->assertSame([], LogModel::getLogsSince($this->pdo, $ids[2], ['host' => $host]));
+    }
+
+    public function testSearchLogs(): void
+    {
+        $host = 'search-test-' . uniqid();
+        $ids = [];
+        foreach (['disk quota exceeded', 'quota check passed', 'disk full, disk quota exceeded', 'all good'] as $message) {
+            $log = new LogModel($this->pdo);
+            $log->host = $host;
+            $log->host_process = 'api';
+            $log->log_level = 'INFO';
+            $log->log_message = $message;
+            $log->timestamp = date('Y-m-d H:i:s');
+            $ids[] = $log->save();
+        }
+
+        $first = LogModel::getLogPage($this->pdo, ['host' => $host], 1, null, 'disk quota');
+
+        $this->assertCount(1, $first['logs']);
+        $this->assertArrayHasKey('score', $first['logs'][0]);
+        $this->assertNotNull($first['next_cursor']);
+
+        $second = LogModel::getLogPage($this->pdo, ['host' => $host], 1, $first['next_cursor'], 'disk quota');
+
+        $this->assertCount(1, $second['logs']);
+        $this->assertNull($second['next_cursor']);
+        $this->assertGreaterThanOrEqual($second['logs'][0]['score'], $first['logs'][0]['score']);
+        // Only the messages with both words match
+        $found = array_map('intval', [$first['logs'][0]['id'], $second['logs'][0]['id']]);
+        sort($found);
+        $this->assertEquals([$ids[0], $ids[2]], $found);
+    }
+
+    public function testRollupsCountInsertedLogs(): void
+    {
+        $host = 'rollup-test-' . uniqid();
+        $logs = [];
+        foreach (['2024-01-01T10:00:05Z', '2024-01-01 10:00:59', '2024-01-01 10:01:00'] as $timestamp) {
+            $log = new LogModel($this->pdo);
+            $log->host = $host;
+            $log->host_process = 'api';
+            $log->log_level = 'ERROR';
+            $log->log_message = 'Rollup test';
+            $log->timestamp = $timestamp;
+            $logs[] = $log;
+        }
+        $logs[0]->save();
+        LogModel::saveBatch($this->pdo, array_slice($logs, 1));
+
+        $minutes = LogRollup::getStats($this->pdo, ['host' => $host], 'minute', ['log_level']);
+
+        $this->assertEquals([
+            ['bucket' => '2024-01-01 10:00:00', 'log_level' => 'ERROR', 'count' => 2],
+            ['bucket' => '2024-01-01 10:01:00', 'log_level' => 'ERROR', 'count' => 1],
+        ], $minutes);
+        $this->assertEquals(
+            [['bucket' => '2024-01-01 10:00:00', 'count' => 3]],
+            LogRollup::getStats($this->pdo, ['host' => $host], 'hour')
+        );
+    }
+
+    public function testPurgeBeforeDeletesInBatches(): void
+    {
+        $host = 'purge-test-' . uniqid();
+        $ids = [];
+        foreach (['1970-01-01 00:00:01', '1970-01-01 00:00:02', '1970-01-01 00:00:03', date('Y-m-d H:i:s')] as $timestamp) {
+            $log = new LogModel($this->pdo);
+            $log->host = $host;
+            $log->host_process = 'api';
+            $log->log_level = 'INFO';
+            $log->log_message = 'Purge test';
+            $log->timestamp = $timestamp;
+            $ids[] = $log->save();
+        }
+
+        $this->assertEquals(3, LogModel::purgeBefore($this->pdo, '1970-01-02 00:00:00', 2));
+
+        $logs = LogModel::getLogPage($this->pdo, ['host' => $host])['logs'];
+        $this->assertEquals([$ids[3]], array_map('intval', array_column($logs, 'id')));
+        // The counts outlive the logs
+        $this->assertEquals(
+            [['bucket' => '1970-01-01 00:00:00', 'count' => 3]],
+            LogRollup::getStats($this->pdo, ['host' => $host, 'timestamp_to' => '1970-01-01 23:59:59'], 'day')
+        );
+    }
 }
@@ -148,6 +148,99 @@ class LogTest extends TestCase
         $this->assertArrayHasKey('id', $response, "Response does not contain 'id' key.");
     }
 
+    public function testAddLogsBatch(): void
+    {
+        // Test the /api/logs/batch endpoint with one valid and one invalid item
+        $url = $this->getUrl('addLogs');
+
+        $data = [
+            [
+                "host" => "test-server",
+                "host_process" => "api",
+                "log_level" => "INFO",
+                "log_message" => "Batched message"
+            ],
+            "not an object",
+        ];
+
+        // Initialize cURL session
+        $ch = curl_init();
+
+        // Set cURL options
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_POST, true);
+        curl_setopt($ch, CURLOPT_POSTFIELDS, json_encode($data));
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+        curl_setopt($ch, CURLOPT_HTTPHEADER, [
+            'Content-Type: application/json',
+            'Content-Length: ' . strlen(json_encode($data))
+        ]);
+
+        // Execute the request
+        $curlOutput = curl_exec($ch);
+
+        // Check for cURL errors
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+
+        // Get HTTP status code
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        $this->assertEquals(200, $httpCode, "Expected HTTP 200 status code");
+
+        // Close cURL session
+        curl_close($ch);
+
+        $response = json_decode($curlOutput, true);
+        $this->assertEquals(1, $response['inserted']);
+        $this->assertEquals(1, $response['failed']);
+        $this->assertArrayHasKey('id', $response['results'][0], "First item should have been inserted.");
+        $this->assertArrayHasKey('error', $response['results'][1], "Second item should have been rejected.");
+    }
+
+    public function testAddLogsBatchMessagePack(): void
+    {
+        // The client's MessagePack batch: two records sharing a context, and one referring to no context
+        if (!function_exists('msgpack_pack')) {
+            $this->markTestSkipped('The msgpack extension is not installed');
+        }
+        $url = $this->getUrl('addLogs');
+
+        $body = msgpack_pack([
+            'version' => 1,
+            'context_fields' => ['host', 'host_process', 'logger_name'],
+            'contexts' => [['test-server', 'api', 'api']],
+            'records' => [
+                [0, 1698400800000000, 'INFO', 'Packed message', 10, ['funcName' => 'handle']],
+                [0, 1698400800500000, 'ERROR', 'Packed failure', 11, []],
+                [5, 1698400801000000, 'INFO', 'No such context', 12, []],
+            ],
+        ]);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_POST, true);
+        curl_setopt($ch, CURLOPT_POSTFIELDS, $body);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+        curl_setopt($ch, CURLOPT_HTTPHEADER, [
+            'Content-Type: application/x-msgpack',
+            'Content-Length: ' . strlen($body)
+        ]);
+        $curlOutput = curl_exec($ch);
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        curl_close($ch);
+
+        $this->assertEquals(200, $httpCode, "Expected HTTP 200 status code");
+        $response = json_decode($curlOutput, true);
+        $this->assertEquals(2, $response['inserted']);
+        $this->assertEquals(1, $response['failed']);
+        $this->assertArrayHasKey('error', $response['results'][2], "Third record should have been rejected.");
+        $this->assertEquals('2023-10-27T10:00:00.500000+00:00', \App\Services\MessagePackBatch::timestamp(1698400800500000));
+    }
+
     public function testGetLogs(): void
     {
         // Test the /logs endpoint, which is a pure GET endpoint
@@ -178,6 +271,107 @@ class LogTest extends TestCase
         $this->assertNotEmpty($curlOutput, "cURL output is empty.");
     }
 
+    public function testGetLogsRejectsInvalidCursor(): void
+    {
+        $url = $this->getUrl('getLogs', [], ['cursor' => 'not-a-cursor']);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+
+        $curlOutput = curl_exec($ch);
+
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        $this->assertEquals(400, $httpCode, "Expected HTTP 400 status code");
+
+        curl_close($ch);
+
+        $response = json_decode($curlOutput, true);
+        $this->assertArrayHasKey('error', $response, "Response does not contain 'error' key.");
+    }
+
+    public function testGetLogsNdjson(): void
+    {
+        $url = $this->getUrl('getLogs', [], ['limit' => 2]);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+        curl_setopt($ch, CURLOPT_HTTPHEADER, ['Accept: application/x-ndjson']);
+
+        $curlOutput = curl_exec($ch);
+
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        $this->assertEquals(200, $httpCode, "Expected HTTP 200 status code");
+        $this->assertStringStartsWith('application/x-ndjson', curl_getinfo($ch, CURLINFO_CONTENT_TYPE));
+
+        curl_close($ch);
+
+        $lines = array_filter(explode("\n", $curlOutput));
+        $this->assertLessThanOrEqual(2, count($lines));
+        foreach ($lines as $line) {
+            $this->assertArrayHasKey('id', json_decode($line, true), "Line is not a log entry.");
+        }
+    }
+
+    public function testGetStats(): void
+    {
+        $url = $this->getUrl('getStats', [], ['bucket' => 'hour', 'group_by' => 'host,log_level']);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+
+        $curlOutput = curl_exec($ch);
+
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        $this->assertEquals(200, $httpCode, "Expected HTTP 200 status code");
+
+        curl_close($ch);
+
+        $stats = json_decode($curlOutput, true);
+        $this->assertIsArray($stats, "Response is not a JSON array.");
+        foreach ($stats as $row) {
+            $this->assertEquals(['bucket', 'host', 'log_level', 'count'], array_keys($row));
+            $this->assertStringEndsWith(':00:00', $row['bucket']);
+        }
+    }
+
+    public function testGetStatsRejectsInvalidBucket(): void
+    {
+        $url = $this->getUrl('getStats', [], ['bucket' => 'week']);
+
+        $ch = curl_init();
+        curl_setopt($ch, CURLOPT_URL, $url);
+        curl_setopt($ch, CURLOPT_RETURNTRANSFER, true);
+
+        $curlOutput = curl_exec($ch);
+
+        if (curl_errno($ch)) {
+            $this->fail('cURL error: ' . curl_error($ch));
+        }
+
+        $httpCode = curl_getinfo($ch, CURLINFO_HTTP_CODE);
+        $this->assertEquals(400, $httpCode, "Expected HTTP 400 status code");
+
+        curl_close($ch);
+
+        $response = json_decode($curlOutput, true);
+        $this->assertArrayHasKey('error', $response, "Response does not contain 'error' key.");
+    }
+
     public function testHealthCheck(): void
     {
         // Test the /api/health endpoint, which is a pure GET endpoint
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Peak memory and throughput of LogAggregatorClient.export() against loading the results by hand.
+
+A local stand-in server (see standin_server.py) serves a fixed number of
+synthetic entries through GET /api/logs. Each mode runs in a fresh process:
+
+- "by_hand": list(client.iter_logs()) then a pyarrow table of the dicts, the
+  conversion done for incident analysis before export() existed,
+- "parquet", "arrow", "csv": client.export() to a temporary file.
+
+Usage:
+    python benchmarks/bench_export.py [--logs N] [--modes by_hand,parquet,...] [--chunk-size C]
+
+Prints a JSON document with, per mode: seconds, entries/sec, peak RSS of the
+process and the size of the file written.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+from log_aggregator_handler import LogAggregatorClient
+
+import standin_server
+from bench_handler import _peak_rss_kb
+
+MODES = ("by_hand", "parquet", "arrow", "csv")
+SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv.gz"}
+
+
+def _serve(conn, logs):
+    server = standin_server.StandinServer(("127.0.0.1", 0), logs=logs)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+def _run_mode(conn, port, mode, chunk_size, page_size):
+    # Runs in a fresh process
+    client = LogAggregatorClient(api_endpoint=f"http://127.0.0.1:{port}/api/logs", page_size=page_size)
+    if mode != "csv":
+        import pyarrow.parquet  # Imported before the baseline, so the growth is the data's
+    baseline_kb = _peak_rss_kb()
+    started = time.perf_counter()
+    size = None
+    if mode == "by_hand":
+        entries = list(client.iter_logs())
+        table = pyarrow.Table.from_pylist(entries)
+        count = table.num_rows
+    else:
+        fd, path = tempfile.mkstemp(suffix=SUFFIXES[mode])
+        os.close(fd)
+        try:
+            count = client.export(path, format=mode, chunk_size=chunk_size)
+            size = os.path.getsize(path)
+        finally:
+            os.remove(path)
+    seconds = time.perf_counter() - started
+    client.close()
+    peak_kb = _peak_rss_kb()
+    conn.send({
+        "entries": count,
+        "seconds": round(seconds, 2),
+        "entries_per_sec": round(count / seconds),
+        "peak_rss_kb": peak_kb,
+        "peak_rss_growth_kb": peak_kb - baseline_kb if peak_kb is not None else None,
+        "file_bytes": size,
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--logs", type=int, default=1000000)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--chunk-size", type=int, default=65536)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    ctx = multiprocessing.get_context("spawn")
+    server_conn, child_conn = ctx.Pipe()
+    server = ctx.Process(target=_serve, args=(child_conn, args.logs), daemon=True)
+    server.start()
+    port = server_conn.recv()
+    results = {
+        "benchmark": "export",
+        "python": platform.python_version(),
+        "logs": args.logs,
+        "chunk_size": args.chunk_size,
+        "modes": {},
+    }
+    try:
+        for mode in modes:
+            result_conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_run_mode, args=(child_conn, port, mode, args.chunk_size, args.page_size))
+            process.start()
+            results["modes"][mode] = result_conn.recv()
+            process.join()
+    finally:
+        server.terminate()
+        server.join()
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
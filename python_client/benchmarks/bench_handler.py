@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+End-to-end cost of logging through LogAggregatorHandler against a local stand-in API.
+
+Each handler configuration runs in its own process against a fresh stand-in
+server process (see standin_server.py), so CPU time and peak memory belong to
+the client alone and outage windows start with each run.
+
+Usage:
+    python benchmarks/bench_handler.py [--records N] [--rate R] [--configs sync,background,...]
+        [--latency S] [--error-rate F] [--outage START:END ...] [--option KEY=JSON ...] [--loggers L]
+        [--exception-every N] [--error-every N]
+
+Prints a JSON document with, per configuration: records/sec until everything was
+flushed, p50/p99/max latency of logger.info() on the calling thread, CPU time per
+record (all client threads), peak RSS, and what the server received, including
+per level how long records took from the logging call to the server (lag_ms).
+
+The "priority" configurations send ERROR records through a lane of their own.
+Against a saturated server (e.g. --latency 0.005 --error-every 100), compare the
+ERROR lag with and without it.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import sys
+import time
+import urllib.request
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler import serializer
+
+import standin_server
+
+CONFIGS = {
+    "sync": {},
+    "background": {"background": True},
+    "deferred": {"background": True, "defer_format": True},
+    "batched": {"batch_size": 100, "batch_linger": 0.05},
+    "batched_gzip": {"batch_size": 100, "batch_linger": 0.05, "compression": "gzip"},
+    "batched_msgpack": {"batch_size": 100, "batch_linger": 0.05, "wire_format": "msgpack"},
+    "workers_2": {"workers": 2},
+    "workers_4": {"workers": 4},
+    "workers_8": {"workers": 8},
+    "batched_workers_4": {"batch_size": 100, "batch_linger": 0.05, "workers": 4},
+    "background_priority": {"background": True, "priority_level": logging.ERROR},
+    "batched_priority": {"batch_size": 100, "batch_linger": 0.05, "priority_level": logging.ERROR},
+}
+
+
+def _serve(conn, latency, error_rate, outages):
+    server = standin_server.StandinServer(("127.0.0.1", 0), latency=latency,
+                                          error_rate=error_rate, outages=outages)
+    conn.send(server.server_address[1])
+    server.serve_forever()
+
+
+def _server_stats(port):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/__stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # bytes on macOS, KiB elsewhere
+
+
+def _fail(depth):
+    # A traceback of a realistic depth for logger.exception()
+    if depth:
+        _fail(depth - 1)
+    raise ValueError("Item not found")
+
+
+def _run_config(conn, port, options, records, rate, logger_count, exception_every, error_every):
+    # Runs in a fresh process
+    handler = LogAggregatorHandler(api_endpoint=f"http://127.0.0.1:{port}/api/logs",
+                                   host="bench-host", flush_timeout=300, **options)
+    # Records go round-robin to the loggers; workers only send different loggers' records in parallel
+    loggers = [logging.getLogger(f"bench.{n}") for n in range(max(1, logger_count))]
+    for logger in loggers:
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+    latencies = []
+    interval = 1.0 / rate if rate else 0.0
+    perf_counter_ns = time.perf_counter_ns
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    for i in range(records):
+        if interval:
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        logger = loggers[i % len(loggers)]
+        if exception_every and i % exception_every == 0:
+            try:
+                _fail(10)
+            except ValueError:
+                call_started = perf_counter_ns()
+                logger.exception("Failed %s", "/api/items", extra={"request_id": i})
+                latencies.append(perf_counter_ns() - call_started)
+            continue
+        if error_every and i % error_every == 0:
+            call_started = perf_counter_ns()
+            logger.error("Failed %s with status %d", "/api/items", 500, extra={"request_id": i})
+            latencies.append(perf_counter_ns() - call_started)
+            continue
+        call_started = perf_counter_ns()
+        logger.info("Handled %s in %.1f ms", "/api/items", 12.5, extra={"request_id": i})
+        latencies.append(perf_counter_ns() - call_started)
+    emitted = time.perf_counter()
+    handler.flush()
+    flushed = time.perf_counter()
+    cpu = time.process_time() - cpu_started
+    for logger in loggers:
+        logger.removeHandler(handler)
+    handler.close()
+
+    latencies.sort()
+    conn.send({
+        "records_per_sec": round(records / (flushed - started)),
+        "emit_seconds": round(emitted - started, 3),
+        "flush_seconds": round(flushed - emitted, 3),
+        "emit_p50_us": round(_percentile(latencies, 0.50) / 1000, 1),
+        "emit_p99_us": round(_percentile(latencies, 0.99) / 1000, 1),
+        "emit_max_us": round(latencies[-1] / 1000, 1),
+        "cpu_us_per_record": round(cpu / records * 1e6, 2),
+        "peak_rss_kb": _peak_rss_kb(),
+        "dropped": handler.stats()["dropped"]["queue_full"],
+        "fallback_dropped": handler.fallback.dropped if handler.fallback is not None else 0,
+    })
+
+
+def run(options, args, ctx):
+    server_conn, child_conn = ctx.Pipe()
+    server = ctx.Process(target=_serve, args=(child_conn, args.latency, args.error_rate, args.outage), daemon=True)
+    server.start()
+    port = server_conn.recv()
+    try:
+        result_conn, child_conn = ctx.Pipe()
+        client = ctx.Process(target=_run_config, args=(child_conn, port, options, args.records, args.rate,
+                                                                 args.loggers, args.exception_every,
+                                                                 args.error_every))
+        client.start()
+        result = result_conn.recv()
+        client.join()
+        result["server"] = _server_stats(port)
+        result["options"] = options
+        return result
+    finally:
+        server.terminate()
+        server.join()
+
+
+def _parse_option(value):
+    key, sep, raw = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected KEY=JSON, got {value!r}")
+    try:
+        return key, json.loads(raw)
+    except ValueError:
+        return key, raw
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=0.0, help="Records per second to log at; 0 logs as fast as possible")
+    parser.add_argument("--configs", default=",".join(CONFIGS),
+                        help="Comma-separated configurations to run (default: %(default)s)")
+    parser.add_argument("--option", type=_parse_option, action="append", default=[],
+                        help="Extra LogAggregatorHandler argument KEY=JSON for every configuration. Repeatable.")
+    parser.add_argument("--loggers", type=int, default=8, help="Number of loggers the records are spread over")
+    parser.add_argument("--exception-every", type=int, default=0,
+                        help="Log every Nth record with logger.exception() and a 12-frame traceback; 0 never")
+    parser.add_argument("--error-every", type=int, default=0,
+                        help="Log every Nth record with logger.error() instead of logger.info(); 0 never")
+    parser.add_argument("--latency", type=float, default=0.0, help="Server seconds added to every POST")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of POSTs answered with 503")
+    parser.add_argument("--outage", type=standin_server.parse_outage, action="append", default=[],
+                        help="START:END seconds into each run during which the server drops connections. Repeatable.")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configuration(s): {', '.join(unknown)}; choose from {', '.join(CONFIGS)}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {
+        "benchmark": "handler",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "orjson": serializer.orjson is not None,
+        "records": args.records,
+        "rate": args.rate,
+        "loggers": args.loggers,
+        "exception_every": args.exception_every,
+        "error_every": args.error_every,
+        "server": {"latency": args.latency, "error_rate": args.error_rate, "outages": args.outage},
+        "configs": {},
+    }
+    for name in names:
+        options = dict(CONFIGS[name], **dict(args.option))
+        results["configs"][name] = run(options, args, ctx)
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
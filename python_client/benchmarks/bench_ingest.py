@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Ingest throughput of the Python reference server (log_aggregator_handler.server).
+
+Each configuration runs a fresh server process on a new SQLite database.
+Client processes post pre-encoded entries (batches to /api/logs/batch, or
+single entries to /api/logs with --batch-size 1) as fast as the server answers
+them. Configurations:
+
+- "per_request": each request inserts its entries in its own transaction, one
+  INSERT per entry, on the request's thread, as the PHP app's LogModel does,
+- "commit": write-behind buffer, answered once committed (the default),
+- "commit_full": the same with synchronous=full, an fsync per commit,
+- "buffer": write-behind buffer, answered once buffered.
+
+Usage:
+    python benchmarks/bench_ingest.py [--records N] [--batch-size B] [--clients C] [--configs commit,buffer,...]
+
+Prints a JSON document with, per configuration: records/sec until everything
+was committed, the server's CPU time per record and share of one core,
+p50/p99 request latency, and commits made.
+"""
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+import requests
+
+from log_aggregator_handler import server
+
+from bench_search import make_rows
+from bench_stats import ROLLUP_SQL
+
+CONFIGS = {
+    "per_request": {"per_request": True},
+    "commit": {"ack": "commit"},
+    "commit_full": {"ack": "commit", "synchronous": "full"},
+    "buffer": {"ack": "buffer"},
+}
+
+
+class PerRequestWriter:
+    """
+    As LogModel::saveBatch(): the entries of a request are inserted in one transaction,
+    one statement each, on the request's thread.
+    """
+    def __init__(self, database: str, synchronous: str = "normal"):
+        self._db = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous.upper()}")
+        server.create_schema(self._db)
+        self._lock = threading.Lock()
+        self.committed = 0
+        self.commits = 0
+        self.error = None
+
+    def submit(self, rows):
+        with self._lock:
+            db = self._db
+            db.execute("BEGIN IMMEDIATE")
+            ids = [db.execute("INSERT INTO logs (host, host_process, log_level, log_message, timestamp)"
+                              " VALUES (?, ?, ?, ?, ?)", row).lastrowid for row in rows]
+            counts = collections.Counter((server.rollup_minute(row[4]), row[0], row[1] or "", row[2]) for row in rows)
+            db.executemany(ROLLUP_SQL, [key + (count,) for key, count in counts.items()])
+            db.execute("COMMIT")
+            self.committed += len(rows)
+            self.commits += 1
+            return ids[0], self.committed
+
+    def wait_committed(self, ticket, timeout=None):
+        return True
+
+    def healthy(self):
+        return True
+
+    def stats(self):
+        return {"buffered": 0, "committed": self.committed, "failed": 0, "commits": self.commits, "error": None}
+
+    def close(self, timeout=None):
+        self._db.close()
+
+
+def make_entries(count: int, second: int, seed: int = 1) -> list:
+    """
+    Entries with the API's fields and realistic messages, timestamped within one second
+    of the epoch second given, as the entries of a busy server's batch are.
+    """
+    prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+    return [{"host": host, "host_process": host_process, "log_level": level, "log_message": message,
+             "timestamp": f"{prefix}.{i * 999999 // max(1, count - 1):06d}+00:00"}
+            for i, (host, host_process, level, message, _) in enumerate(make_rows(count, seed))]
+
+
+def make_bodies(count: int, batch_size: int, client: int) -> list:
+    """
+    Request bodies of a client, one second of entries each: timestamps go up from
+    request to request, as they do on a live server.
+    """
+    start = int(time.time())
+    bodies = []
+    for i in range(count):
+        entries = make_entries(batch_size, start + i, seed=i * 1000 + client)
+        bodies.append(json.dumps(entries[0] if batch_size == 1 else entries).encode("utf-8"))
+    return bodies
+
+
+def _cpu_seconds():
+    if resource is None:
+        return time.process_time()
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _serve(conn, database, options):
+    options = dict(options)
+    if options.pop("per_request", False):
+        options["writer"] = PerRequestWriter(database, options.pop("synchronous", "normal"))
+    ingest = server.IngestServer(("127.0.0.1", 0), database, **options)
+    ingest.start()
+    conn.send(ingest.server_address[1])
+    conn.recv()  # Clients start
+    cpu_started = _cpu_seconds()
+    conn.recv()  # Clients done
+    writer_stats = ingest.writer.stats()
+    ingest.close()  # Commits what is still buffered
+    conn.send({"cpu_seconds": _cpu_seconds() - cpu_started, "writer": writer_stats})
+
+
+def _client(conn, url, batch_size, requests_count, client):
+    bodies = make_bodies(requests_count, batch_size, client)
+    session = requests.Session()
+    headers = {"Content-Type": "application/json"}
+    latencies = []
+    busy = 0
+    conn.send("ready")
+    conn.recv()
+    for body in bodies:
+        while True:
+            started = time.perf_counter()
+            response = session.post(url, data=body, headers=headers)
+            if response.status_code != 503:
+                break
+            busy += 1
+            time.sleep(0.01)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+    conn.send((latencies, busy))
+
+
+def run_config(options, records, batch_size, clients):
+    ctx = multiprocessing.get_context("spawn")
+    directory = tempfile.mkdtemp(prefix="bench-ingest-")
+    try:
+        server_conn, child_conn = ctx.Pipe()
+        server_process = ctx.Process(target=_serve, args=(child_conn, os.path.join(directory, "logs.sqlite"), options))
+        server_process.start()
+        port = server_conn.recv()
+
+        url = f"http://127.0.0.1:{port}/api/logs" + ("/batch" if batch_size > 1 else "")
+        requests_per_client = max(1, records // batch_size // clients)
+
+        client_conns = []
+        processes = []
+        for client in range(clients):
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_client, args=(child_conn, url, batch_size, requests_per_client, client))
+            process.start()
+            client_conns.append(conn)
+            processes.append(process)
+        for conn in client_conns:
+            conn.recv()  # Bodies built
+
+        server_conn.send("start")
+        started = time.perf_counter()
+        for conn in client_conns:
+            conn.send("start")
+        latencies = []
+        busy = 0
+        for conn in client_conns:
+            client_latencies, client_busy = conn.recv()
+            latencies.extend(client_latencies)
+            busy += client_busy
+        answered = time.perf_counter() - started
+        server_conn.send("done")
+        result = server_conn.recv()
+        committed = time.perf_counter() - started
+        for process in processes + [server_process]:
+            process.join()
+
+        total = requests_per_client * clients * batch_size
+        latencies.sort()
+        return {
+            "records": total,
+            "records_per_sec": round(total / committed),
+            "answered_seconds": round(answered, 2),
+            "committed_seconds": round(committed, 2),
+            "server_cpu_us_per_record": round(result["cpu_seconds"] / total * 1e6, 1),
+            "server_cores": round(result["cpu_seconds"] / committed, 2),
+            "request_p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+            "request_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+            "busy_retries": busy,
+            "commits": result["writer"]["commits"],
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=500, help="Entries per request; 1 posts to /api/logs")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes posting concurrently")
+    parser.add_argument("--configs", default=",".join(CONFIGS))
+    args = parser.parse_args(argv)
+    configs = [name.strip() for name in args.configs.split(",") if name.strip()]
+    unknown = set(configs) - set(CONFIGS)
+    if unknown:
+        parser.error(f"unknown configs: {', '.join(sorted(unknown))}")
+    if not 1 <= args.batch_size <= server.MAX_BATCH_SIZE:
+        parser.error(f"--batch-size must be between 1 and {server.MAX_BATCH_SIZE}")
+
+    results = {
+        "benchmark": "ingest",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "batch_size": args.batch_size,
+        "clients": args.clients,
+        "configs": {},
+    }
+    for name in configs:
+        results["configs"][name] = run_config(CONFIGS[name], args.records, args.batch_size, args.clients)
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Overhead of the handler's self-instrumentation, against the cost of format_record.
+
+Usage:
+    python benchmarks/bench_metrics.py [--records N] [--repeat R]
+
+Prints a JSON document with microseconds per record for format_record + encode,
+for the metric updates made per record on that path (the two histogram
+observations and their clock reads), and their ratio net of the loop overhead,
+also for the calling thread alone when a background sender does the encoding.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler.metrics import HandlerMetrics
+
+from bench_serializer import bench, make_records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    handler = LogAggregatorHandler(api_endpoint="http://127.0.0.1:9/api/logs", host="bench-host")
+    serializer = handler._serializer
+    records = make_records(args.records)
+    metrics = HandlerMetrics()
+    perf_counter = time.perf_counter
+
+    def uninstrumented(record):
+        serializer.encode(handler.format_record(record))
+
+    def instrumentation_only(record):
+        started = perf_counter()
+        metrics.emitted(perf_counter() - started)
+        started = perf_counter()
+        metrics.encoded(perf_counter() - started)
+
+    def calling_thread_only(record):
+        # In background mode the encode (and its timing) happens on the sender thread
+        started = perf_counter()
+        metrics.emitted(perf_counter() - started)
+
+    paths = {
+        "empty_call": bench(lambda record: None, records, args.repeat),
+        "format_record+encode": bench(uninstrumented, records, args.repeat),
+        "metric_updates": bench(instrumentation_only, records, args.repeat),
+        "metric_updates_calling_thread": bench(calling_thread_only, records, args.repeat),
+    }
+    handler.close()
+
+    def net(path):
+        # Net of the benchmark loop's own per-call cost
+        return paths[path]["us_per_record"] - paths["empty_call"]["us_per_record"]
+
+    results = {
+        "benchmark": "metrics_overhead",
+        "python": platform.python_version(),
+        "records": args.records,
+        "paths": paths,
+        "overhead_ratio": round(net("metric_updates") / net("format_record+encode"), 3),
+        "overhead_ratio_calling_thread": round(net("metric_updates_calling_thread") / net("format_record+encode"), 3),
+    }
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
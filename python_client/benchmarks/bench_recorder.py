@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Cost of keeping records in the flight recorder, against the cost of format_record.
+
+Usage:
+    python benchmarks/bench_recorder.py [--records N] [--repeat R] [--size S]
+
+Prints a JSON document with microseconds per record for format_record (what
+the calling thread pays per record in background mode), format_record + encode,
+FlightRecorder.record() and emit() of a buffered record, their ratio net of the
+loop overhead, the memory kept alive per buffered record, and the cost per
+record of shipping a full buffer (take() on the calling thread, formatting and
+encoding on the sender thread).
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+import tracemalloc
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler.recorder import FlightRecorder
+
+from bench_serializer import bench, make_records
+
+
+def held_bytes_per_record(size):
+    """
+    Memory kept alive by one full buffer, per record: the records themselves,
+    which would otherwise be freed after emit(), and the buffer.
+    """
+    recorder = FlightRecorder(size, level=logging.WARNING)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = make_records(size)
+    for record in records:
+        recorder.record(record)
+    del records, record
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return round(held / size, 1)
+
+
+def ship_us_per_record(handler, records, size, repeat):
+    """
+    take() of a full buffer, and formatting and encoding what it returns.
+    """
+    recorder = FlightRecorder(size, level=logging.WARNING)
+    best_take = best_format = None
+    for _ in range(repeat):
+        for record in records[:size]:
+            recorder.record(record)
+        started = time.perf_counter()
+        captured, _ = recorder.take(records[0])
+        taken = time.perf_counter()
+        for item in captured:
+            handler._encode(item)
+        formatted = time.perf_counter()
+        best_take = taken - started if best_take is None else min(best_take, taken - started)
+        best_format = formatted - taken if best_format is None else min(best_format, formatted - taken)
+    return {
+        "take_us_per_record": round(best_take / size * 1e6, 3),
+        "format_encode_us_per_record": round(best_format / size * 1e6, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--size", type=int, default=256, help="Records kept per buffer")
+    args = parser.parse_args(argv)
+
+    handler = LogAggregatorHandler(api_endpoint="http://127.0.0.1:9/api/logs", host="bench-host")
+    # The records are INFO; a recorder level of WARNING keeps all of them
+    recording_handler = LogAggregatorHandler(api_endpoint="http://127.0.0.1:9/api/logs", host="bench-host",
+                                             flight_recorder_size=args.size, flight_recorder_level=logging.WARNING)
+    recorder = FlightRecorder(args.size, level=logging.WARNING)
+    records = make_records(args.records)
+
+    paths = {
+        "empty_call": bench(lambda record: None, records, args.repeat),
+        "format_record": bench(handler.format_record, records, args.repeat),
+        "format_record+encode": bench(lambda r: handler._encode(handler.format_record(r)), records, args.repeat),
+        "recorder_record": bench(recorder.record, records, args.repeat),
+        "emit_recorded": bench(recording_handler.emit, records, args.repeat),
+    }
+
+    def net(path):
+        # Net of the benchmark loop's own per-call cost
+        return paths[path]["us_per_record"] - paths["empty_call"]["us_per_record"]
+
+    results = {
+        "benchmark": "flight_recorder",
+        "python": platform.python_version(),
+        "records": args.records,
+        "size": args.size,
+        "paths": paths,
+        "record_ratio": round(net("recorder_record") / net("format_record"), 3),
+        "emit_ratio": round(net("emit_recorded") / net("format_record"), 3),
+        "held_bytes_per_record": held_bytes_per_record(args.size),
+        "ship": ship_us_per_record(handler, records, args.size, args.repeat),
+    }
+    handler.close()
+    recording_handler.close()
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Full-text search over log_message with the server's SQLite FTS5 index, against a LIKE scan.
+
+Builds a database with the schema of php_app/database/create_table.php (the logs
+table, its listing indexes, and the logs_fts table with its triggers), fills it
+with synthetic log messages and times the search query the server runs for
+GET /api/logs?q=... against the LIKE '%word%' scan it replaces.
+
+Usage:
+    python benchmarks/bench_search.py [--rows N] [--repeat R] [--limit L] [--database PATH]
+
+Prints a JSON document with, per query: matching rows, and milliseconds for the
+first page of results and for counting every match, with the index and with
+LIKE; and the cost of keeping the index up to date on insert (rows/sec with and
+without the triggers, and the database size).
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+SCHEMA = """
+CREATE TABLE logs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  host VARCHAR(100) NOT NULL,
+  host_process VARCHAR(100),
+  log_level VARCHAR(20) NOT NULL,
+  log_message TEXT NOT NULL,
+  timestamp DATETIME NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_logs_timestamp ON logs (timestamp);
+CREATE INDEX idx_logs_host_timestamp ON logs (host, timestamp);
+CREATE INDEX idx_logs_host_process_timestamp ON logs (host_process, timestamp);
+CREATE INDEX idx_logs_log_level_timestamp ON logs (log_level, timestamp);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE logs_fts USING fts5(log_message, content='logs', content_rowid='id');
+CREATE TRIGGER logs_ai AFTER INSERT ON logs BEGIN
+    INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+END;
+CREATE TRIGGER logs_ad AFTER DELETE ON logs BEGIN
+    INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+END;
+CREATE TRIGGER logs_au AFTER UPDATE OF log_message ON logs BEGIN
+    INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+    INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+END;
+"""
+
+# The queries LogModel::querySearch() runs, and the LIKE scan they replace
+SEARCH_SQL = ("SELECT logs.*, -bm25(logs_fts) AS score FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid"
+              " WHERE logs_fts MATCH ? ORDER BY score DESC, logs.id ASC LIMIT ?")
+SEARCH_COUNT_SQL = "SELECT COUNT(*) FROM logs_fts WHERE logs_fts MATCH ?"
+LIKE_SQL = "SELECT * FROM logs WHERE {} ORDER BY timestamp DESC, id DESC LIMIT ?"
+LIKE_COUNT_SQL = "SELECT COUNT(*) FROM logs WHERE {}"
+
+TEMPLATES = [
+    "GET /api/{resource}/{id} 200 in {ms}ms",
+    "POST /api/{resource} 201 in {ms}ms",
+    "User {id} logged in from 10.0.{a}.{b}",
+    "Cache miss for {resource}:{id}, loading from database",
+    "Retrying {resource} sync, attempt {attempt}",
+    "Connection to db-{a} timed out after {ms}ms",
+    "Disk usage on /var at {pct}%",
+    "Payment {id} declined: insufficient funds",
+    "Worker {a} finished job {id} in {ms}ms",
+    "Failed to parse {resource} payload: unexpected token at position {ms}",
+]
+RESOURCES = ["users", "orders", "invoices", "sessions", "products", "carts"]
+
+# Common words (about one row in ten, one of them two words) and a rare one (one in a thousand)
+QUERIES = ["timed out", "declined", "invoices", "quota"]
+
+
+def make_rows(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    levels = ["DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR"]
+    for i in range(count):
+        message = rng.choice(TEMPLATES).format(
+            resource=rng.choice(RESOURCES), id=rng.randrange(1000000), ms=rng.randrange(1, 5000),
+            a=rng.randrange(256), b=rng.randrange(256), attempt=rng.randrange(1, 6), pct=rng.randrange(100))
+        if i % 997 == 0:
+            message += " (quota exceeded)"
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1700000000 + i))
+        yield (f"web-{i % 8}", f"app-{i % 3}", rng.choice(levels), message, timestamp)
+
+
+def fill(path: str, rows: int, fts: bool) -> dict:
+    """
+    Create a database at path and insert rows, in batches of 1000 like /api/logs/batch.
+    """
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA + (FTS_SCHEMA if fts else ""))
+    insert = ("INSERT INTO logs (host, host_process, log_level, log_message, timestamp)"
+              " VALUES (?, ?, ?, ?, ?)")
+    batch = []
+    started = time.perf_counter()
+    for row in make_rows(rows):
+        batch.append(row)
+        if len(batch) == 1000:
+            with db:
+                db.executemany(insert, batch)
+            batch = []
+    if batch:
+        with db:
+            db.executemany(insert, batch)
+    seconds = time.perf_counter() - started
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db.close()
+    return {"rows_per_sec": round(rows / seconds), "size_bytes": os.path.getsize(path)}
+
+
+def fts_query(q: str) -> str:
+    # As LogModel::ftsQuery(): every word, taken literally
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+
+def like_clause(q: str):
+    terms = q.split()
+    return " AND ".join("log_message LIKE ?" for _ in terms), [f"%{term}%" for term in terms]
+
+
+def timed(db, sql: str, params, repeat: int):
+    best = None
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = db.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 3), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100, help="Page size, as the limit parameter")
+    parser.add_argument("--database", default=None,
+                        help="Database file to build (default: a temporary file, removed afterwards)")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="bench-search-")
+    path = args.database or os.path.join(directory, "logs.sqlite")
+    plain_path = os.path.join(directory, "logs-plain.sqlite")
+    for stale in (path, plain_path):
+        if os.path.exists(stale):
+            os.remove(stale)
+    try:
+        indexed = fill(path, args.rows, fts=True)
+        plain = fill(plain_path, args.rows, fts=False)
+
+        db = sqlite3.connect(path)
+        queries = {}
+        for q in QUERIES:
+            where, like_params = like_clause(q)
+            fts_page_ms, page = timed(db, SEARCH_SQL, (fts_query(q), args.limit), args.repeat)
+            fts_count_ms, count = timed(db, SEARCH_COUNT_SQL, (fts_query(q),), args.repeat)
+            like_page_ms, _ = timed(db, LIKE_SQL.format(where), like_params + [args.limit], args.repeat)
+            like_count_ms, like_count = timed(db, LIKE_COUNT_SQL.format(where), like_params, args.repeat)
+            queries[q] = {
+                "matches": count[0][0],
+                "like_matches": like_count[0][0],  # LIKE also matches inside words
+                "page_rows": len(page),
+                "fts_page_ms": fts_page_ms,
+                "like_page_ms": like_page_ms,
+                "fts_count_ms": fts_count_ms,
+                "like_count_ms": like_count_ms,
+                "count_speedup": round(like_count_ms / fts_count_ms, 1) if fts_count_ms else None,
+            }
+        db.close()
+    finally:
+        for leftover in (plain_path,) + ((path,) if args.database is None else ()):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(leftover + suffix):
+                    os.remove(leftover + suffix)
+        os.rmdir(directory)
+
+    results = {
+        "benchmark": "search",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "rows": args.rows,
+        "limit": args.limit,
+        "queries": queries,
+        "insert": {
+            "with_fts": indexed,
+            "without_fts": plain,
+            "slowdown": round(plain["rows_per_sec"] / indexed["rows_per_sec"], 2),
+        },
+    }
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
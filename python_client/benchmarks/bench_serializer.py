@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Serializer throughput: the current format_record + encode path against the
+format_record + json.dumps path it replaced, and the MessagePack batch format
+against JSON batches.
+
+Usage:
+    python benchmarks/bench_serializer.py [--records N] [--repeat R] [--batch-size B]
+
+Prints a JSON document with records/sec and microseconds per record for each
+path, and for the batch formats also the bytes per record, raw and gzipped.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import logging
+import platform
+import sys
+import time
+import traceback
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler import serializer
+from log_aggregator_handler import wire
+
+
+def legacy_format_record(handler, record):
+    # format_record as it was before RecordSerializer
+    log_entry = {
+        "timestamp": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(timespec='microseconds'),
+        "level": handler.level_map.get(record.levelno, record.levelname),
+        "message": handler.format(record),
+        "host": handler.host,
+        "host_process": record.name,
+        "logger_name": record.name,
+        "module": record.module,
+        "filename": record.filename,
+        "lineno": record.lineno,
+        "funcName": record.funcName,
+        "process": record.process,
+        "thread": record.thread,
+        "threadName": record.threadName,
+    }
+    if record.exc_info:
+        log_entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+    elif record.exc_text:
+        log_entry["exception"] = record.exc_text
+    extra_attrs = {
+        key: record.__dict__[key]
+        for key in record.__dict__
+        if key not in log_entry and key not in (
+            'args', 'asctime', 'created', 'exc_info', 'exc_text', 'levelno',
+            'levelname', 'message', 'module', 'msecs', 'msg', 'name',
+            'pathname', 'process', 'processName', 'relativeCreated',
+            'stack_info', 'thread', 'threadName', 'filename', 'lineno', 'funcName'
+        )
+    }
+    if extra_attrs:
+        log_entry["extra"] = extra_attrs
+    return log_entry
+
+
+def make_records(count):
+    records = []
+    start = time.time()
+    for i in range(count):
+        record = logging.LogRecord("app.requests", logging.INFO, "/srv/app/views.py", 120,
+                                   "Handled %s in %.1f ms", ("/api/items", 12.5), None, "handle")
+        record.created = start + i * 0.0001
+        if i % 2:
+            record.user_id = i
+            record.route = "/api/items"
+        records.append(record)
+    return records
+
+
+def bench(fn, records, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for record in records:
+            fn(record)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        "records_per_sec": round(len(records) / best),
+        "us_per_record": round(best / len(records) * 1e6, 3),
+    }
+
+
+def bench_batches(encode, join, records, batch_size, repeat):
+    """
+    Encode every record and join them into batches of batch_size, as the sender thread does.
+    """
+    best = None
+    for _ in range(repeat):
+        bodies = []
+        started = time.perf_counter()
+        for start in range(0, len(records), batch_size):
+            bodies.append(join([encode(record) for record in records[start:start + batch_size]]))
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    raw = sum(len(body) for body in bodies)
+    gzipped = sum(len(gzip.compress(body, compresslevel=6)) for body in bodies)
+    return {
+        "records_per_sec": round(len(records) / best),
+        "us_per_record": round(best / len(records) * 1e6, 3),
+        "bytes_per_record": round(raw / len(records), 1),
+        "gzip_bytes_per_record": round(gzipped / len(records), 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args(argv)
+
+    handler = LogAggregatorHandler(api_endpoint="http://127.0.0.1:9/api/logs", host="bench-host")
+    records = make_records(args.records)
+
+    results = {
+        "benchmark": "serializer",
+        "python": platform.python_version(),
+        "orjson": serializer.orjson is not None,
+        "records": args.records,
+        "paths": {
+            "legacy_format_record+json.dumps": bench(
+                lambda r: json.dumps(legacy_format_record(handler, r)).encode("utf-8"), records, args.repeat),
+            "format_record+encode": bench(
+                lambda r: handler._encode(handler.format_record(r)), records, args.repeat),
+            "format_record_only": bench(handler.format_record, records, args.repeat),
+        },
+    }
+    legacy = results["paths"]["legacy_format_record+json.dumps"]["us_per_record"]
+    current = results["paths"]["format_record+encode"]["us_per_record"]
+    results["speedup"] = round(legacy / current, 2)
+
+    results["batches"] = {
+        "batch_size": args.batch_size,
+        "json": bench_batches(lambda r: handler._encode(handler.format_record(r)),
+                              lambda payloads: b"[" + b",".join(payloads) + b"]",
+                              records, args.batch_size, args.repeat),
+    }
+    if wire.msgpack is not None:
+        packer = wire.MsgpackEncoder()
+        results["batches"]["msgpack"] = bench_batches(lambda r: packer.pack(handler.format_record(r)), packer.batch,
+                                                      records, args.batch_size, args.repeat)
+    handler.close()
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Histograms from the server's per-minute rollups against a GROUP BY over the logs, and batched retention.
+
+Builds a SQLite database with the schema of php_app/database/create_table.php,
+inserts synthetic logs in batches the way LogModel::saveBatch() does (adding
+their counts to log_rollups in the same transaction) and times:
+
+- the query behind GET /api/logs/stats against the same histogram computed
+  from the logs table,
+- what the rollups add to ingestion,
+- LogModel::purgeBefore(): the longest a writer has to wait for one batch of
+  the purge, against a single DELETE of the same rows.
+
+Usage:
+    python benchmarks/bench_stats.py [--rows N] [--per-second R] [--repeat R] [--purge-batch B]
+
+Prints a JSON document with the timings in milliseconds and rows/sec.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench_search import SCHEMA, make_rows, timed
+
+ROLLUP_SCHEMA = """
+CREATE TABLE log_rollups (
+  minute CHAR(19) NOT NULL,
+  host VARCHAR(100) NOT NULL,
+  host_process VARCHAR(100) NOT NULL DEFAULT '',
+  log_level VARCHAR(20) NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (minute, host, host_process, log_level)
+);
+CREATE INDEX idx_log_rollups_host_minute ON log_rollups (host, minute);
+CREATE INDEX idx_log_rollups_host_process_minute ON log_rollups (host_process, minute);
+CREATE INDEX idx_log_rollups_log_level_minute ON log_rollups (log_level, minute);
+"""
+
+INSERT_SQL = "INSERT INTO logs (host, host_process, log_level, log_message, timestamp) VALUES (?, ?, ?, ?, ?)"
+ROLLUP_SQL = ("INSERT INTO log_rollups (minute, host, host_process, log_level, count) VALUES (?, ?, ?, ?, ?)"
+              " ON CONFLICT (minute, host, host_process, log_level) DO UPDATE SET count = count + excluded.count")
+
+# Errors per host per hour over a day, as LogRollup::getStats() and from the logs
+STATS_SQL = ("SELECT SUBSTR(minute, 1, 13) AS bucket, host, SUM(count) AS count FROM log_rollups"
+             " WHERE log_level = ? AND minute >= ? AND minute <= ? GROUP BY bucket, host ORDER BY bucket, host")
+RAW_SQL = ("SELECT SUBSTR(timestamp, 1, 13) AS bucket, host, COUNT(*) AS count FROM logs"
+           " WHERE log_level = ? AND timestamp >= ? AND timestamp <= ? GROUP BY bucket, host ORDER BY bucket, host")
+
+
+def fill(path: str, rows: int, per_second: int, rollups: bool) -> int:
+    """
+    Insert rows in batches of 1000; per_second rows share each second of timestamps.
+    Returns rows/sec.
+    """
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA + (ROLLUP_SCHEMA if rollups else ""))
+    start = time.mktime((2024, 1, 1, 0, 0, 0, 0, 0, -1))
+
+    def insert(batch):
+        with db:
+            db.executemany(INSERT_SQL, batch)
+            if rollups:
+                # As LogRollup: one upsert per (minute, host, host_process, level) of the batch
+                counts = {}
+                for host, host_process, level, _, timestamp in batch:
+                    key = (timestamp[:16] + ":00", host, host_process or "", level)
+                    counts[key] = counts.get(key, 0) + 1
+                db.executemany(ROLLUP_SQL, [key + (count,) for key, count in counts.items()])
+
+    batch = []
+    started = time.perf_counter()
+    for i, row in enumerate(make_rows(rows)):
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start + i // per_second))
+        batch.append(row[:4] + (timestamp,))
+        if len(batch) == 1000:
+            insert(batch)
+            batch = []
+    if batch:
+        insert(batch)
+    seconds = time.perf_counter() - started
+    db.close()
+    return round(rows / seconds)
+
+
+def purge(path: str, cutoff: str, batch_size: int) -> dict:
+    """
+    As LogModel::purgeBefore(): batches of ids found through the timestamp index, one transaction each.
+    """
+    db = sqlite3.connect(path)
+    longest = 0.0
+    deleted = 0
+    started = time.perf_counter()
+    while True:
+        ids = [row[0] for row in db.execute(
+            "SELECT id FROM logs WHERE timestamp < ? ORDER BY timestamp LIMIT ?", (cutoff, batch_size))]
+        if not ids:
+            break
+        batch_started = time.perf_counter()
+        with db:
+            db.execute(f"DELETE FROM logs WHERE id IN ({','.join(map(str, ids))})")
+        longest = max(longest, time.perf_counter() - batch_started)
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            break
+    total = time.perf_counter() - started
+    db.close()
+    return {"deleted": deleted, "total_ms": round(total * 1000, 1), "longest_lock_ms": round(longest * 1000, 1)}
+
+
+def purge_at_once(path: str, cutoff: str) -> dict:
+    db = sqlite3.connect(path)
+    started = time.perf_counter()
+    with db:
+        deleted = db.execute("DELETE FROM logs WHERE timestamp < ?", (cutoff,)).rowcount
+    total = time.perf_counter() - started
+    db.close()
+    return {"deleted": deleted, "total_ms": round(total * 1000, 1), "longest_lock_ms": round(total * 1000, 1)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--per-second", type=int, default=100, help="Logs per second of timestamps")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--purge-batch", type=int, default=5000, help="Rows per purge transaction")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix="bench-stats-")
+    path = os.path.join(directory, "logs.sqlite")
+    plain_path = os.path.join(directory, "logs-plain.sqlite")
+    try:
+        with_rollups = fill(path, args.rows, args.per_second, rollups=True)
+        without_rollups = fill(plain_path, args.rows, args.per_second, rollups=False)
+
+        db = sqlite3.connect(path)
+        first, last = db.execute("SELECT MIN(timestamp), MAX(timestamp) FROM logs").fetchone()
+        params = ("ERROR", first, last)
+        rollup_ms, rollup_rows = timed(db, STATS_SQL, params, args.repeat)
+        raw_ms, raw_rows = timed(db, RAW_SQL, params, args.repeat)
+        rollup_table_rows = db.execute("SELECT COUNT(*) FROM log_rollups").fetchone()[0]
+        # Purge the older half
+        cutoff = db.execute("SELECT timestamp FROM logs ORDER BY timestamp LIMIT 1 OFFSET ?",
+                            (args.rows // 2,)).fetchone()[0]
+        db.close()
+
+        batched = purge(path, cutoff, args.purge_batch)
+        at_once = purge_at_once(plain_path, cutoff)
+    finally:
+        for leftover in (path, plain_path):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(leftover + suffix):
+                    os.remove(leftover + suffix)
+        os.rmdir(directory)
+
+    results = {
+        "benchmark": "stats",
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "rows": args.rows,
+        "rollup_rows": rollup_table_rows,
+        "histogram": {
+            "buckets": len(rollup_rows),
+            "same_counts": rollup_rows == raw_rows,
+            "rollups_ms": rollup_ms,
+            "logs_ms": raw_ms,
+            "speedup": round(raw_ms / rollup_ms, 1) if rollup_ms else None,
+        },
+        "insert": {
+            "with_rollups_rows_per_sec": with_rollups,
+            "without_rollups_rows_per_sec": without_rollups,
+            "slowdown": round(without_rollups / with_rollups, 2),
+        },
+        "purge": {"batched": batched, "single_delete": at_once},
+    }
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the log aggregation API, for benchmarks.
+
+Serves POST /api/logs, POST /api/logs/batch (JSON array, NDJSON or MessagePack,
+optionally gzip/zstd encoded) and GET /api/health with the same status codes as the PHP
+app, and stores nothing. Latency, error rate and outage windows are configurable.
+GET /__stats returns what has been received so far, including per level the lag
+between a record's timestamp and its arrival. GET /api/logs pages through
+a fixed number of synthetic entries, newest first, with the X-Next-Cursor header.
+
+Usage:
+    python benchmarks/standin_server.py [--port P] [--latency S] [--error-rate F] [--outage START:END ...]
+        [--logs N]
+"""
+import argparse
+import datetime
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack batches are then answered with 415, as by a server without the extension
+    msgpack = None
+
+
+def parse_outage(value: str):
+    start, sep, end = value.partition(":")
+    try:
+        start, end = float(start), float(end)
+    except ValueError:
+        start = end = None
+    if not sep or start is None or end <= start:
+        raise argparse.ArgumentTypeError(f"expected START:END in seconds, got {value!r}")
+    return start, end
+
+
+class StandinServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, error_rate: float = 0.0, outages=(), logs: int = 0):
+        """
+        :param address: (host, port) to listen on; port 0 picks a free port.
+        :param latency: Seconds added to every POST.
+        :param error_rate: Fraction of POSTs answered with 503.
+        :param outages: (start, end) windows in seconds since the server started, during
+                        which connections are closed without an answer.
+        """
+        super().__init__(address, _RequestHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.outages = list(outages)
+        self.logs = logs
+        self.started = time.monotonic()
+        self.stats = {"requests": 0, "records": 0, "bytes": 0, "errors": 0, "outage_drops": 0}
+        self.lags = {}  # level -> seconds between the timestamp of each record and its arrival
+        self._lock = threading.Lock()
+
+    def in_outage(self) -> bool:
+        elapsed = time.monotonic() - self.started
+        return any(start <= elapsed < end for start, end in self.outages)
+
+    def count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def record_lags(self, levels_and_timestamps):
+        """
+        Note the lag of arrived records, given their (level, timestamp); a timestamp
+        is an ISO 8601 string or, from MessagePack batches, epoch microseconds.
+        """
+        now = time.time()
+        lags = []
+        for level, timestamp in levels_and_timestamps:
+            try:
+                if isinstance(timestamp, int):
+                    sent = timestamp / 1e6
+                else:
+                    sent = datetime.datetime.fromisoformat(timestamp).timestamp()
+            except (TypeError, ValueError):
+                continue
+            lags.append((level, now - sent))
+        with self._lock:
+            for level, lag in lags:
+                self.lags.setdefault(level, []).append(lag)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            lags = {level: sorted(values) for level, values in self.lags.items()}
+        stats["lag_ms"] = {level: {
+            "count": len(values),
+            "p50": round(values[len(values) // 2] * 1000, 1),
+            "p99": round(values[min(len(values) - 1, int(len(values) * 0.99))] * 1000, 1),
+            "max": round(values[-1] * 1000, 1),
+        } for level, values in lags.items()}
+        return stats
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real server behind a web server
+    # Send headers and body in one segment; separate writes stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply_logs(self):
+        # Ids run from server.logs down to 1; the cursor is the last id of the previous page
+        query = parse_qs(urlparse(self.path).query)
+        limit = max(1, min(int(query.get("limit", ["100"])[0]), 1000))
+        first = int(query["cursor"][0]) - 1 if "cursor" in query else self.server.logs
+        ids = range(first, max(0, first - limit), -1)
+        entries = [{
+            "id": i,
+            "host": f"web-{i % 16}",
+            "host_process": f"worker-{i % 4}" if i % 7 else None,
+            "log_level": ("DEBUG", "INFO", "INFO", "INFO", "WARNING", "ERROR")[i % 6],
+            "log_message": f"Handled GET /api/items/{i} in {i % 997 / 10:.1f} ms for user {i * 7919 % 100000}",
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1700000000 + i)),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1700000000 + i)),
+        } for i in ids]
+        data = json.dumps(entries).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if ids and ids[-1] > 1:
+            self.send_header("X-Next-Cursor", str(ids[-1]))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] == "/api/logs":
+            self._reply_logs()
+        elif self.path == "/__stats":
+            self._reply(200, self.server.snapshot())
+        elif self.path == "/api/health":
+            if self.server.in_outage():
+                self.close_connection = True
+                return
+            self._reply(200, {"status": "OK"})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        server = self.server
+        if server.in_outage():
+            server.count(outage_drops=1)
+            self.close_connection = True
+            return
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            server.count(errors=1)
+            self._reply(503, {"error": "Service Unavailable"})
+            return
+
+        encoding = (self.headers.get("Content-Encoding") or "identity").lower()
+        try:
+            if encoding in ("gzip", "x-gzip"):
+                body = gzip.decompress(body)
+            elif encoding == "zstd" and zstandard is not None:
+                body = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+            elif encoding != "identity":
+                self._reply(415, {"error": f"Unsupported Content-Encoding: {encoding}"})
+                return
+        except Exception as e:
+            self._reply(400, {"error": str(e)})
+            return
+
+        path = self.path.split("?", 1)[0]
+        if path == "/api/logs":
+            server.count(requests=1, records=1, bytes=len(body))
+            try:
+                entry = json.loads(body)
+                server.record_lags([(entry.get("level"), entry.get("timestamp"))])
+            except (ValueError, AttributeError):
+                pass
+            self._reply(201, {"id": 1})
+        elif path == "/api/logs/batch":
+            content_type = self.headers.get("Content-Type") or ""
+            try:
+                if content_type.startswith("application/x-ndjson"):
+                    entries = [json.loads(line) for line in body.splitlines() if line.strip()]
+                elif content_type.startswith("application/x-msgpack"):
+                    if msgpack is None:
+                        self._reply(415, {"error": f"Unsupported Content-Type: {content_type}"})
+                        return
+                    # Records are [context index, timestamp, level, ...]
+                    entries = [{"timestamp": record[1], "level": record[2]}
+                               for record in msgpack.unpackb(body)["records"]]
+                else:
+                    entries = json.loads(body)
+            except ValueError:
+                self._reply(400, {"error": "Invalid JSON"})
+                return
+            count = len(entries)
+            server.count(requests=1, records=count, bytes=len(body))
+            server.record_lags([(entry.get("level"), entry.get("timestamp"))
+                                for entry in entries if isinstance(entry, dict)])
+            self._reply(200, {"inserted": count, "failed": 0, "results": [{"id": 1}] * count})
+        else:
+            self._reply(404, {"error": "Not found"})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every POST")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of POSTs answered with 503")
+    parser.add_argument("--outage", type=parse_outage, action="append", default=[],
+                        help="START:END seconds after start during which connections are dropped. Repeatable.")
+    parser.add_argument("--logs", type=int, default=0, help="Synthetic entries served by GET /api/logs")
+    args = parser.parse_args(argv)
+
+    server = StandinServer((args.host, args.port), latency=args.latency,
+                           error_rate=args.error_rate, outages=args.outage, logs=args.logs)
+    print(f"Stand-in API on http://{args.host}:{server.server_address[1]}/api/logs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
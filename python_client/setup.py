@@ -31,9 +31,35 @@ setuptools.setup(
         "python-dotenv>=1.0.0",
     ],
     extras_require={
+        "async": [ # Optional asyncio handler
+            "aiohttp>=3.8",
+        ],
+        "orjson": [ # Optional faster JSON encoding
+            "orjson>=3.6",
+        ],
+        "zstd": [ # Optional zstd request compression
+            "zstandard>=0.20",
+        ],
+        "export": [ # Optional Parquet and Arrow export
+            "pyarrow>=10",
+        ],
+        "msgpack": [ # Optional MessagePack batches
+            "msgpack>=1.0",
+        ],
         "dev": [ # Optional dependencies for development/testing
             "pytest>=6.0",
             "requests-mock>=1.8",
+            "aiohttp>=3.8",
+        ],
+    },
+    entry_points={
+        "console_scripts": [
+            # Local forwarding agent for multi-process hosts
+            "log-aggregator-agent=log_aggregator_handler.agent:main",
+            # Live tail of the API
+            "log-aggregator-tail=log_aggregator_handler.tail:main",
+            # Reference ingest server writing to SQLite
+            "log-aggregator-server=log_aggregator_handler.server:main",
         ],
     },
     project_urls={ # Optional: Links for documentation, issue tracker etc.
@@ -9,6 +9,12 @@ __version__ = "0.1.0"
 # Import the main handler class to make it available directly from the package
 # e.g., from log_aggregator_handler import LogAggregatorHandler
 from .handler import LogAggregatorHandler
+# asyncio variant; needs the optional aiohttp dependency when instantiated
+from .async_handler import AsyncLogAggregatorHandler
+# Lightweight handler writing to a local log-aggregator-agent
+from .agent import AgentHandler
+# Reads logs back from the API
+from .client import LogAggregatorClient
 
 # Define what symbols are exported when using 'from log_aggregator_handler import *'
-__all__ = ['LogAggregatorHandler']
+__all__ = ['LogAggregatorHandler', 'AsyncLogAggregatorHandler', 'AgentHandler', 'LogAggregatorClient']
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Local forwarding agent for hosts running many worker processes.
+
+Workers log through AgentHandler, which writes encoded records to the agent
+over a Unix domain socket (or localhost UDP) and has no HTTP stack. The agent
+batches the records of the whole host and ships them through a single
+LogAggregatorHandler, i.e. one connection pool and one retry/circuit state.
+
+Run the agent with the ``log-aggregator-agent`` command.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import threading
+import time
+import weakref
+
+from .handler import LogAggregatorHandler, DEFAULT_LEVEL_MAP
+from .serializer import RecordSerializer
+from .session import parse_header
+
+DEFAULT_AGENT_ADDRESS = "unix:/tmp/log-aggregator-agent.sock"
+
+# Stream frames: a 4-byte big-endian length followed by the encoded record.
+# Datagrams carry one encoded record each, without a header.
+FRAME_HEADER = struct.Struct(">I")
+# Larger frames are treated as a corrupt stream
+MAX_RECORD_BYTES = 16 * 1024 * 1024
+MAX_DATAGRAM_BYTES = 65507
+
+
+def parse_address(address: str):
+    """
+    Parse an agent address: "unix:/path/to.sock", "udp:host:port" or a plain socket path.
+
+    :return: (socket family, socket type, address for bind/connect)
+    """
+    if address.startswith("udp:"):
+        host, _, port = address[len("udp:"):].rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"Invalid UDP agent address {address!r}, expected udp:host:port")
+        return socket.AF_INET, socket.SOCK_DGRAM, (host, int(port))
+    if address.startswith("unix:"):
+        address = address[len("unix:"):]
+    if not address:
+        raise ValueError("Agent socket path must not be empty")
+    return socket.AF_UNIX, socket.SOCK_STREAM, address
+
+
+class _StreamRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        agent = self.server.agent
+        key = id(self)  # Keeps the records of one connection, i.e. one process, in order
+        while True:
+            header = self.rfile.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            (length,) = FRAME_HEADER.unpack(header)
+            if length > MAX_RECORD_BYTES:
+                agent.report(f"Dropping connection sending a {length} byte frame")
+                return
+            payload = self.rfile.read(length)
+            if len(payload) < length:
+                return
+            agent.forward(payload, key)
+
+
+class _DatagramRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.agent.forward(self.request[0], self.client_address)
+
+
+class _UnixStreamServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _UDPServer(socketserver.UDPServer):
+    max_packet_size = 65535
+
+
+class LogAgent:
+    """
+    Receives encoded records from local processes and ships them for the whole host.
+    """
+    def __init__(self, listen: str = DEFAULT_AGENT_ADDRESS, handler: LogAggregatorHandler = None, **handler_options):
+        """
+        :param listen: Address to listen on: "unix:/path/to.sock" or "udp:127.0.0.1:port".
+                       A file left at the socket path is replaced only if it is a socket.
+        :param handler: Handler that ships the records. Defaults to a LogAggregatorHandler
+                        built from handler_options, batching 500 records per request.
+        :param handler_options: LogAggregatorHandler arguments, used if handler is None.
+        """
+        family, sock_type, address = parse_address(listen)
+        if family == socket.AF_UNIX:
+            try:
+                mode = os.lstat(address).st_mode
+            except FileNotFoundError:
+                pass
+            else:
+                if not stat.S_ISSOCK(mode):
+                    raise FileExistsError(f"{address} exists and is not a socket")
+                os.remove(address)  # Stale socket of a previous agent
+        if handler is None:
+            handler_options.setdefault("batch_size", 500)
+            handler_options.setdefault("queue_size", 10000)
+            handler_options.setdefault("background", True)
+            handler = LogAggregatorHandler(**handler_options)
+        self.handler = handler
+        self.listen = listen
+        self.received = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if family == socket.AF_UNIX:
+            self._socket_path = address
+            self._server = _UnixStreamServer(address, _StreamRequestHandler)
+        else:
+            self._socket_path = None
+            self._server = _UDPServer(address, _DatagramRequestHandler)
+        self._server.agent = self
+
+    def forward(self, payload: bytes, key=None):
+        """
+        Hand one encoded record to the shipping handler.
+
+        :param key: Identifies the sending process; its records are sent in order.
+        """
+        with self._lock:
+            self.received += 1
+        try:
+            self.handler.forward(payload, key)
+        except Exception as e:
+            self.report(f"Failed to forward record: {e}")
+
+    def report(self, message: str):
+        self.handler.handleError(None, message)
+
+    def serve_forever(self):
+        """
+        Serve until shutdown() is called from another thread.
+        """
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serve on a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="LogAggregatorAgent", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        self.handler.flush()
+
+    def shutdown(self):
+        """
+        Stop serving. Safe to call from any thread but the one running serve_forever().
+        """
+        self._server.shutdown()
+
+    def close(self):
+        """
+        Stop listening and ship what is queued (up to the handler's flush_timeout).
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        if self._socket_path is not None:
+            try:
+                os.remove(self._socket_path)
+            except FileNotFoundError:
+                pass
+        self.handler.close()
+
+
+class AgentHandler(logging.Handler):
+    """
+    A lightweight logging handler that writes records to a local LogAgent.
+
+    Records are formatted like LogAggregatorHandler formats them, then written
+    to the agent's socket; there is no HTTP session, queue or retry logic in the
+    process. The socket is reopened in forked children (e.g. gunicorn or
+    multiprocessing workers) on their first record, and after the agent restarts.
+    Records logged while the agent is unreachable are dropped and counted.
+    """
+    def __init__(self, agent_address: str = DEFAULT_AGENT_ADDRESS,
+                 host: str = None,
+                 level_map: dict = None,
+                 timeout: float = 1.0,
+                 reconnect_delay: float = 1.0):
+        """
+        :param agent_address: Address the agent listens on: "unix:/path/to.sock" or
+                              "udp:127.0.0.1:port". Defaults to "unix:/tmp/log-aggregator-agent.sock".
+        :param host: Custom identifier for the host machine. Defaults to socket.gethostname().
+        :param level_map: Custom mapping from Python log level numbers to API level strings.
+        :param timeout: Max seconds a write to the agent may block. Defaults to 1.0.
+        :param reconnect_delay: Seconds to wait before reconnecting after the agent could
+                                not be reached. Defaults to 1.0.
+        """
+        super().__init__()
+        self.agent_address = agent_address
+        self._family, self._type, self._address = parse_address(agent_address)
+        self.host = host or socket.gethostname()
+        self.level_map = level_map or DEFAULT_LEVEL_MAP
+        self._serializer = RecordSerializer(self.host, self.level_map)
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.dropped = 0
+
+        self._sock = None
+        self._pid = os.getpid()
+        self._reconnect_at = 0.0
+        if hasattr(os, "register_at_fork"):
+            # A weak reference, so the hook does not keep closed handlers alive
+            handler_ref = weakref.ref(self)
+
+            def after_fork_in_child():
+                handler = handler_ref()
+                if handler is not None:
+                    handler._reset_after_fork()
+
+            os.register_at_fork(after_in_child=after_fork_in_child)
+
+    def format_record(self, record: logging.LogRecord) -> dict:
+        """
+        Format the log record into a dictionary suitable for JSON serialization.
+        """
+        return self._serializer.to_dict(record, self.format(record))
+
+    def emit(self, record: logging.LogRecord):
+        """
+        Format the record and write it to the agent.
+        """
+        try:
+            payload = self._serializer.encode(self.format_record(record))
+            if self._type == socket.SOCK_DGRAM:
+                if len(payload) > MAX_DATAGRAM_BYTES:
+                    self.dropped += 1
+                    self.handleError(None, f"Dropping a {len(payload)} byte record, too large for a UDP agent")
+                    return
+                data = payload
+            else:
+                data = FRAME_HEADER.pack(len(payload)) + payload
+            self._send(data)
+        except Exception:
+            self.handleError(record)
+
+    def _send(self, data: bytes):
+        if self._pid != os.getpid():
+            self._reset_after_fork()  # Forked without register_at_fork
+        for attempt in range(2):
+            sock = self._sock or self._connect()
+            if sock is None:
+                break
+            try:
+                sock.sendall(data)
+                return
+            except OSError as e:
+                # Agent restarted or gone: reconnect once, then give up on this record
+                self._close_socket()
+                if attempt:
+                    self.handleError(None, f"Lost connection to agent at {self.agent_address}: {e}")
+                    self._reconnect_at = time.monotonic() + self.reconnect_delay
+        self.dropped += 1
+
+    def _connect(self):
+        if time.monotonic() < self._reconnect_at:
+            return None
+        sock = socket.socket(self._family, self._type)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self._address)
+        except OSError as e:
+            sock.close()
+            self._reconnect_at = time.monotonic() + self.reconnect_delay
+            self.handleError(None, f"Cannot connect to agent at {self.agent_address}: {e}")
+            return None
+        self._sock = sock
+        return sock
+
+    def _close_socket(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def _reset_after_fork(self):
+        # The parent's socket must not be shared: close the child's copy and reconnect lazily
+        self._close_socket()
+        self._pid = os.getpid()
+        self._reconnect_at = 0.0
+
+    def handleError(self, record, message=None):
+        """
+        Handle errors during logging, like logging.Handler.handleError, or report
+        message without a traceback if there is no record.
+        """
+        if record is not None or not message:
+            super().handleError(record)
+        elif logging.raiseExceptions:
+            print(f"--- Logging error ---\n{message}\nHandler: {self.__class__.__name__}\n---------------------\n",
+                  file=sys.stderr)
+
+    def close(self):
+        """
+        Close the connection to the agent.
+        """
+        self.acquire()
+        try:
+            self._close_socket()
+        finally:
+            self.release()
+        super().close()
+
+
+def main(argv=None):
+    """
+    Entry point of the log-aggregator-agent command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="log-aggregator-agent",
+        description="Receive log records from local processes and ship them to the log aggregation API.",
+    )
+    parser.add_argument("--listen", default=os.environ.get("LOG_AGGREGATOR_AGENT_ADDRESS", DEFAULT_AGENT_ADDRESS),
+                        help="unix:/path/to.sock or udp:127.0.0.1:PORT (default: %(default)s)")
+    parser.add_argument("--api-endpoint", default=None,
+                        help="Logs endpoint URL (default: $LOG_AGGREGATOR_API_ENDPOINT)")
+    parser.add_argument("--header", action="append", type=parse_header, default=[],
+                        help="Request header 'Name: value' sent to the API, e.g. for authentication. Repeatable.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--batch-linger", type=float, default=0.5)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--compression", choices=("gzip", "zstd"), default=None)
+    parser.add_argument("--spool-dir", default=None, help="Disk spool directory for outages")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Request timeout in seconds")
+    args = parser.parse_args(argv)
+
+    handler = LogAggregatorHandler(
+        api_endpoint=args.api_endpoint,
+        auth=dict(args.header) or None,
+        timeout=args.timeout,
+        background=True,
+        batch_size=args.batch_size,
+        batch_linger=args.batch_linger,
+        queue_size=args.queue_size,
+        compression=args.compression,
+        spool_dir=args.spool_dir,
+    )
+    agent = LogAgent(args.listen, handler=handler)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on its thread
+        threading.Thread(target=agent.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"log-aggregator-agent listening on {args.listen}, shipping to {handler.api_endpoint}", file=sys.stderr)
+    try:
+        agent.serve_forever()
+    finally:
+        agent.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import collections
+import json
+import logging
+import threading
+import time
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is optional, only needed for AsyncLogAggregatorHandler
+    aiohttp = None
+
+from .circuit import backoff_delay
+from .handler import LogAggregatorHandler, BATCH_UNSUPPORTED_STATUSES, health_url_for
+from .sender import OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST
+
+
+class AsyncLogAggregatorHandler(LogAggregatorHandler):
+    """
+    A logging handler for asyncio applications.
+
+    emit() only appends the formatted record to a bounded buffer; a background
+    task on the event loop ships the buffer in batches through a pooled
+    aiohttp session, so logging never blocks the loop on the network. Records
+    logged before an event loop is running are buffered and shipped once the
+    handler is started (explicitly with start(), or by the first emit() made
+    from inside a running loop).
+
+    Use ``await handler.aflush()`` and ``await handler.aclose()`` for a graceful
+    shutdown; the synchronous flush() cannot wait on the event loop.
+    """
+    def __init__(self, api_endpoint: str = None,
+                 host: str = None,
+                 auth=None,
+                 timeout: float = 5.0,
+                 retry_attempts: int = 3,
+                 retry_delay: float = 1.0,
+                 verify_ssl: bool = True,
+                 level_map: dict = None,
+                 queue_size: int = 1000,
+                 overflow_policy: str = OVERFLOW_DROP_NEWEST,
+                 batch_size: int = 100,
+                 batch_max_bytes: int = 1048576,
+                 batch_linger: float = 0.5,
+                 batch_endpoint: str = None,
+                 compression: str = None,
+                 connection_limit: int = 4,
+                 rate_limit: float = None,
+                 rate_burst: int = None,
+                 sample_rates: dict = None,
+                 collapse_window: float = None):
+        """
+        Initialize the handler.
+
+        Takes the same connection, auth, formatting and suppression options as LogAggregatorHandler.
+
+        :param queue_size: Maximum number of buffered records. Defaults to 1000.
+        :param overflow_policy: "drop_newest" or "drop_oldest" ("block" would stall the
+                                event loop). Defaults to "drop_newest".
+        :param batch_size: Maximum records per request. 1 sends each record to
+                           api_endpoint on its own. Defaults to 100.
+        :param batch_max_bytes: Maximum encoded size of a batch in bytes. Defaults to 1 MiB.
+        :param batch_linger: Max seconds a partial batch waits for more records. Defaults to 0.5.
+        :param batch_endpoint: URL of the batch endpoint. Defaults to api_endpoint + '/batch'.
+        :param compression: Compress request bodies with "gzip" or "zstd". Defaults to None.
+        :param connection_limit: Maximum pooled connections to the API. Defaults to 4.
+        """
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncLogAggregatorHandler requires aiohttp. Install it with: pip install log-aggregator-handler[async]"
+            )
+        if overflow_policy not in (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST):
+            raise ValueError(
+                f"overflow_policy must be one of {OVERFLOW_DROP_NEWEST}, {OVERFLOW_DROP_OLDEST}, got {overflow_policy!r}"
+            )
+
+        super().__init__(api_endpoint=api_endpoint, host=host, auth=auth, timeout=timeout,
+                         retry_attempts=retry_attempts, retry_delay=retry_delay, verify_ssl=verify_ssl,
+                         level_map=level_map, batch_endpoint=batch_endpoint, compression=compression,
+                         circuit_failure_threshold=0, rate_limit=rate_limit, rate_burst=rate_burst,
+                         sample_rates=sample_rates, collapse_window=collapse_window)
+        # The parent only batches through its own sender thread; batch here instead
+        self.batch_size = max(1, batch_size)
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_linger = max(0.0, batch_linger)
+        self.queue_size = max(1, queue_size)
+        self.overflow_policy = overflow_policy
+        self.connection_limit = connection_limit
+        self.dropped = 0
+
+        self._buffer = collections.deque()
+        self._buffer_lock = threading.Lock()
+        self._in_flight = 0
+        self._loop = None
+        self._task = None
+        self._client = None
+        self._wakeup = None
+        self._send_now = None
+        self._idle = None
+        self._closing = False
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """
+        Start the background sending task on the given (or the running) event loop.
+        """
+        if self._task is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._send_now = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+        self._wake()
+
+    def _emit(self, record: logging.LogRecord):
+        """
+        Format the record and buffer it for the background task.
+        """
+        try:
+            started = time.perf_counter()
+            log_data = self.format_record(record)
+            self.metrics.emitted(time.perf_counter() - started)
+            payload = self._encode(log_data)
+            with self._buffer_lock:
+                if len(self._buffer) >= self.queue_size:
+                    self.dropped += 1
+                    if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                        return
+                    self._buffer.popleft()
+                self._buffer.append(payload)
+                full = len(self._buffer) >= self.batch_size
+
+            if self._task is None:
+                try:
+                    self.start()
+                except RuntimeError:
+                    return  # No running loop yet; shipped once the handler is started
+            self._wake(send_now=full)
+        except Exception:
+            self.handleError(record)
+
+    def _wake(self, send_now: bool = False):
+        # Event objects are not thread-safe: set them from the loop's own thread
+        def wake():
+            self._idle.clear()
+            if send_now:
+                self._send_now.set()
+            self._wakeup.set()
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            wake()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(wake)
+
+    async def _run(self):
+        # aiohttp before 3.9 skips certificate checks for ssl=True; None is its verifying default
+        connector = aiohttp.TCPConnector(limit=self.connection_limit, ssl=None if self.verify_ssl else False)
+        client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as client:
+            self._client = client
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                if self.batch_size > 1 and not self._closing and len(self._buffer) < self.batch_size:
+                    try:
+                        await asyncio.wait_for(self._send_now.wait(), self.batch_linger)
+                    except asyncio.TimeoutError:
+                        pass
+                self._send_now.clear()
+
+                while True:
+                    batch = self._take_batch()
+                    if not batch:
+                        break
+                    self._in_flight = len(batch)
+                    try:
+                        if self.batch_size > 1:
+                            await self._asend_batch(batch)
+                        else:
+                            await self._asend_each(batch)
+                    except Exception as e:
+                        self.handleError(None, f"Background sender failed: {e}")
+                    finally:
+                        self._in_flight = 0
+
+                self._idle.set()
+                if self._closing:
+                    return
+
+    def _take_batch(self) -> list:
+        batch = []
+        batch_bytes = 0
+        with self._buffer_lock:
+            while self._buffer and len(batch) < self.batch_size:
+                payload = self._buffer[0]
+                if batch and self.batch_max_bytes and batch_bytes + len(payload) > self.batch_max_bytes:
+                    break
+                batch.append(self._buffer.popleft())
+                batch_bytes += len(payload)
+        return batch
+
+    async def _asend_batch(self, payloads: list):
+        """
+        Send encoded records to the batch endpoint, falling back to single posts
+        if the server has no batch endpoint.
+        """
+        if self._batch_supported:
+            if self._compress is not None:
+                body = b"\n".join(payloads) + b"\n"
+                content_type = 'application/x-ndjson'
+            else:
+                body = b"[" + b",".join(payloads) + b"]"
+                content_type = 'application/json'
+            status, result = await self._apost(self.batch_endpoint, body, content_type=content_type,
+                                               passthrough_statuses=BATCH_UNSUPPORTED_STATUSES)
+            if status is None:
+                self.metrics.records(failed=len(payloads))
+                return
+            if status not in BATCH_UNSUPPORTED_STATUSES:
+                rejected = self._check_batch_result(result, len(payloads)) if 200 <= status < 300 else len(payloads)
+                self.metrics.records(sent=len(payloads) - rejected, rejected=rejected)
+                return
+            # Older server without /api/logs/batch: switch to single posts for good
+            self._batch_supported = False
+
+        await self._asend_each(payloads)
+
+    async def _asend_each(self, payloads: list):
+        """
+        Send encoded records one request each.
+        """
+        sent = rejected = failed = 0
+        for payload in payloads:
+            status, _ = await self._apost(self.api_endpoint, payload)
+            if status is None:
+                failed += 1
+            elif status < 300:
+                sent += 1
+            else:
+                rejected += 1
+        self.metrics.records(sent=sent, rejected=rejected, failed=failed)
+
+    def _async_request_auth(self):
+        """
+        Resolve the headers and aiohttp basic auth to use for a request.
+        """
+        headers = {}
+        auth = None
+        auth_option = self.auth
+        if callable(auth_option):
+            auth_option = auth_option()
+        if isinstance(auth_option, dict):
+            headers.update(auth_option)
+        elif isinstance(auth_option, tuple) and len(auth_option) == 2:
+            auth = aiohttp.BasicAuth(*auth_option)
+        return headers, auth
+
+    async def _apost(self, url: str, body: bytes, content_type: str = 'application/json', passthrough_statuses=()):
+        """
+        POST an encoded body, compressed if configured, with retry logic.
+
+        :return: (status, parsed JSON body or None) once the server has answered for
+                 good, (None, None) if the request failed.
+        """
+        compress = self._compress
+        if compress is None:
+            return await self._apost_with_retry(url, body, {'Content-Type': content_type}, passthrough_statuses)
+
+        headers = {'Content-Type': content_type, 'Content-Encoding': self._content_encoding}
+        status, result = await self._apost_with_retry(url, compress(body), headers, passthrough_statuses + (415,))
+        if status != 415 or 415 in passthrough_statuses:
+            return status, result
+
+        # Server cannot decode this Content-Encoding: send uncompressed from now on
+        self._compress = None
+        self.handleError(None, f"Server rejected Content-Encoding {self._content_encoding}, sending uncompressed")
+        return await self._apost_with_retry(url, body, {'Content-Type': content_type}, passthrough_statuses)
+
+    async def _apost_with_retry(self, url: str, data: bytes, headers: dict, passthrough_statuses=()):
+        try:
+            request_headers, auth = self._async_request_auth()
+        except Exception as e:
+            self.handleError(None, f"Auth callable failed: {e}")
+            return None, None
+        request_headers.update(headers)
+
+        current_retry = 0
+        while current_retry <= self.retry_attempts:
+            started = time.perf_counter()
+            try:
+                async with self._client.post(url, data=data, headers=request_headers, auth=auth) as response:
+                    text = await response.text()
+                    if response.status in passthrough_statuses or response.status < 400:
+                        self.metrics.request(time.perf_counter() - started, len(data), True)
+                        return response.status, _parse_json(text)
+                    error_msg = f"Request failed: HTTP {response.status} (Status: {response.status}, Response: {text[:200]})"
+                    if response.status < 500:
+                        self.metrics.request(time.perf_counter() - started, len(data), True)
+                        self.handleError(None, error_msg) # Log error but don't retry 4xx
+                        return response.status, _parse_json(text)
+            except asyncio.TimeoutError as e:
+                error_msg = f"Request timed out after {self.timeout}s: {e}"
+            except aiohttp.ClientError as e:
+                error_msg = f"Connection error: {e}"
+
+            self.metrics.request(time.perf_counter() - started, len(data), False)
+            current_retry += 1
+            if current_retry <= self.retry_attempts:
+                await asyncio.sleep(backoff_delay(current_retry, self.retry_delay, self.retry_max_delay))
+                self.metrics.retried()
+            else:
+                self.handleError(None, f"Failed to send log after {self.retry_attempts + 1} attempts. Last error: {error_msg}")
+        return None, None
+
+    def _check_batch_result(self, result, count: int):
+        failed = result.get("failed", 0) if isinstance(result, dict) else 0
+        if failed:
+            errors = [item["error"] for item in result.get("results", []) if isinstance(item, dict) and "error" in item]
+            first_error = errors[0] if errors else 'N/A'
+            self.handleError(None, f"Batch endpoint rejected {failed} of {count} records. First error: {first_error}")
+        return failed
+
+    async def acheck_connection(self) -> bool:
+        """
+        Check connectivity with the API's health endpoint without blocking the event loop.
+        """
+        try:
+            client = self._client
+            if client is not None and not client.closed and asyncio.get_running_loop() is self._loop:
+                return await self._acheck_connection(client)  # Reuse the sending task's connections
+            client_timeout = aiohttp.ClientTimeout(total=self.timeout)
+            connector = aiohttp.TCPConnector(ssl=None if self.verify_ssl else False)
+            async with aiohttp.ClientSession(connector=connector, timeout=client_timeout) as client:
+                return await self._acheck_connection(client)
+        except Exception as e:
+            self.handleError(None, f"Health check failed with unexpected error: {e}")
+            return False
+
+    async def _acheck_connection(self, client) -> bool:
+        headers, auth = self._async_request_auth()
+        async with client.get(health_url_for(self.api_endpoint), headers=headers, auth=auth) as response:
+            if response.status >= 400:
+                self.handleError(None, f"Health check failed: HTTP {response.status} (Status: {response.status})")
+                return False
+            return True
+
+    async def aflush(self, timeout: float = None) -> bool:
+        """
+        Send everything buffered now.
+
+        :param timeout: Max seconds to wait. None waits forever.
+        :return: True if the buffer drained before the deadline.
+        """
+        self._release_collapsed()
+        if self._task is None:
+            if not self._buffer:
+                return True
+            self.start()
+        if self._task.done():
+            return not self._buffer
+        self._wake(send_now=True)
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self._buffer and not self._in_flight
+
+    async def aclose(self, timeout: float = None) -> bool:
+        """
+        Flush buffered records, stop the background task and close the handler.
+
+        :param timeout: Max seconds to wait for the buffer to drain. None waits forever.
+        :return: True if everything buffered was sent before the deadline.
+        """
+        drained = await self.aflush(timeout)
+        if self._task is not None and not self._task.done():
+            self._closing = True
+            self._wake(send_now=True)
+            try:
+                await asyncio.wait_for(asyncio.shield(self._task), timeout)
+            except asyncio.TimeoutError:
+                self._task.cancel()
+                drained = False
+        self.close()
+        return drained
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the handler's counters, histograms and buffer gauges, see LogAggregatorHandler.stats().
+        """
+        stats = super().stats()
+        stats["dropped"]["queue_full"] = self.dropped
+        stats["queue"]["depth"] = len(self._buffer) + self._in_flight
+        stats["queue"]["capacity"] = self.queue_size
+        return stats
+
+    def flush(self):
+        """
+        No-op: the event loop cannot be waited on synchronously. Use aflush().
+        """
+
+    def close(self):
+        """
+        Close the handler. Records still buffered are only sent if aclose() was used.
+        """
+        if self._task is not None and not self._task.done() and not self._closing:
+            self._closing = True
+            self._wake(send_now=True)
+        super().close()
+
+
+def _parse_json(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
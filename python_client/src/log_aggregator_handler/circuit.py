@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+
+# Circuit breaker states
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """
+    Capped exponential backoff with jitter for the given attempt (1-based).
+
+    Returns a delay between half and all of min(cap, base * 2 ** (attempt - 1)),
+    so concurrent clients spread out instead of retrying in lockstep.
+    """
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker shared by every thread sending through one handler.
+
+    - closed: requests go through. ``failure_threshold`` consecutive failures open it.
+    - open: requests are refused without touching the network until the backoff
+      (capped exponential with jitter, growing with each consecutive trip) expires.
+    - half_open: one caller runs ``probe`` (e.g. the API health check); success
+      closes the circuit, failure opens it again with a longer backoff. Other
+      callers are refused while the probe runs. Without a probe, the caller's own
+      request is the trial.
+    """
+    def __init__(self, failure_threshold: int = 5,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 60.0,
+                 probe=None):
+        """
+        :param failure_threshold: Consecutive failures that open the circuit. Defaults to 5.
+        :param backoff_base: Open duration after the first trip, in seconds. Defaults to 1.0.
+        :param backoff_max: Maximum open duration, in seconds. Defaults to 60.0.
+        :param probe: Optional callable returning True if the API is healthy again.
+        """
+        self.failure_threshold = max(1, failure_threshold)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.probe = probe
+        self.trips = 0
+
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._consecutive_trips = 0
+        self._open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow_request(self) -> bool:
+        """
+        Whether a request may be sent now. May run the probe on the calling thread.
+        """
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN or time.monotonic() < self._open_until:
+                return False
+            self._state = STATE_HALF_OPEN
+            if self.probe is None:
+                return True  # This request is the trial
+
+        try:
+            healthy = bool(self.probe())
+        except Exception:
+            healthy = False
+        if healthy:
+            self.record_success()
+        else:
+            with self._lock:
+                self._trip()
+        return healthy
+
+    def record_success(self):
+        """
+        Report a request the server answered. Closes the circuit.
+        """
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._failures = 0
+            self._consecutive_trips = 0
+
+    def record_failure(self):
+        """
+        Report a failed request (network error, timeout or 5xx).
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN or (
+                self._state == STATE_CLOSED and self._failures >= self.failure_threshold
+            ):
+                self._trip()
+
+    def _trip(self):
+        self._consecutive_trips += 1
+        self.trips += 1
+        self._state = STATE_OPEN
+        self._open_until = time.monotonic() + backoff_delay(self._consecutive_trips, self.backoff_base, self.backoff_max)
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+import json
+import queue
+import threading
+import time
+
+import requests
+
+from .circuit import backoff_delay
+from .export import DEFAULT_CHUNK_SIZE, EXPORT_COLUMNS, SEARCH_COLUMNS, resolve_format, write_entries
+from .session import resolve_api_endpoint, create_session, request_auth
+from .tail import TailCache
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson")
+
+# Seconds between cache saves while tailing; it is also saved when the tail stops
+TAIL_CACHE_SAVE_INTERVAL = 30.0
+
+# Items passed from the prefetch thread to the consuming generator
+_PAGE = "page"
+_DONE = "done"
+_ERROR = "error"
+
+
+def _listing_params(host, host_process, log_level, timestamp_from, timestamp_to) -> dict:
+    params = {
+        "host": host,
+        "host_process": host_process,
+        "log_level": log_level,
+        "timestamp_from": timestamp_from,
+        "timestamp_to": timestamp_to,
+    }
+    return {name: value for name, value in params.items() if value is not None}
+
+
+class LogAggregatorClient:
+    """
+    Reads logs back from the API's GET /api/logs endpoint.
+
+    Results are walked page by page through the server's cursor, newest first.
+    A background thread fetches the next page while the caller works through
+    the current one, so at most ``prefetch + 2`` pages are held in memory
+    however many records match.
+    """
+    def __init__(self, api_endpoint: str = None,
+                 auth=None,
+                 timeout: float = 10.0,
+                 retry_attempts: int = 3,
+                 retry_delay: float = 1.0,
+                 retry_max_delay: float = 30.0,
+                 verify_ssl: bool = True,
+                 page_size: int = 500,
+                 prefetch: int = 1,
+                 ndjson: bool = False):
+        """
+        :param api_endpoint: The URL of the logs endpoint, as for LogAggregatorHandler.
+                             Defaults to the LOG_AGGREGATOR_API_ENDPOINT environment variable.
+        :param auth: Authentication credentials, as for LogAggregatorHandler. Defaults to None.
+        :param timeout: Request timeout in seconds. Defaults to 10.0.
+        :param retry_attempts: Number of retries of a page on network errors and 5xx. Defaults to 3.
+        :param retry_delay: Base delay between retries in seconds, doubled with each attempt
+                            and jittered. Defaults to 1.0.
+        :param retry_max_delay: Maximum delay between retries in seconds. Defaults to 30.0.
+        :param verify_ssl: Whether to verify the server's TLS certificate. Defaults to True.
+        :param page_size: Records requested per page; the server caps it at 1000. Defaults to 500.
+        :param prefetch: Pages fetched ahead of the one being read. Defaults to 1.
+        :param ndjson: Ask for newline-delimited JSON pages, parsed line by line while they
+                       are read. Defaults to False (one JSON array per page).
+        """
+        self.api_endpoint = resolve_api_endpoint(api_endpoint)
+        self.auth = auth
+        self.timeout = timeout
+        self.retry_attempts = max(0, retry_attempts)
+        self.retry_delay = max(0.1, retry_delay)
+        self.retry_max_delay = max(self.retry_delay, retry_max_delay)
+        self.verify_ssl = verify_ssl
+        self.page_size = max(1, page_size)
+        self.prefetch = max(1, prefetch)
+        self.ndjson = ndjson
+        if auth and not isinstance(auth, (dict, tuple)) and not callable(auth):
+            raise ValueError("Invalid auth type provided. Must be tuple, dict, or callable.")
+        self.session = create_session(self.auth, self.verify_ssl)
+
+    @classmethod
+    def from_handler(cls, handler, **options) -> "LogAggregatorClient":
+        """
+        Create a client for the endpoint, auth and TLS settings of a LogAggregatorHandler.
+        """
+        options.setdefault("timeout", handler.timeout)
+        return cls(api_endpoint=handler.api_endpoint, auth=handler.auth, verify_ssl=handler.verify_ssl, **options)
+
+    def iter_logs(self, host: str = None,
+                  host_process: str = None,
+                  log_level: str = None,
+                  timestamp_from: str = None,
+                  timestamp_to: str = None,
+                  cursor: str = None,
+                  page_size: int = None,
+                  ndjson: bool = None):
+        """
+        Yield the matching log entries as dicts, newest first.
+
+        Pages are fetched on a background thread. Errors (after retries) are raised
+        from the generator; closing the generator early stops the prefetching.
+
+        :param host: Only entries of this host.
+        :param host_process: Only entries of this host process.
+        :param log_level: Only entries of this level, e.g. "ERROR".
+        :param timestamp_from: Only entries at or after this timestamp.
+        :param timestamp_to: Only entries at or before this timestamp.
+        :param cursor: Cursor to resume from, as returned in a previous X-Next-Cursor header.
+        :param page_size: Overrides the client's page_size.
+        :param ndjson: Overrides the client's ndjson setting.
+        """
+        return self._iter_pages(_listing_params(host, host_process, log_level, timestamp_from, timestamp_to),
+                                cursor, page_size, ndjson)
+
+    def search(self, q: str,
+               host: str = None,
+               host_process: str = None,
+               log_level: str = None,
+               timestamp_from: str = None,
+               timestamp_to: str = None,
+               cursor: str = None,
+               page_size: int = None,
+               ndjson: bool = None):
+        """
+        Yield the log entries whose message contains every word of q, best match first.
+
+        The server answers from a full-text index, so a search costs about as much as
+        the matches it returns rather than a scan of every message. Each entry has a
+        "score", higher for better matches. Paging, prefetching and errors work as
+        for iter_logs().
+
+        :param q: Words to search for; all of them must occur in the message.
+        :param host: Only entries of this host.
+        :param host_process: Only entries of this host process.
+        :param log_level: Only entries of this level, e.g. "ERROR".
+        :param timestamp_from: Only entries at or after this timestamp.
+        :param timestamp_to: Only entries at or before this timestamp.
+        :param cursor: Cursor to resume from, as returned in a previous X-Next-Cursor header
+                       of the same search.
+        :param page_size: Overrides the client's page_size.
+        :param ndjson: Overrides the client's ndjson setting.
+        """
+        if not q or not q.strip():
+            raise ValueError("q must contain at least one word")
+        params = _listing_params(host, host_process, log_level, timestamp_from, timestamp_to)
+        params["q"] = q
+        return self._iter_pages(params, cursor, page_size, ndjson)
+
+    def export(self, destination,
+               format: str = None,
+               host: str = None,
+               host_process: str = None,
+               log_level: str = None,
+               timestamp_from: str = None,
+               timestamp_to: str = None,
+               q: str = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE,
+               page_size: int = None) -> int:
+        """
+        Write the matching log entries to a Parquet, Arrow IPC or CSV file, newest first.
+
+        Entries are written chunk_size at a time while the next pages are fetched, so
+        memory holds about one chunk whatever the number of entries. In Parquet and
+        Arrow, host, host_process and log_level are dictionary-encoded and id is an
+        int64; the other columns are strings. Load the file with pandas.read_parquet()
+        or pyarrow.ipc.open_file(...).read_all().
+
+        :param destination: Path of the file to write, or a binary file object.
+        :param format: "parquet", "arrow" or "csv". Defaults to the format of the path's
+                       extension (.parquet, .arrow/.feather/.ipc, .csv/.csv.gz), else
+                       "parquet" if pyarrow is installed and "csv" if not.
+        :param host: Only entries of this host.
+        :param host_process: Only entries of this host process.
+        :param log_level: Only entries of this level, e.g. "ERROR".
+        :param timestamp_from: Only entries at or after this timestamp.
+        :param timestamp_to: Only entries at or before this timestamp.
+        :param q: Export the results of search(q) instead, best match first, with a score column.
+        :param chunk_size: Entries per Parquet row group, Arrow record batch or CSV write.
+                           Defaults to 65536.
+        :param page_size: Overrides the client's page_size.
+        :return: The number of entries written.
+        :raises ImportError: If format is "parquet" or "arrow" and pyarrow is not installed.
+        """
+        format = resolve_format(destination, format)
+        filters = dict(host=host, host_process=host_process, log_level=log_level,
+                       timestamp_from=timestamp_from, timestamp_to=timestamp_to)
+        if q is not None:
+            entries, columns = self.search(q, page_size=page_size, **filters), SEARCH_COLUMNS
+        else:
+            entries, columns = self.iter_logs(page_size=page_size, **filters), EXPORT_COLUMNS
+        try:
+            return write_entries(entries, destination, format, columns, chunk_size)
+        finally:
+            entries.close()  # Stops the prefetching if writing failed
+
+    def stats(self, bucket: str = "minute",
+              group_by=None,
+              host: str = None,
+              host_process: str = None,
+              log_level: str = None,
+              timestamp_from: str = None,
+              timestamp_to: str = None) -> list:
+        """
+        Count the matching log entries per time bucket, oldest first (GET /api/logs/stats).
+
+        The server answers from per-minute counts kept up to date on insert, so this
+        is cheap however many entries there are. Counts of entries removed by
+        retention are kept longer than the entries.
+
+        :param bucket: "minute", "hour" or "day". Defaults to "minute".
+        :param group_by: Columns to count separately, any of "host", "host_process" and
+                         "log_level". Defaults to None (one count per bucket).
+        :param host: Only entries of this host.
+        :param host_process: Only entries of this host process.
+        :param log_level: Only entries of this level, e.g. "ERROR".
+        :param timestamp_from: Count from the minute of this timestamp.
+        :param timestamp_to: Count up to the minute of this timestamp.
+        :return: List of dicts with "bucket" (its start), the group_by columns and "count".
+        """
+        params = _listing_params(host, host_process, log_level, timestamp_from, timestamp_to)
+        params["bucket"] = bucket
+        if group_by:
+            params["group_by"] = ",".join(group_by)
+        return self._get_page(params, None, False, url=self.api_endpoint.rstrip("/") + "/stats")[0]
+
+    def _iter_pages(self, params: dict, cursor, page_size, ndjson):
+        """
+        Generator behind iter_logs() and search(): walk the pages of one listing.
+        """
+        params = dict(params, limit=max(1, page_size or self.page_size))
+        ndjson = self.ndjson if ndjson is None else ndjson
+
+        pages = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._prefetch, args=(params, cursor, ndjson, pages, stop),
+                                  name="LogAggregatorClientPrefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                kind, value = pages.get()
+                if kind == _PAGE:
+                    yield from value
+                elif kind == _DONE:
+                    return
+                else:
+                    raise value
+        finally:
+            # Unblock the prefetch thread if it waits for room in the queue
+            stop.set()
+
+    def tail(self, host: str = None,
+             host_process: str = None,
+             log_level: str = None,
+             backlog: int = 10,
+             since_id: int = None,
+             wait: float = 20.0,
+             poll_interval: float = 2.0,
+             cache: TailCache = None):
+        """
+        Yield log entries as they arrive, oldest first, like ``tail -f``. Never ends on its own.
+
+        Starts with the most recent backlog entries, then polls for entries with an id
+        above the highest one seen. The server holds each poll open for up to wait
+        seconds until there is something new, so entries show up without delay and
+        idle polls cost one indexed query per check on the server.
+
+        :param host: Only entries of this host.
+        :param host_process: Only entries of this host process.
+        :param log_level: Only entries of this level, e.g. "ERROR".
+        :param backlog: Recent entries yielded first. Defaults to 10.
+        :param since_id: Start after this id instead of with the backlog.
+        :param wait: Seconds the server may hold a poll open, at most 30. 0 disables
+                     long-polling. Defaults to 20.0.
+        :param poll_interval: Minimum seconds between polls that found nothing, for
+                              servers that do not hold polls open. Defaults to 2.0.
+        :param cache: TailCache of entries fetched by earlier tails. The backlog, or the
+                      entries after since_id, are taken from it instead of fetched again;
+                      the tail stores what it fetches, and the cache is saved when the
+                      generator is closed.
+        """
+        filters = {"host": host, "host_process": host_process, "log_level": log_level}
+        filters = {name: value for name, value in filters.items() if value is not None}
+        try:
+            resumed = cache.resume(self.api_endpoint, filters, since_id, backlog) if cache is not None else None
+            if resumed is not None and since_id is None:
+                # A new tail still starts with the newest entries: fetch only those logged
+                # after the cached ones, unless there are too many to show them all
+                entries, high = resumed
+                limit = max(1, backlog)
+                newer, _ = self._get_page(dict(filters, since_id=high, limit=limit), None, self.ndjson)
+                cache.store(self.api_endpoint, filters, high, newer)
+                if len(newer) < limit:
+                    entries = (entries + newer)[-backlog:] if backlog > 0 else []
+                    since_id = max([high] + [int(entry["id"]) for entry in newer])
+            elif resumed is not None:
+                entries, since_id = resumed
+            elif since_id is not None:
+                entries = []
+            if since_id is None:
+                # Newest first; shown oldest first like a log file
+                entries = list(reversed(self._get_page(dict(filters, limit=max(1, backlog)), None, self.ndjson)[0]))
+                since_id = max((int(entry["id"]) for entry in entries), default=0)
+                entries = entries if backlog > 0 else []
+                if cache is not None:
+                    cache.store(self.api_endpoint, filters, None, entries)
+            yield from entries
+
+            params = dict(filters, limit=self.page_size)
+            if wait > 0:
+                params["wait"] = wait
+            last_saved = time.monotonic()
+            while True:
+                started = time.monotonic()
+                entries, _ = self._get_page(dict(params, since_id=since_id), None, self.ndjson,
+                                            timeout=self.timeout + wait)
+                if cache is not None:
+                    cache.store(self.api_endpoint, filters, since_id, entries)
+                    if entries and started - last_saved > TAIL_CACHE_SAVE_INTERVAL:
+                        cache.save()
+                        last_saved = started
+                if entries:
+                    since_id = max(since_id, max(int(entry["id"]) for entry in entries))
+                    yield from entries
+                    if len(entries) >= self.page_size:
+                        continue  # More are waiting
+                remaining = poll_interval - (time.monotonic() - started)
+                if not entries and remaining > 0:
+                    time.sleep(remaining)
+        finally:
+            if cache is not None:
+                cache.save()
+
+    def _prefetch(self, params: dict, cursor, ndjson: bool, pages: queue.Queue, stop: threading.Event):
+        """
+        Prefetch thread: fetch pages until the last one, or until the consumer stops.
+        """
+        try:
+            while not stop.is_set():
+                page, cursor = self._get_page(params, cursor, ndjson)
+                if page and not self._put(pages, (_PAGE, page), stop):
+                    return
+                if cursor is None:
+                    break
+            self._put(pages, (_DONE, None), stop)
+        except Exception as e:
+            self._put(pages, (_ERROR, e), stop)
+
+    @staticmethod
+    def _put(pages: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get_page(self, params: dict, cursor, ndjson: bool, timeout: float = None, url: str = None):
+        """
+        GET one page, retrying on network errors and 5xx responses.
+
+        :param timeout: Request timeout; defaults to the client's timeout.
+        :param url: URL to get; defaults to the logs endpoint.
+        :return: (list of entries, cursor of the next page or None)
+        """
+        if cursor is not None:
+            params = dict(params, cursor=cursor)
+
+        attempt = 0
+        while True:
+            request_headers, auth = request_auth(self.session, self.auth)
+            if ndjson:
+                request_headers["Accept"] = NDJSON_CONTENT_TYPES[0]
+            try:
+                with self.session.get(url or self.api_endpoint, params=params, headers=request_headers,
+                                      auth=auth, timeout=timeout or self.timeout, stream=ndjson) as response:
+                    if response.status_code < 500:
+                        response.raise_for_status()  # 4xx are not retried
+                        return self._parse_page(response), response.headers.get("X-Next-Cursor") or None
+                    error = requests.exceptions.HTTPError(
+                        f"Server error {response.status_code} fetching logs: {response.text[:200]}",
+                        response=response)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                error = e
+
+            attempt += 1
+            if attempt > self.retry_attempts:
+                raise error
+            time.sleep(backoff_delay(attempt, self.retry_delay, self.retry_max_delay))
+
+    @staticmethod
+    def _parse_page(response) -> list:
+        content_type = response.headers.get("Content-Type", "").split(";", 1)[0].strip().lower()
+        if content_type in NDJSON_CONTENT_TYPES:
+            # Parsed line by line as the body arrives
+            return [json.loads(line) for line in response.iter_lines() if line.strip()]
+        return response.json()  # Also the answer of servers that ignore the Accept header
+
+    def close(self):
+        """
+        Close the HTTP session.
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import gzip
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional
+    zstandard = None
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSIONS = (COMPRESSION_GZIP, COMPRESSION_ZSTD)
+
+
+def get_compressor(name: str):
+    """
+    Return (content_encoding, compress_func) for a compression name.
+
+    "zstd" falls back to gzip when the zstandard package is not installed.
+    compress_func may be called from several threads at once.
+    """
+    if name not in COMPRESSIONS:
+        raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}, got {name!r}")
+
+    if name == COMPRESSION_ZSTD and zstandard is not None:
+        return COMPRESSION_ZSTD, _zstd_compress_func()
+
+    return COMPRESSION_GZIP, lambda data: gzip.compress(data, compresslevel=6)
+
+
+def _zstd_compress_func():
+    # A ZstdCompressor must not be used by two threads at once: keep one per thread
+    local = threading.local()
+
+    def compress(data: bytes) -> bytes:
+        compressor = getattr(local, "compressor", None)
+        if compressor is None:
+            compressor = local.compressor = zstandard.ZstdCompressor(level=3)
+        return compressor.compress(data)
+
+    return compress
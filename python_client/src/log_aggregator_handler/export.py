@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar export of log entries, used by LogAggregatorClient.export().
+
+Entries are written in chunks as they arrive, so memory holds one chunk
+however many entries are exported. Parquet and Arrow IPC need pyarrow; CSV
+works without it.
+"""
+import csv
+import gzip
+import io
+import os
+
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+FORMAT_CSV = "csv"
+EXPORT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW, FORMAT_CSV)
+
+# Format implied by a file name's extension
+_EXTENSIONS = {
+    ".parquet": FORMAT_PARQUET,
+    ".arrow": FORMAT_ARROW,
+    ".feather": FORMAT_ARROW,
+    ".ipc": FORMAT_ARROW,
+    ".csv": FORMAT_CSV,
+    ".csv.gz": FORMAT_CSV,
+}
+
+EXPORT_COLUMNS = ("id", "timestamp", "host", "host_process", "log_level", "log_message", "created_at")
+SEARCH_COLUMNS = EXPORT_COLUMNS + ("score",)
+
+# Few distinct values: stored once per file and referenced by index
+DICTIONARY_COLUMNS = ("host", "host_process", "log_level")
+
+DEFAULT_CHUNK_SIZE = 65536
+
+
+def _import_pyarrow():
+    # On first use only: pyarrow is slow to import, and optional; CSV is written without it
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def resolve_format(destination, format: str = None) -> str:
+    """
+    The export format: format if given, else the one of the destination's extension,
+    else Parquet if pyarrow is installed and CSV otherwise.
+
+    :raises ValueError: If format is unknown.
+    :raises ImportError: If format needs pyarrow and it is not installed.
+    """
+    if format is None:
+        name = os.fspath(destination).lower() if isinstance(destination, (str, os.PathLike)) else ""
+        format = next((fmt for ext, fmt in _EXTENSIONS.items() if name.endswith(ext)), None)
+        if format is None:
+            format = FORMAT_PARQUET if _import_pyarrow() is not None else FORMAT_CSV
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}, got {format!r}")
+    if format != FORMAT_CSV and _import_pyarrow() is None:
+        raise ImportError(
+            f"Exporting to {format} requires pyarrow. Install it with: pip install log-aggregator-handler[export]"
+        )
+    return format
+
+
+def write_entries(entries, destination, format: str, columns=EXPORT_COLUMNS,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Write log entries (dicts) to destination, chunk_size at a time.
+
+    :param destination: A path, or a binary file object (left open).
+    :param format: One of EXPORT_FORMATS, see resolve_format().
+    :param columns: Entry keys written, in order; other keys are ignored, missing ones are null.
+    :return: The number of entries written.
+    """
+    chunk_size = max(1, chunk_size)
+    writer = _CsvWriter(destination, columns) if format == FORMAT_CSV else _ArrowWriter(destination, format, columns)
+    count = 0
+    try:
+        chunk = []
+        for entry in entries:
+            chunk.append(entry)
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+class _Dictionary:
+    """
+    Values of a dictionary-encoded column, kept across chunks so every chunk only
+    adds its new values (written as dictionary deltas) to those of the chunks before.
+    """
+    def __init__(self, pyarrow):
+        self.pyarrow = pyarrow
+        self.values = []
+        self.indices = {}
+
+    def encode(self, values):
+        indices = []
+        for value in values:
+            if value is None:
+                indices.append(None)
+                continue
+            index = self.indices.get(value)
+            if index is None:
+                index = self.indices[value] = len(self.values)
+                self.values.append(value)
+            indices.append(index)
+        pyarrow = self.pyarrow
+        return pyarrow.DictionaryArray.from_arrays(pyarrow.array(indices, pyarrow.int32()),
+                                                   pyarrow.array(self.values, pyarrow.string()))
+
+
+_ARROW_TYPES = {"id": "int64", "score": "float64"}
+
+
+class _ArrowWriter:
+    """
+    One record batch (Arrow IPC) or row group (Parquet) per chunk.
+    """
+    def __init__(self, destination, format: str, columns):
+        self.pyarrow = pyarrow = _import_pyarrow()
+        self.columns = tuple(columns)
+        self.dictionaries = {name: _Dictionary(pyarrow) for name in self.columns if name in DICTIONARY_COLUMNS}
+        fields = []
+        for name in self.columns:
+            if name in self.dictionaries:
+                field_type = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+            else:
+                field_type = getattr(pyarrow, _ARROW_TYPES.get(name, "string"))()
+            fields.append(pyarrow.field(name, field_type))
+        self.schema = pyarrow.schema(fields)
+        self.parquet = format == FORMAT_PARQUET
+        if self.parquet:
+            self._writer = pyarrow.parquet.ParquetWriter(destination, self.schema, compression="zstd")
+        else:
+            options = pyarrow.ipc.IpcWriteOptions(compression="zstd", emit_dictionary_deltas=True)
+            self._writer = pyarrow.ipc.new_file(destination, self.schema, options=options)
+
+    def write(self, chunk: list):
+        pyarrow = self.pyarrow
+        arrays = []
+        for field in self.schema:
+            values = [entry.get(field.name) for entry in chunk]
+            if field.name in self.dictionaries:
+                arrays.append(self.dictionaries[field.name].encode(values))
+            elif field.name == "id":
+                arrays.append(pyarrow.array([None if value is None else int(value) for value in values], field.type))
+            elif field.name == "score":
+                arrays.append(pyarrow.array([None if value is None else float(value) for value in values], field.type))
+            else:
+                arrays.append(pyarrow.array([None if value is None else str(value) for value in values], field.type))
+        if self.parquet:
+            # Parquet stores a dictionary per row group itself
+            self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        else:
+            self._writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class _CsvWriter:
+    """
+    CSV with a header row, gzip-compressed if the path ends in .gz.
+    """
+    def __init__(self, destination, columns):
+        self.columns = tuple(columns)
+        self._owned = None
+        if isinstance(destination, (str, os.PathLike)):
+            path = os.fspath(destination)
+            binary = gzip.open(path, "wb", compresslevel=6) if path.lower().endswith(".gz") else open(path, "wb")
+            self._owned = binary
+        else:
+            binary = destination
+        self._text = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(self.columns)
+
+    def write(self, chunk: list):
+        self._csv.writerows([["" if entry.get(name) is None else entry.get(name) for name in self.columns]
+                             for entry in chunk])
+        self._text.flush()
+
+    def close(self):
+        self._text.flush()
+        if self._owned is not None:
+            self._text.close()  # Also closes the file
+        else:
+            self._text.detach()  # Leave the caller's file open
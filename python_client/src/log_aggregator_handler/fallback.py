@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+
+# Where records go while the API is unreachable
+FALLBACK_DROP = "drop"
+FALLBACK_BUFFER = "buffer"
+FALLBACK_FILE = "file"
+FALLBACK_MODES = (FALLBACK_DROP, FALLBACK_BUFFER, FALLBACK_FILE)
+
+
+class Fallback:
+    """
+    Destination for encoded records that could not be delivered.
+
+    - ``"drop"``: records are counted and discarded.
+    - ``"buffer"``: records are kept in memory (the oldest are dropped beyond
+      ``buffer_size``) and handed back by take() once the API is reachable again.
+    - ``"file"``: records are appended to ``path`` as newline-delimited JSON.
+
+    Thread-safe.
+    """
+    def __init__(self, mode: str = FALLBACK_DROP, path: str = None, buffer_size: int = 10000):
+        """
+        :param mode: "drop", "buffer" or "file". Defaults to "drop".
+        :param path: File the "file" mode appends to. Required for that mode.
+        :param buffer_size: Maximum records kept by the "buffer" mode. Defaults to 10000.
+        """
+        if mode not in FALLBACK_MODES:
+            raise ValueError(f"fallback must be one of {', '.join(FALLBACK_MODES)}, got {mode!r}")
+        if mode == FALLBACK_FILE and not path:
+            raise ValueError("fallback_path is required for the file fallback")
+
+        self.mode = mode
+        self.path = path
+        self.stored = 0
+        self.dropped = 0
+        self._buffer = collections.deque(maxlen=max(1, buffer_size))
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def store(self, payloads: list):
+        """
+        Take over a list of encoded records.
+        """
+        with self._lock:
+            if self.mode == FALLBACK_BUFFER:
+                overflow = len(self._buffer) + len(payloads) - self._buffer.maxlen
+                if overflow > 0:
+                    self.dropped += overflow
+                self._buffer.extend(payloads)
+                self.stored += len(payloads)
+            elif self.mode == FALLBACK_FILE:
+                if self._file is None:
+                    self._file = open(self.path, "ab")
+                self._file.write(b"".join(payload + b"\n" for payload in payloads))
+                self._file.flush()
+                self.stored += len(payloads)
+            else:
+                self.dropped += len(payloads)
+
+    def take(self, max_records: int) -> list:
+        """
+        Remove and return up to max_records buffered records, oldest first.
+        """
+        with self._lock:
+            count = min(max_records, len(self._buffer))
+            return [self._buffer.popleft() for _ in range(count)]
+
+    def putback(self, payloads: list):
+        """
+        Return records obtained from take() that still could not be delivered.
+        """
+        with self._lock:
+            room = self._buffer.maxlen - len(self._buffer)
+            if len(payloads) > room:
+                self.dropped += len(payloads) - room
+                payloads = payloads[len(payloads) - room:] if room else []
+            self._buffer.extendleft(reversed(payloads))
+
+    def close(self):
+        """
+        Close the fallback file, if one is open.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
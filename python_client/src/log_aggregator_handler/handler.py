@@ -1,14 +1,26 @@
 # -*- coding: utf-8 -*-
 import logging
-import requests
 import os
+import requests
+import signal
 import socket
-import datetime
+import threading
 import time
-import json
 import traceback
 from urllib.parse import urljoin
 
+from .circuit import CircuitBreaker, STATE_OPEN, backoff_delay
+from .compression import get_compressor
+from .fallback import Fallback, FALLBACK_DROP
+from .metrics import HandlerMetrics, render_prometheus, DEFAULT_PREFIX
+from .recorder import FlightRecorder, CORRELATION_FIELD, RECORDER_PER_THREAD
+from .serializer import RecordSerializer, CapturedRecord, capture_record
+from .session import resolve_api_endpoint, create_session, request_auth
+from .sender import BackgroundSender, ParallelSender, SpoolingSender, OVERFLOW_BLOCK
+from .spool import DiskSpool, EVICT_DROP_OLDEST
+from .suppression import LogSuppressor
+from .wire import MsgpackEncoder, MSGPACK_CONTENT_TYPE, WIRE_FORMATS, WIRE_JSON, WIRE_MSGPACK, is_packed, msgpack, unpack_record
+
 # Define default level mapping
 DEFAULT_LEVEL_MAP = {
     logging.DEBUG: "DEBUG",
@@ -18,6 +30,18 @@ DEFAULT_LEVEL_MAP = {
     logging.CRITICAL: "CRITICAL",
 }
 
+# Batch endpoint responses meaning "this server cannot take batches"
+BATCH_UNSUPPORTED_STATUSES = (404, 405, 501)
+
+
+def health_url_for(api_endpoint: str) -> str:
+    """
+    Derive the health check URL from the logs endpoint.
+    Assumes api_endpoint might be 'http://host/api/logs', we want 'http://host/api/health'
+    """
+    base_url = api_endpoint.rsplit('/', 1)[0] # Get base path
+    return urljoin(base_url + '/', 'health') # Join robustly
+
 class LogAggregatorHandler(logging.Handler):
     """
     A logging handler that sends log records as JSON to a remote API endpoint.
@@ -28,8 +52,43 @@ class LogAggregatorHandler(logging.Handler):
                  timeout: float = 5.0,
                  retry_attempts: int = 3,
                  retry_delay: float = 1.0,
+                 retry_max_delay: float = 30.0,
                  verify_ssl: bool = True,
-                 level_map: dict = None):
+                 level_map: dict = None,
+                 background: bool = False,
+                 queue_size: int = 1000,
+                 overflow_policy: str = OVERFLOW_BLOCK,
+                 flush_timeout: float = 5.0,
+                 priority_level: int = None,
+                 priority_queue_size: int = 1000,
+                 priority_retry_attempts: int = None,
+                 exit_signals=(),
+                 workers: int = 1,
+                 defer_format: bool = False,
+                 batch_size: int = 1,
+                 batch_max_bytes: int = 1048576,
+                 batch_linger: float = 0.5,
+                 batch_endpoint: str = None,
+                 compression: str = None,
+                 wire_format: str = WIRE_JSON,
+                 spool_dir: str = None,
+                 spool_segment_bytes: int = 4 * 1024 * 1024,
+                 spool_max_bytes: int = 256 * 1024 * 1024,
+                 spool_eviction: str = EVICT_DROP_OLDEST,
+                 circuit_failure_threshold: int = 5,
+                 circuit_max_open: float = 60.0,
+                 fallback: str = FALLBACK_DROP,
+                 fallback_path: str = None,
+                 fallback_buffer_size: int = 10000,
+                 rate_limit: float = None,
+                 rate_burst: int = None,
+                 sample_rates: dict = None,
+                 collapse_window: float = None,
+                 flight_recorder_size: int = 0,
+                 flight_recorder_level: int = logging.INFO,
+                 flight_recorder_trigger: int = logging.ERROR,
+                 flight_recorder_scope: str = RECORDER_PER_THREAD,
+                 flight_recorder_buffers: int = 256):
         """
         Initialize the handler.
 
@@ -39,159 +98,548 @@ class LogAggregatorHandler(logging.Handler):
                      a dict for headers, or a callable returning headers). Defaults to None.
         :param timeout: Request timeout in seconds. Defaults to 5.0.
         :param retry_attempts: Number of retry attempts on network failure. Defaults to 3.
-        :param retry_delay: Delay between retries in seconds (simple backoff). Defaults to 1.0.
+        :param retry_delay: Base delay between retries in seconds. The delay doubles with each
+                            attempt and is jittered. Defaults to 1.0.
+        :param retry_max_delay: Maximum delay between retries in seconds. Defaults to 30.0.
         :param verify_ssl: Whether to verify the server's TLS certificate. Defaults to True.
         :param level_map: Custom mapping from Python log level numbers to API level strings.
                           Defaults to standard mapping.
+        :param background: If True, emit() only queues the record and a dedicated sender
+                           thread posts it. Defaults to False (send on the calling thread).
+        :param queue_size: Maximum number of records queued in background mode. Defaults to 1000.
+        :param overflow_policy: What to do when the queue is full: "block", "drop_newest"
+                                or "drop_oldest". Defaults to "block".
+        :param flush_timeout: Max seconds flush() and close() wait for the queue to drain.
+                              Also bounds how long the "block" policy waits. Defaults to 5.0.
+        :param priority_level: Records at or above this level, e.g. logging.ERROR, are sent by
+                               a sender thread of their own, so they never wait behind queued
+                               lower-level records. flush() and close() drain this lane first.
+                               Implies background mode. Defaults to None (a single lane).
+        :param priority_queue_size: Maximum number of queued priority records. Defaults to 1000.
+        :param priority_retry_attempts: Retry attempts for priority records. Defaults to
+                                        retry_attempts.
+        :param exit_signals: Signals (e.g. signal.SIGTERM) on which queued records are sent,
+                             priority records first and within flush_timeout, before the
+                             signal's previous handler runs. Only installed from the main
+                             thread. Defaults to () (none).
+        :param workers: Number of sender threads posting at the same time. Records of one
+                        logger are always sent in order by the same thread. Values above 1
+                        imply background mode; queue_size is shared between them. Defaults to 1.
+        :param defer_format: If True, emit() only takes a snapshot of the record and the
+                             sender thread formats it, renders its traceback and encodes it.
+                             The result is the same as format_record(). Implies background
+                             mode. Defaults to False.
+        :param batch_size: Maximum records per request to the batch endpoint. Values above 1
+                           enable batching, which implies background mode. Defaults to 1.
+        :param batch_max_bytes: Maximum encoded size of a batch in bytes. Defaults to 1 MiB.
+        :param batch_linger: Max seconds a partial batch waits for more records. Defaults to 0.5.
+        :param batch_endpoint: URL of the batch endpoint. Defaults to api_endpoint + '/batch'.
+        :param compression: Compress request bodies with "gzip" or "zstd" (zstd needs the
+                            zstandard package, otherwise gzip is used). Batches are then sent
+                            as newline-delimited JSON. Defaults to None (no compression).
+        :param wire_format: Format of batches: "json", or "msgpack" to send the fields records
+                            share once per batch (needs the msgpack package, otherwise JSON is
+                            sent). Falls back to JSON if the server answers 415. Defaults to "json".
+        :param spool_dir: Directory for a disk spool. Records are written to segment files
+                          there before they are sent, and records left over from a previous
+                          run are sent on start. Implies background mode. Defaults to None.
+        :param spool_segment_bytes: Size of each spool segment file. Defaults to 4 MiB.
+        :param spool_max_bytes: Maximum disk space used by the spool. Defaults to 256 MiB.
+        :param spool_eviction: What to drop when the spool is full: "drop_oldest" (whole
+                               oldest segments) or "drop_newest". Defaults to "drop_oldest".
+        :param circuit_failure_threshold: Consecutive failed requests after which the circuit
+                                          opens and records skip the network until the health
+                                          endpoint answers again. 0 disables the circuit breaker.
+                                          Defaults to 5.
+        :param circuit_max_open: Maximum seconds between health probes while the circuit is
+                                 open. Defaults to 60.0.
+        :param fallback: Where undeliverable records go when there is no spool: "drop",
+                         "buffer" (kept in memory and sent once the circuit closes) or "file"
+                         (appended to fallback_path as newline-delimited JSON). Defaults to "drop".
+        :param fallback_path: File used by the "file" fallback.
+        :param fallback_buffer_size: Maximum records kept by the "buffer" fallback. Defaults to 10000.
+        :param rate_limit: Records per second sent per (logger, level); the rest are dropped
+                           before formatting. Defaults to None (no limit).
+        :param rate_burst: Burst size of the rate limit. Defaults to max(1, rate_limit).
+        :param sample_rates: Mapping from log level numbers to the fraction of records sent,
+                             e.g. {logging.DEBUG: 0.01, logging.INFO: 0.1}. Defaults to None.
+        :param collapse_window: Seconds during which repeats of a record (same logger, line
+                                and message template) are collapsed into one record with a
+                                repeat_count. Defaults to None (no collapsing).
+        :param flight_recorder_size: Records below flight_recorder_level kept in memory per
+                                     thread (or logger) instead of being sent. They are sent
+                                     only with a record at or above flight_recorder_trigger,
+                                     linked to it by a "flight_recorder_id" extra field.
+                                     Defaults to 0 (no flight recorder).
+        :param flight_recorder_level: Records below this level are kept by the flight recorder.
+                                      Defaults to logging.INFO.
+        :param flight_recorder_trigger: Records at or above this level send the records kept
+                                        before them. Defaults to logging.ERROR.
+        :param flight_recorder_scope: Keep records per "thread" or per "logger". Defaults to "thread".
+        :param flight_recorder_buffers: Maximum number of threads (or loggers) records are kept
+                                        for; the least recently used buffer is dropped beyond it. Defaults to 256.
         """
         super().__init__()
 
-        # Load .env file if python-dotenv is installed
-        # First check if api_endpoint was provided directly
-        self.api_endpoint = api_endpoint
-
-        # If not provided, try loading from environment
-        if not self.api_endpoint:
-            self.api_endpoint = os.environ.get("LOG_AGGREGATOR_API_ENDPOINT")
-
-        if not self.api_endpoint:
-            try:
-                import dotenv
-                dotenv.load_dotenv()
-                self.api_endpoint = os.environ.get("LOG_AGGREGATOR_API_ENDPOINT")
-            except ImportError:
-                pass  # python-dotenv not installed, ignore
-            
-        # Raise error if still not found
-        if not self.api_endpoint:
-            raise ValueError(
-                "api_endpoint must be provided either as a constructor argument or via the LOG_AGGREGATOR_API_ENDPOINT environment variable"
-            )
+        self.api_endpoint = resolve_api_endpoint(api_endpoint)
 
         self.host = host or socket.gethostname()
         self.auth = auth
         self.timeout = timeout
         self.retry_attempts = max(0, retry_attempts) # Ensure non-negative
         self.retry_delay = max(0.1, retry_delay) # Ensure minimum delay
+        self.retry_max_delay = max(self.retry_delay, retry_max_delay)
         self.verify_ssl = verify_ssl
         self.level_map = level_map or DEFAULT_LEVEL_MAP
+        self._serializer = RecordSerializer(self.host, self.level_map)
+        self.workers = max(1, workers)
+        if self.workers > 1 and spool_dir:
+            raise ValueError("workers cannot be combined with spool_dir: the spool is sent in order by one thread")
+        if priority_level is not None and spool_dir:
+            raise ValueError("priority_level cannot be combined with spool_dir: priority records would bypass the spool")
+        self.priority_level = priority_level
+        self.priority_retry_attempts = self.retry_attempts if priority_retry_attempts is None else max(0, priority_retry_attempts)
+        # Retry budget of the lane the current thread sends for, see _post_with_retry()
+        self._lane = threading.local()
+        self.defer_format = defer_format
+        sender_threads = self.workers + (1 if priority_level is not None else 0)
+        self.metrics = HandlerMetrics(encode_threads=sender_threads)
+        self.flush_timeout = flush_timeout
+        self.batch_size = max(1, batch_size)
+        self.batch_endpoint = batch_endpoint or self.api_endpoint.rstrip('/') + '/batch'
+        # Cleared when the server turns out not to have the batch endpoint
+        self._batch_supported = True
+        # Cleared when the server cannot decode the Content-Encoding
+        self._content_encoding, self._compress = get_compressor(compression) if compression else (None, None)
+        if wire_format not in WIRE_FORMATS:
+            raise ValueError(f"wire_format must be one of {', '.join(WIRE_FORMATS)}, got {wire_format!r}")
+        # Only batches are packed; cleared when the server does not take MessagePack
+        self._msgpack = None
+        if wire_format == WIRE_MSGPACK and self.batch_size > 1 and msgpack is not None:
+            self._msgpack = MsgpackEncoder()
+
+        # Shared by every thread sending through this handler
+        self.circuit = None
+        if circuit_failure_threshold > 0:
+            self.circuit = CircuitBreaker(failure_threshold=circuit_failure_threshold,
+                                          backoff_base=self.retry_delay,
+                                          backoff_max=circuit_max_open,
+                                          probe=self._probe_health)
+        # The spool keeps undelivered records itself
+        self.fallback = None if spool_dir else Fallback(fallback, path=fallback_path,
+                                                        buffer_size=fallback_buffer_size)
+        self._replay_lock = threading.Lock()
 
         # Create a requests session for potential connection pooling and default headers
-        self.session = requests.Session()
-        self.session.verify = self.verify_ssl
-        # Set auth if provided
-        if self.auth:
-            if isinstance(self.auth, dict):
-                # Assume it's a header dictionary
-                self.session.headers.update(self.auth)
-            elif isinstance(self.auth, tuple) and len(self.auth) == 2:
-                # Assume it's basic auth (user, pass)
-                self.session.auth = self.auth
-            elif callable(self.auth):
-                # Defer auth handling to the callable during request
-                pass # Handled in _send_log
-            else:
-                self.handleError(None, "Invalid auth type provided. Must be tuple, dict, or callable.")
+        # One connection per sender thread, plus one for health checks
+        self.session = create_session(self.auth, self.verify_ssl,
+                                      error_func=lambda msg: self.handleError(None, msg),
+                                      pool_maxsize=sender_threads + 1)
+
+        # Optional pre-send stage dropping storms before they are formatted
+        self.suppressor = None
+        if rate_limit is not None or sample_rates or collapse_window:
+            self.suppressor = LogSuppressor(rate_limit=rate_limit, rate_burst=rate_burst,
+                                            sample_rates=sample_rates, collapse_window=collapse_window,
+                                            format_timestamp=self._serializer.format_timestamp)
+
+        # Optional stage keeping low-level records until an error needs them
+        self.recorder = None
+        if flight_recorder_size > 0:
+            self.recorder = FlightRecorder(flight_recorder_size, level=flight_recorder_level,
+                                           trigger_level=flight_recorder_trigger,
+                                           scope=flight_recorder_scope, max_buffers=flight_recorder_buffers)
+
+        # Optional background sender, so emit() never waits on the network
+        self._sender = None
+        self._priority_sender = None
+        sender_options = dict(
+            queue_size=queue_size,
+            overflow_policy=overflow_policy,
+            block_timeout=flush_timeout,
+            error_func=lambda msg: self.handleError(None, msg),
+        )
+        if self.batch_size > 1:
+            send_func = self._send_batch
+            sender_options.update(
+                batch_size=self.batch_size,
+                batch_max_bytes=batch_max_bytes,
+                batch_linger=batch_linger,
+                prepare_func=self._encode,
+            )
+        elif spool_dir:
+            send_func = self._send_encoded
+            sender_options.update(prepare_func=self._encode)
+        else:
+            send_func = self._send_log
 
+        if spool_dir:
+            spool = DiskSpool(spool_dir, segment_bytes=spool_segment_bytes,
+                              max_bytes=spool_max_bytes, eviction=spool_eviction)
+            self._sender = SpoolingSender(send_func, spool, **sender_options)
+        elif self.workers > 1:
+            self._sender = ParallelSender(send_func, workers=self.workers, **sender_options)
+        elif self.batch_size > 1 or background or defer_format or priority_level is not None:
+            self._sender = BackgroundSender(send_func, **sender_options)
+
+        if priority_level is not None:
+            lane = self._lane
+
+            def send_priority(item):
+                lane.retry_attempts = self.priority_retry_attempts
+                return send_func(item)
+
+            sender_options.update(queue_size=priority_queue_size, name="LogAggregatorPrioritySender")
+            if self.batch_size > 1:
+                # Send what is queued right away instead of waiting for a fuller batch
+                sender_options.update(batch_linger=0.0)
+            self._priority_sender = BackgroundSender(send_priority, **sender_options)
+
+        # Previous handlers of the exit_signals, restored by close()
+        self._previous_signal_handlers = {}
+        if exit_signals:
+            if threading.current_thread() is threading.main_thread():
+                for signum in exit_signals:
+                    self._previous_signal_handlers[signum] = signal.signal(signum, self._on_exit_signal)
+            else:
+                self.handleError(None, "exit_signals ignored: signal handlers can only be installed from the main thread")
 
     def format_record(self, record: logging.LogRecord) -> dict:
         """
         Format the log record into a dictionary suitable for JSON serialization.
         """
-        log_entry = {
-            "timestamp": self.format_timestamp(record.created),
-            "level": self.level_map.get(record.levelno, record.levelname),
-            "message": self.format(record), # Use formatter if set, else raw message
-            "host": self.host,
-            "host_process": record.name, # Use logger name as host_process
-            "logger_name": record.name,
-            "module": record.module,
-            "filename": record.filename,
-            "lineno": record.lineno,
-            "funcName": record.funcName,
-            "process": record.process,
-            "thread": record.thread,
-            "threadName": record.threadName,
-        }
+        return self._serializer.to_dict(record, self.format(record)) # Use formatter if set, else raw message
 
-        # Include exception information if available
-        if record.exc_info:
-            log_entry["exception"] = "".join(
-                traceback.format_exception(*record.exc_info)
-            )
-        elif record.exc_text:
-             log_entry["exception"] = record.exc_text
-
-        # Include extra attributes
-        extra_attrs = {
-            key: record.__dict__[key]
-            for key in record.__dict__
-            if key not in log_entry and key not in (
-                'args', 'asctime', 'created', 'exc_info', 'exc_text', 'levelno',
-                'levelname', 'message', 'module', 'msecs', 'msg', 'name',
-                'pathname', 'process', 'processName', 'relativeCreated',
-                'stack_info', 'thread', 'threadName', 'filename', 'lineno', 'funcName'
-            )
-        }
-        if extra_attrs:
-            log_entry["extra"] = extra_attrs
+    def capture_record(self, record: logging.LogRecord) -> CapturedRecord:
+        """
+        Snapshot the record for format_captured(), see the defer_format option.
+        """
+        # A formatter with its own formatException() must see exc_info
+        formatter = self.formatter
+        capture_traceback = formatter is None or type(formatter).formatException is logging.Formatter.formatException
+        return capture_record(record, capture_traceback)
 
-        return log_entry
+    def format_captured(self, captured: CapturedRecord) -> dict:
+        """
+        Format a record snapshot from capture_record(); the result is the one
+        format_record() gives for the original record.
+        """
+        exception = captured.render_traceback()
+        return self._serializer.to_dict(captured.record, self.format(captured.record), exception)
 
     def format_timestamp(self, timestamp: float) -> str:
         """
         Format UNIX timestamp to ISO 8601 string.
         """
-        dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
-        return dt.isoformat(timespec='microseconds')
+        return self._serializer.format_timestamp(timestamp)
 
     def emit(self, record: logging.LogRecord):
         """
         Format the record and send it to the API endpoint.
-        Handles retries on network errors.
+        Handles retries on network errors. In background mode the record is
+        only queued; the sender thread does the sending. Records dropped by
+        rate limiting, sampling or collapsing, or kept by the flight recorder,
+        are not formatted.
+        """
+        recorder = self.recorder
+        if recorder is not None:
+            try:
+                if record.levelno < recorder.level:
+                    recorder.record(record)
+                    return
+                if record.levelno >= recorder.trigger_level:
+                    record = self._ship_recorded(record)
+            except Exception:
+                self.handleError(record)
+                return
+        if self.suppressor is None:
+            self._emit(record)
+            return
+        for item in self.suppressor.filter(record):
+            self._emit(item)
+
+    def _ship_recorded(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Send the records the flight recorder kept before a triggering record.
+        Returns the record to send after them: a copy carrying their correlation id.
+        """
+        recorded, correlation_id = self.recorder.take(record)
+        if not recorded:
+            return record
+        sender = self._sender_for(record)
+        for captured in recorded:
+            if sender is not None:
+                sender.put(captured, key=record.name)
+            else:
+                self._send_log(captured)
+        linked = type(record).__new__(type(record))
+        linked.__dict__.update(record.__dict__)
+        setattr(linked, CORRELATION_FIELD, correlation_id)
+        return linked
+
+    def _sender_for(self, record: logging.LogRecord):
+        """
+        The background sender of a record's lane, None when sending on the calling thread.
+        """
+        if self._priority_sender is not None and record.levelno >= self.priority_level:
+            return self._priority_sender
+        return self._sender
+
+    def _release_collapsed(self):
+        """
+        Send the records held back by duplicate collapsing.
+        """
+        if self.suppressor is not None:
+            for item in self.suppressor.drain():
+                self._emit(item)
+
+    def _emit(self, record: logging.LogRecord):
+        """
+        Format and send (or queue) a record that passed the suppression stage.
         """
         try:
-            log_data = self.format_record(record)
-            self._send_log(log_data)
+            started = time.perf_counter()
+            if self.defer_format:
+                log_data = self.capture_record(record)
+            else:
+                log_data = self.format_record(record)
+            self.metrics.emitted(time.perf_counter() - started)
+            sender = self._sender_for(record)
+            if sender is not None:
+                sender.put(log_data, key=record.name)
+            else:
+                self._send_log(log_data)
         except Exception:
             self.handleError(record) # Default handler logs to stderr
 
-    def _send_log(self, log_data: dict):
+    def forward(self, payload: bytes, key=None):
+        """
+        Send (or queue) a record that was formatted and encoded elsewhere,
+        e.g. by an AgentHandler in another process.
+
+        :param key: Records with the same key are sent in order when there are several
+                    workers, e.g. those of one process. None keeps all of them in order.
+        """
+        if self._sender is not None:
+            self._sender.put(payload, key=key)
+        else:
+            self._send_encoded(payload)
+
+    def _encode(self, log_data) -> bytes:
+        """
+        Encode a formatted (or, with defer_format, captured) record to a JSON request body.
+        """
+        if isinstance(log_data, bytes):
+            return log_data # Already encoded, see forward()
+        started = time.perf_counter()
+        if isinstance(log_data, CapturedRecord):
+            log_data = self.format_captured(log_data)
+        packer = self._msgpack
+        payload = packer.pack(log_data) if packer is not None else self._serializer.encode(log_data)
+        self.metrics.encoded(time.perf_counter() - started)
+        return payload
+
+    def _send_log(self, log_data: dict) -> bool:
         """
         Internal method to send the formatted log data with retry logic.
         """
-        headers = {'Content-Type': 'application/json'}
-        auth = self.session.auth # Use session auth if set (e.g., basic)
-        request_headers = self.session.headers.copy() # Start with session headers
+        return self._send_encoded(self._encode(log_data))
 
-        # Handle callable auth - call it to get dynamic headers/auth
-        if callable(self.auth):
-            try:
-                auth_result = self.auth()
-                if isinstance(auth_result, dict):
-                    request_headers.update(auth_result) # Update headers
-                    auth = None # Clear basic auth if headers are provided
-                elif isinstance(auth_result, tuple):
-                    auth = auth_result # Use tuple as basic auth
-                # else: ignore invalid result from callable
-            except Exception as e:
-                 self.handleError(None, f"Auth callable failed: {e}")
-                 return # Don't proceed if auth fails
+    def _send_encoded(self, payload: bytes) -> bool:
+        """
+        Send one encoded record. Returns False if it should be sent again later.
+        """
+        return self._delivered(self._post_each([payload]))
 
+    def _send_batch(self, payloads: list) -> bool:
+        """
+        Send a list of encoded records in one request to the batch endpoint.
+        Falls back to one request per record if the server has no batch endpoint.
+        Returns False if the records should be sent again later.
+        """
+        return self._delivered(self._post_batch(payloads))
+
+    def _post_batch(self, payloads: list) -> list:
+        """
+        POST encoded records to the batch endpoint. Returns the records not delivered.
+        """
+        if self._batch_supported:
+            packer = self._msgpack
+            response = None
+            if packer is not None:
+                response = self._post(self.batch_endpoint, packer.batch(payloads), content_type=MSGPACK_CONTENT_TYPE,
+                                      passthrough_statuses=BATCH_UNSUPPORTED_STATUSES + (415,))
+                if response is not None and response.status_code == 415:
+                    # Server without MessagePack support: send JSON from now on
+                    self._msgpack = None
+                    self.handleError(None, "Server rejected MessagePack batches, sending JSON")
+            if self._msgpack is None:
+                payloads = self._as_json(payloads)
+                if self._compress is not None:
+                    body = b"\n".join(payloads) + b"\n"
+                    content_type = 'application/x-ndjson'
+                else:
+                    body = b"[" + b",".join(payloads) + b"]"
+                    content_type = 'application/json'
+                response = self._post(self.batch_endpoint, body, content_type=content_type,
+                                      passthrough_statuses=BATCH_UNSUPPORTED_STATUSES)
+            if response is None:
+                return payloads
+            if response.status_code not in BATCH_UNSUPPORTED_STATUSES:
+                rejected = self._check_batch_response(response, len(payloads)) if response.ok else len(payloads)
+                self.metrics.records(sent=len(payloads) - rejected, rejected=rejected)
+                return []
+            # Older server without /api/logs/batch: switch to single posts for good
+            self._batch_supported = False
+
+        return self._post_each(payloads)
+
+    def _post_each(self, payloads: list) -> list:
+        """
+        POST encoded records one request each. Returns the records not delivered.
+        """
+        payloads = self._as_json(payloads)
+        undelivered = []
+        sent = rejected = 0
+        for payload in payloads:
+            response = self._post(self.api_endpoint, payload)
+            if response is None:
+                undelivered.append(payload)
+            elif response.ok:
+                sent += 1
+            else:
+                rejected += 1
+        self.metrics.records(sent=sent, rejected=rejected)
+        return undelivered
+
+    def _delivered(self, undelivered: list) -> bool:
+        """
+        Hand undelivered records to the fallback (unless spooling, the spool keeps them),
+        or replay buffered records once requests go through again.
+        """
+        if undelivered:
+            self.metrics.records(failed=len(undelivered))
+            if self.fallback is not None:
+                self.fallback.store(self._as_json(undelivered))
+            return False
+        self._replay_fallback()
+        return True
+
+    def _as_json(self, payloads: list) -> list:
+        """
+        Records packed for MessagePack batches, re-encoded as JSON.
+        """
+        if self._msgpack is None and not any(is_packed(payload) for payload in payloads):
+            return payloads
+        return [self._serializer.encode(unpack_record(payload)) if is_packed(payload) else payload
+                for payload in payloads]
+
+    def _replay_fallback(self):
+        """
+        Send the records kept by the "buffer" fallback, oldest first.
+        """
+        fallback = self.fallback
+        if fallback is None or not len(fallback) or not self._replay_lock.acquire(blocking=False):
+            return
+        try:
+            while len(fallback):
+                payloads = fallback.take(self.batch_size)
+                undelivered = self._post_batch(payloads) if self.batch_size > 1 else self._post_each(payloads)
+                if undelivered:
+                    fallback.putback(undelivered)
+                    break
+        finally:
+            self._replay_lock.release()
+
+    def _check_batch_response(self, response, count: int):
+        """
+        Report records the batch endpoint rejected individually. Returns their number.
+        """
+        try:
+            result = response.json()
+        except ValueError:
+            return 0
+        failed = result.get("failed", 0) if isinstance(result, dict) else 0
+        if failed:
+            errors = [item["error"] for item in result.get("results", []) if isinstance(item, dict) and "error" in item]
+            first_error = errors[0] if errors else 'N/A'
+            self.handleError(None, f"Batch endpoint rejected {failed} of {count} records. First error: {first_error}")
+        return failed
+
+    def _request_auth(self):
+        """
+        Resolve the headers and basic auth to use for a request.
+        Calls the auth callable, if one was configured.
+        """
+        return request_auth(self.session, self.auth)
+
+    def _post(self, url: str, body: bytes, content_type: str = 'application/json', passthrough_statuses=()):
+        """
+        POST an encoded body, compressed if configured, with retry logic.
+
+        :param passthrough_statuses: Status codes returned to the caller without
+                                     being treated as errors.
+        :return: The response once the server has answered for good (2xx, 4xx or a
+                 passthrough status), None if the request failed and may be retried later.
+        """
+        compress = self._compress
+        if compress is None:
+            return self._post_with_retry(url, body, {'Content-Type': content_type}, passthrough_statuses)
+
+        headers = {'Content-Type': content_type, 'Content-Encoding': self._content_encoding}
+        response = self._post_with_retry(url, compress(body), headers, passthrough_statuses + (415,))
+        if response is None or response.status_code != 415:
+            return response
+
+        # The server rejected the Content-Encoding or the Content-Type: resend uncompressed to tell which
+        response = self._post_with_retry(url, body, {'Content-Type': content_type}, passthrough_statuses)
+        if response is not None and response.status_code != 415:
+            # Server cannot decode this Content-Encoding: send uncompressed from now on
+            self._compress = None
+            self.handleError(None, f"Server rejected Content-Encoding {self._content_encoding}, sending uncompressed")
+        return response
+
+    def _post_with_retry(self, url: str, data: bytes, headers: dict, passthrough_statuses=()):
+        """
+        POST a request body as-is, retrying on network errors and 5xx responses.
+        Nothing is sent while the circuit is open.
+        """
+        circuit = self.circuit
+        if circuit is not None and not circuit.allow_request():
+            return None
+
+        try:
+            request_headers, auth = self._request_auth()
+        except Exception as e:
+            self.handleError(None, f"Auth callable failed: {e}")
+            return None # Don't proceed if auth fails
+        request_headers.update(headers)
+
+        # The priority lane's sender thread has a retry budget of its own
+        retry_attempts = getattr(self._lane, "retry_attempts", self.retry_attempts)
         current_retry = 0
-        while current_retry <= self.retry_attempts:
+        while current_retry <= retry_attempts:
+            started = time.perf_counter()
             try:
                 response = self.session.post(
-                    self.api_endpoint,
-                    json=log_data,
+                    url,
+                    data=data,
                     headers=request_headers,
                     auth=auth, # Pass auth tuple if applicable
                     timeout=self.timeout
                 )
+                if response.status_code in passthrough_statuses:
+                    self.metrics.request(time.perf_counter() - started, len(data), True)
+                    if circuit is not None:
+                        circuit.record_success()
+                    return response
                 # Raise HTTPError for bad responses (4xx or 5xx)
                 response.raise_for_status()
                 # Log sent successfully
-                return
+                self.metrics.request(time.perf_counter() - started, len(data), True)
+                if circuit is not None:
+                    circuit.record_success()
+                return response
 
             except requests.exceptions.Timeout as e:
                 error_msg = f"Request timed out after {self.timeout}s: {e}"
@@ -204,18 +652,56 @@ class LogAggregatorHandler(logging.Handler):
                 error_msg = f"Request failed: {e} (Status: {status_code}, Response: {response_text[:200]})"
                 # Don't retry on client errors (4xx) or likely persistent server errors (unless configured)
                 if e.response is not None and 400 <= e.response.status_code < 500:
+                     self.metrics.request(time.perf_counter() - started, len(data), True)
+                     if circuit is not None:
+                         circuit.record_success() # The server is up, the request is wrong
                      self.handleError(None, error_msg) # Log error but don't retry 4xx
-                     return
+                     return e.response
 
             # If we reached here, it's a potentially retryable error
+            self.metrics.request(time.perf_counter() - started, len(data), False)
+            if circuit is not None:
+                circuit.record_failure()
+                if circuit.state == STATE_OPEN:
+                    # Stop hammering the API; records go to the fallback until a health probe passes
+                    self.handleError(None, f"Circuit open after repeated failures, not sending until {health_url_for(self.api_endpoint)} answers. Last error: {error_msg}")
+                    break
             current_retry += 1
-            if current_retry <= self.retry_attempts:
-                time.sleep(self.retry_delay * (current_retry)) # Simple exponential backoff
-                # Optionally log retry attempt here if needed
+            if current_retry <= retry_attempts:
+                time.sleep(backoff_delay(current_retry, self.retry_delay, self.retry_max_delay))
+                self.metrics.retried()
             else:
                 # Max retries reached, handle final error
-                self.handleError(None, f"Failed to send log after {self.retry_attempts + 1} attempts. Last error: {error_msg}")
+                self.handleError(None, f"Failed to send log after {retry_attempts + 1} attempts. Last error: {error_msg}")
                 break # Exit loop
+        return None
+
+    def _get_health(self):
+        """
+        GET the API's health endpoint. Raises for errors and non-2xx responses.
+        """
+        # Construct health check URL relative to the main API endpoint
+        health_url = health_url_for(self.api_endpoint)
+
+        request_headers, auth = self._request_auth()
+
+        response = self.session.get(
+            health_url,
+            timeout=self.timeout,
+            headers=request_headers,
+            auth=auth,
+        )
+        response.raise_for_status() # Check for 2xx status
+
+    def _probe_health(self) -> bool:
+        """
+        Health probe of the circuit breaker; quiet, since it runs repeatedly during an outage.
+        """
+        try:
+            self._get_health()
+            return True
+        except Exception:
+            return False
 
     def check_connection(self) -> bool:
         """
@@ -223,28 +709,7 @@ class LogAggregatorHandler(logging.Handler):
         Assumes health endpoint is '/api/health' relative to api_endpoint base.
         """
         try:
-            # Construct health check URL relative to the main API endpoint
-            # Assumes api_endpoint might be 'http://host/api/logs', we want 'http://host/api/health'
-            base_url = self.api_endpoint.rsplit('/', 1)[0] # Get base path
-            health_url = urljoin(base_url + '/', 'health') # Join robustly
-
-            auth = self.session.auth
-            request_headers = self.session.headers.copy()
-            if callable(self.auth):
-                 auth_result = self.auth()
-                 if isinstance(auth_result, dict):
-                     request_headers.update(auth_result)
-                     auth = None
-                 elif isinstance(auth_result, tuple):
-                     auth = auth_result
-
-            response = self.session.get(
-                health_url,
-                timeout=self.timeout,
-                headers=request_headers,
-                auth=auth,
-            )
-            response.raise_for_status() # Check for 2xx status
+            self._get_health()
             return True
         except requests.exceptions.RequestException as e:
             status_code = e.response.status_code if e.response is not None else 'N/A'
@@ -254,6 +719,51 @@ class LogAggregatorHandler(logging.Handler):
             self.handleError(None, f"Health check failed with unexpected error: {e}")
             return False
 
+    def stats(self) -> dict:
+        """
+        Snapshot of the handler's counters, histograms and queue gauges.
+
+        - records: emitted (formatted), sent (taken by the server), rejected (refused
+          for good, e.g. 4xx) and failed (not delivered; they went to the fallback or
+          stay in the spool)
+        - dropped / suppressed: records lost or held back, by reason
+        - requests: answered and failed attempts, retries, body bytes sent, UNIX time
+          of the last success and failure
+        - request_seconds, format_seconds, encode_seconds: histograms
+        - queue: in-memory queue depth and capacity (both lanes), the priority lane's
+          depth, spool and fallback backlog
+        - circuit: circuit breaker state and trips, or None without a breaker
+        - flight_recorder: records buffered, overwritten in full buffers, dropped with
+          evicted buffers, shipped with triggering records, triggers, records and
+          buffers held now; None without it
+        """
+        stats = self.metrics.snapshot()
+        senders = self._senders()
+        spool = getattr(self._sender, "spool", None)
+        stats["dropped"] = {
+            "queue_full": sum(sender.dropped for sender in senders),
+            "spool_evicted": spool.evicted_records if spool is not None else 0,
+            "fallback": self.fallback.dropped if self.fallback is not None else 0,
+        }
+        stats["suppressed"] = self.suppressor.counters() if self.suppressor is not None else {}
+        stats["queue"] = {
+            "depth": self._queued(),
+            "capacity": sum(sender.capacity for sender in senders),
+            "priority_depth": self._priority_sender.qsize() if self._priority_sender is not None else 0,
+            "spool_pending_bytes": spool.pending_bytes() if spool is not None else None,
+            "fallback_buffered": len(self.fallback) if self.fallback is not None else 0,
+        }
+        circuit = self.circuit
+        stats["circuit"] = {"state": circuit.state, "trips": circuit.trips} if circuit is not None else None
+        stats["flight_recorder"] = self.recorder.counters() if self.recorder is not None else None
+        return stats
+
+    def prometheus_text(self, prefix: str = DEFAULT_PREFIX, labels: dict = None) -> str:
+        """
+        The stats() snapshot in the Prometheus text exposition format.
+        """
+        return render_prometheus(self.stats(), prefix=prefix, labels=labels)
+
     def handleError(self, record, message=None):
         """
         Handle errors during logging.
@@ -290,10 +800,84 @@ class LogAggregatorHandler(logging.Handler):
         if ei and ei[0]:
             del ei # Avoid dangling references
 
+    def _senders(self) -> list:
+        """
+        The background senders, priority lane first.
+        """
+        return [sender for sender in (self._priority_sender, self._sender) if sender is not None]
+
+    def _queued(self) -> int:
+        return sum(sender.qsize() for sender in self._senders())
+
+    def _drain(self, close: bool) -> bool:
+        """
+        Wait for the priority lane, then the other records, to be sent (and the
+        sender threads to stop if close is True), all within flush_timeout seconds.
+        """
+        deadline = time.monotonic() + self.flush_timeout
+        drained = True
+        for sender in self._senders():
+            remaining = max(0.0, deadline - time.monotonic())
+            drained = (sender.close(remaining) if close else sender.flush(remaining)) and drained
+        return drained
+
+    def _exit_flush(self):
+        self._release_collapsed()
+        self._drain(close=False)
+
+    def _on_exit_signal(self, signum, frame):
+        """
+        Handler of the exit_signals: send what is queued, then hand the signal on
+        to the handler it had before, or let it do what it does by default.
+
+        It runs on the main thread between two bytecodes, possibly while that thread
+        holds the suppressor's or a queue's lock, so it takes no lock itself: a
+        thread of its own sends the records, waited for at most flush_timeout seconds.
+        """
+        flusher = threading.Thread(target=self._exit_flush, name="LogAggregatorExitFlush", daemon=True)
+        flusher.start()
+        flusher.join(self.flush_timeout)
+        if flusher.is_alive():
+            self.handleError(None, f"Exit flush timed out after {self.flush_timeout}s")
+        previous = self._previous_signal_handlers.get(signum)
+        if callable(previous):
+            previous(signum, frame)
+        elif previous != signal.SIG_IGN:
+            # Default action, e.g. terminate: deliver the signal again without us in the way
+            signal.signal(signum, signal.SIG_DFL)
+            os.kill(os.getpid(), signum)
+
+    def _restore_signal_handlers(self):
+        for signum, previous in self._previous_signal_handlers.items():
+            try:
+                if signal.getsignal(signum) == self._on_exit_signal:
+                    signal.signal(signum, previous if previous is not None else signal.SIG_DFL)
+            except ValueError:
+                pass # Not on the main thread; the handler stays, and only flushes a closed handler
+        self._previous_signal_handlers = {}
+
+    def flush(self):
+        """
+        Wait for queued records to be sent, priority records first, up to flush_timeout seconds.
+        """
+        self._release_collapsed()
+        if not self._drain(close=False):
+            self.handleError(None, f"Flush timed out after {self.flush_timeout}s with {self._queued()} records queued")
+
     def close(self):
         """
         Close the handler, releasing resources (e.g., closing the session).
+        In background mode, queued records are drained first (up to flush_timeout seconds),
+        priority records before the others.
         """
+        self._restore_signal_handlers()
+        self._release_collapsed()
+        if not self._drain(close=True):
+            self.handleError(None, f"Close timed out after {self.flush_timeout}s with {self._queued()} records queued")
+        if self.fallback is not None:
+            if len(self.fallback):
+                self.handleError(None, f"Closing with {len(self.fallback)} buffered records not delivered")
+            self.fallback.close()
         self.session.close()
         super().close()
 
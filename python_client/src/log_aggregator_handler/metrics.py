@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SERIALIZE_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+
+DEFAULT_PREFIX = "log_aggregator"
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with Prometheus semantics (a bucket counts values <= its bound).
+    """
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        """
+        Cumulative bucket counts keyed by upper bound, plus sum and count.
+        """
+        buckets = {}
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            buckets[bound] = total
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+class HandlerMetrics:
+    """
+    Counters and histograms a handler updates while it works.
+
+    Request and record outcome updates take a lock. The per-record updates,
+    emitted() and encoded(), do not: they run under the handler lock that
+    logging holds around emit(), or on the single sender thread, so they cost
+    no more than a bisect and a few integer operations. With several sender
+    threads (encode_threads > 1) encoded() takes the lock as well.
+    """
+    def __init__(self, encode_threads: int = 1):
+        self.encode_threads = encode_threads
+        self.records_sent = 0
+        self.records_rejected = 0
+        self.records_failed = 0
+        self.requests_sent = 0
+        self.requests_failed = 0
+        self.requests_retried = 0
+        self.bytes_sent = 0
+        self.last_success = None
+        self.last_failure = None
+        self.request_seconds = Histogram(REQUEST_BUCKETS)
+        self.format_seconds = Histogram(SERIALIZE_BUCKETS)
+        self.encode_seconds = Histogram(SERIALIZE_BUCKETS)
+        self._lock = threading.Lock()
+
+    def emitted(self, format_seconds: float):
+        """
+        A record was formatted (or, with defer_format, captured) by emit().
+        Its count is the number of records emitted.
+        """
+        histogram = self.format_seconds
+        histogram.counts[bisect.bisect_left(histogram.bounds, format_seconds)] += 1
+        histogram.sum += format_seconds
+        histogram.count += 1
+
+    def encoded(self, seconds: float):
+        """
+        A record was encoded to JSON.
+        """
+        if self.encode_threads > 1:
+            with self._lock:
+                self.encode_seconds.observe(seconds)
+            return
+        histogram = self.encode_seconds
+        histogram.counts[bisect.bisect_left(histogram.bounds, seconds)] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+
+    def request(self, seconds: float, body_bytes: int, answered: bool):
+        """
+        A request attempt finished; answered is False for network errors, timeouts and 5xx.
+        """
+        with self._lock:
+            self.request_seconds.observe(seconds)
+            if answered:
+                self.requests_sent += 1
+                self.bytes_sent += body_bytes
+                self.last_success = time.time()
+            else:
+                self.requests_failed += 1
+                self.last_failure = time.time()
+
+    def retried(self):
+        with self._lock:
+            self.requests_retried += 1
+
+    def records(self, sent: int = 0, rejected: int = 0, failed: int = 0):
+        """
+        Records taken by the server, rejected by it for good, or not delivered.
+        """
+        with self._lock:
+            self.records_sent += sent
+            self.records_rejected += rejected
+            self.records_failed += failed
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "records": {
+                    "emitted": self.format_seconds.count,
+                    "sent": self.records_sent,
+                    "rejected": self.records_rejected,
+                    "failed": self.records_failed,
+                },
+                "requests": {
+                    "sent": self.requests_sent,
+                    "failed": self.requests_failed,
+                    "retried": self.requests_retried,
+                    "bytes_sent": self.bytes_sent,
+                    "last_success": self.last_success,
+                    "last_failure": self.last_failure,
+                },
+                "request_seconds": self.request_seconds.snapshot(),
+                "format_seconds": self.format_seconds.snapshot(),
+                "encode_seconds": self.encode_seconds.snapshot(),
+            }
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _families(stats: dict):
+    # (name, type, help, [(suffix, labels, value)]) for one stats() snapshot
+    records = stats["records"]
+    yield ("records_total", "counter", "Log records by outcome.",
+           [("", {"outcome": outcome}, records[outcome]) for outcome in ("emitted", "sent", "rejected", "failed")])
+    yield ("records_dropped_total", "counter", "Log records dropped, by reason.",
+           [("", {"reason": reason}, count) for reason, count in stats["dropped"].items()])
+    yield ("records_suppressed_total", "counter", "Log records held back by storm suppression, by reason.",
+           [("", {"reason": reason}, count) for reason, count in stats["suppressed"].items()])
+
+    requests = stats["requests"]
+    yield ("requests_total", "counter", "HTTP request attempts by outcome.",
+           [("", {"outcome": "answered"}, requests["sent"]), ("", {"outcome": "failed"}, requests["failed"])])
+    yield ("requests_retried_total", "counter", "HTTP request attempts that were retries.",
+           [("", {}, requests["retried"])])
+    yield ("sent_bytes_total", "counter", "Request body bytes the server answered.",
+           [("", {}, requests["bytes_sent"])])
+    yield ("last_success_timestamp_seconds", "gauge", "UNIX time of the last answered request.",
+           [("", {}, requests["last_success"])])
+    yield ("last_failure_timestamp_seconds", "gauge", "UNIX time of the last failed request.",
+           [("", {}, requests["last_failure"])])
+
+    for name, help_text in (("request_seconds", "HTTP request attempt latency."),
+                            ("format_seconds", "Time to format a record on the logging thread."),
+                            ("encode_seconds", "Time to encode a record to JSON.")):
+        histogram = stats[name]
+        samples = [("_bucket", {"le": _format_value(bound)}, count) for bound, count in histogram["buckets"].items()]
+        samples.append(("_sum", {}, histogram["sum"]))
+        samples.append(("_count", {}, histogram["count"]))
+        yield (name, "histogram", help_text, samples)
+
+    queue = stats["queue"]
+    yield ("queue_depth", "gauge", "Records waiting in memory to be sent.", [("", {}, queue["depth"])])
+    yield ("queue_capacity", "gauge", "Maximum records waiting in memory.", [("", {}, queue["capacity"])])
+    yield ("priority_queue_depth", "gauge", "Priority lane records waiting in memory to be sent.",
+           [("", {}, queue["priority_depth"])])
+    yield ("spool_pending_bytes", "gauge", "Spool bytes not yet acknowledged.", [("", {}, queue["spool_pending_bytes"])])
+    yield ("fallback_buffered", "gauge", "Records held by the buffer fallback.", [("", {}, queue["fallback_buffered"])])
+
+    recorder = stats.get("flight_recorder")
+    if recorder is not None:
+        yield ("flight_recorder_records_total", "counter", "Records taken by the flight recorder, by outcome.",
+               [("", {"outcome": outcome}, recorder[outcome]) for outcome in ("buffered", "overwritten", "evicted", "shipped")])
+        yield ("flight_recorder_triggers_total", "counter", "Records that shipped the flight recorder's records.",
+               [("", {}, recorder["triggers"])])
+        yield ("flight_recorder_held", "gauge", "Records held by the flight recorder.", [("", {}, recorder["held"])])
+
+    circuit = stats["circuit"]
+    if circuit is not None:
+        yield ("circuit_open", "gauge", "1 while the circuit breaker is open or half-open.",
+               [("", {}, int(circuit["state"] != "closed"))])
+        yield ("circuit_trips_total", "counter", "Times the circuit breaker opened.", [("", {}, circuit["trips"])])
+
+
+def render_prometheus(stats, prefix: str = DEFAULT_PREFIX, labels: dict = None) -> str:
+    """
+    Render stats() snapshots in the Prometheus text exposition format.
+
+    :param stats: A snapshot returned by LogAggregatorHandler.stats(), or a list of
+                  (labels, snapshot) pairs to export several handlers at once.
+    :param prefix: Metric name prefix. Defaults to "log_aggregator".
+    :param labels: Labels added to every sample of a single snapshot, e.g. {"handler": "app"}.
+    """
+    series = stats if isinstance(stats, list) else [(labels or {}, stats)]
+    families = {}
+    for series_labels, snapshot in series:
+        for name, kind, help_text, samples in _families(snapshot):
+            family = families.setdefault(name, (kind, help_text, []))
+            family[2].extend((suffix, dict(series_labels, **sample_labels), value)
+                             for suffix, sample_labels, value in samples)
+
+    lines = []
+    for name, (kind, help_text, samples) in families.items():
+        full_name = f"{prefix}_{name}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        for suffix, sample_labels, value in samples:
+            if value is not None:
+                lines.append(f"{full_name}{suffix}{_format_labels(sample_labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        handlers = self.server.handlers
+        series = [({"handler": handler.get_name() or str(index)}, handler.stats())
+                  for index, handler in enumerate(handlers)]
+        body = render_prometheus(series, prefix=self.server.prefix).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_prometheus_server(handlers, port: int = 9464, addr: str = "127.0.0.1", prefix: str = DEFAULT_PREFIX):
+    """
+    Serve the stats of the given handlers on http://addr:port/metrics from a daemon thread.
+
+    Samples carry a "handler" label: the handler's name (see logging.Handler.set_name)
+    or its position in handlers.
+
+    :return: The HTTP server; call shutdown() on it to stop serving.
+    """
+    server = ThreadingHTTPServer((addr, port), _MetricsRequestHandler)
+    server.daemon_threads = True
+    server.handlers = list(handlers)
+    server.prefix = prefix
+    threading.Thread(target=server.serve_forever, name="LogAggregatorMetrics", daemon=True).start()
+    return server
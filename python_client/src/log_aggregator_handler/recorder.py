@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import uuid
+
+from .serializer import CapturedRecord, capture_record, must_render_message
+
+# What a ring buffer is kept for
+RECORDER_PER_THREAD = "thread"
+RECORDER_PER_LOGGER = "logger"
+RECORDER_SCOPES = (RECORDER_PER_THREAD, RECORDER_PER_LOGGER)
+
+# Extra field linking a triggering record and the records shipped with it
+CORRELATION_FIELD = "flight_recorder_id"
+
+
+class FlightRecorder:
+    """
+    Keeps the most recent low-level records in memory and hands them over when
+    a record at or above ``trigger_level`` arrives, instead of shipping them.
+
+    There is one ring buffer of ``size`` records per thread, or per logger,
+    and at most ``max_buffers`` of them; the least recently used buffer is
+    dropped to make room for a new one, and its records are counted as
+    evicted. A buffer holds the LogRecords themselves, nothing is
+    formatted or copied: a record's attributes are what a copy of its raw
+    fields would reference anyway. Only a record whose message could still
+    change, or which holds an exception and with it the frames of its
+    traceback, is replaced by a snapshot, as with capture_record(). take()
+    hands the records over as CapturedRecords, formatted when they are shipped.
+
+    record() and take() are called under the handler lock, like emit().
+    """
+    def __init__(self, size: int,
+                 level: int = logging.INFO,
+                 trigger_level: int = logging.ERROR,
+                 scope: str = RECORDER_PER_THREAD,
+                 max_buffers: int = 256):
+        """
+        :param size: Records kept per buffer.
+        :param level: Records below this level are buffered instead of shipped. Defaults to INFO.
+        :param trigger_level: Records at or above this level ship their buffer. Defaults to ERROR.
+        :param scope: "thread" (one buffer per thread) or "logger". Defaults to "thread".
+        :param max_buffers: Maximum number of buffers. Defaults to 256.
+        """
+        if scope not in RECORDER_SCOPES:
+            raise ValueError(f"flight_recorder_scope must be one of {', '.join(RECORDER_SCOPES)}, got {scope!r}")
+        self.size = max(1, size)
+        self.level = level
+        self.trigger_level = trigger_level
+        self.scope = scope
+        self._per_logger = scope == RECORDER_PER_LOGGER
+        self.max_buffers = max(1, max_buffers)
+        self._buffers = collections.OrderedDict()
+
+        self.buffered = 0
+        self.overwritten = 0
+        self.evicted = 0
+        self.shipped = 0
+        self.triggers = 0
+
+    def _key(self, record: logging.LogRecord):
+        if self._per_logger:
+            return record.name
+        # Thread ids are reused once a thread ends; the name tells the new thread apart
+        return record.thread, record.threadName
+
+    def record(self, record: logging.LogRecord):
+        """
+        Keep a record in its buffer, overwriting the oldest record if the buffer is full.
+        """
+        entry = record
+        if record.exc_info or must_render_message(record):
+            entry = capture_record(record)
+
+        key = self._key(record)
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            if len(self._buffers) >= self.max_buffers:
+                _, evicted = self._buffers.popitem(last=False)
+                self.evicted += len(evicted)
+            buffer = self._buffers[key] = collections.deque(maxlen=self.size)
+        else:
+            self._buffers.move_to_end(key)
+            if len(buffer) == self.size:
+                self.overwritten += 1
+        buffer.append(entry)
+        self.buffered += 1
+
+    def take(self, record: logging.LogRecord):
+        """
+        Empty the buffer a triggering record belongs to.
+
+        :return: (records, correlation id): the buffered records, oldest first, as
+                 CapturedRecords carrying the id as an extra field, and the id;
+                 ([], None) if the buffer is empty.
+        """
+        buffer = self._buffers.pop(self._key(record), None)
+        if not buffer:
+            return [], None
+        correlation_id = uuid.uuid4().hex
+        records = []
+        for entry in buffer:
+            if isinstance(entry, CapturedRecord):
+                captured = entry  # Its record is a snapshot already
+            else:
+                snapshot = type(entry).__new__(type(entry))
+                snapshot.__dict__.update(entry.__dict__)
+                captured = CapturedRecord(snapshot)
+            setattr(captured.record, CORRELATION_FIELD, correlation_id)
+            records.append(captured)
+        self.triggers += 1
+        self.shipped += len(records)
+        return records, correlation_id
+
+    def buffered_records(self) -> int:
+        """
+        Number of records currently held, across all buffers.
+        """
+        return sum(len(buffer) for buffer in list(self._buffers.values()))
+
+    def counters(self) -> dict:
+        return {
+            "buffered": self.buffered,
+            "overwritten": self.overwritten,
+            "evicted": self.evicted,
+            "shipped": self.shipped,
+            "triggers": self.triggers,
+            "held": self.buffered_records(),
+            "buffers": len(self._buffers),
+        }
@@ -0,0 +1,497 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+import zlib
+
+# Overflow policies for the bounded send queue
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST)
+
+
+class BackgroundSender:
+    """
+    Bounded in-memory queue drained by a dedicated daemon thread.
+
+    Producers only pay for a queue put; the sender thread calls ``send_func``
+    for every queued item. With ``batch_size > 1`` items are grouped and
+    ``send_func`` receives a list, flushed when the batch holds ``batch_size``
+    items, when adding an item would exceed ``batch_max_bytes``, or
+    ``batch_linger`` seconds after the first item of the batch arrived.
+
+    What happens when the queue is full is decided by ``overflow_policy``:
+
+    - ``"block"``: wait for free space (up to ``block_timeout`` seconds, forever if None).
+    - ``"drop_newest"``: discard the item being added.
+    - ``"drop_oldest"``: discard the oldest queued item to make room.
+    """
+    def __init__(self, send_func,
+                 queue_size: int = 1000,
+                 overflow_policy: str = OVERFLOW_BLOCK,
+                 block_timeout: float = None,
+                 error_func=None,
+                 name: str = "LogAggregatorSender",
+                 batch_size: int = 1,
+                 batch_max_bytes: int = None,
+                 batch_linger: float = 0.0,
+                 prepare_func=None):
+        """
+        :param send_func: Callable invoked on the sender thread with each queued item
+                          (or each list of items when batching).
+        :param queue_size: Maximum number of queued items. Defaults to 1000.
+        :param overflow_policy: One of "block", "drop_newest", "drop_oldest".
+        :param block_timeout: Max seconds to wait for space with the "block" policy.
+                              None waits forever. Items still not queued are dropped.
+        :param error_func: Callable receiving a message when send_func raises.
+        :param name: Name of the sender thread.
+        :param batch_size: Maximum items per batch. 1 disables batching. Defaults to 1.
+        :param batch_max_bytes: Maximum summed len() of the prepared items in a batch.
+                                None means no byte limit.
+        :param batch_linger: Max seconds to wait for a batch to fill up. Defaults to 0.0.
+        :param prepare_func: Optional callable applied to each item on the sender thread
+                             before batching (e.g. encoding to bytes).
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"overflow_policy must be one of {', '.join(OVERFLOW_POLICIES)}, got {overflow_policy!r}"
+            )
+        self.send_func = send_func
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.error_func = error_func
+        self.name = name
+        self.batch_size = max(1, batch_size)
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_linger = max(0.0, batch_linger)
+        self.prepare_func = prepare_func
+        self.dropped = 0
+
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._closed = False
+        self._thread = None
+        self._lock = threading.Lock()
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def put(self, item, key=None) -> bool:
+        """
+        Queue an item for sending. Returns False if the item was dropped.
+
+        :param key: Ignored; items are sent in the order they were queued. See ParallelSender.
+        """
+        if self._closed:
+            self.dropped += 1
+            return False
+
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                return False
+
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            if self.overflow_policy == OVERFLOW_DROP_NEWEST:
+                self.dropped += 1
+                return False
+
+        # drop_oldest: evict until the new item fits
+        with self._lock:
+            while True:
+                try:
+                    self._queue.put_nowait(item)
+                    return True
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self._queue.task_done()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    @property
+    def capacity(self) -> int:
+        """
+        Maximum number of queued items.
+        """
+        return self._queue.maxsize
+
+    def qsize(self) -> int:
+        """
+        Approximate number of queued items.
+        """
+        return self._queue.qsize()
+
+    def _run(self):
+        carry = None  # prepared item that did not fit into the previous batch
+        stopping = False
+        while not stopping:
+            batch = []
+            batch_bytes = 0
+            taken = 0  # queue items to mark done once the batch is handled
+            deadline = None
+            if carry is not None:
+                batch.append(carry)
+                batch_bytes = len(carry) if self.batch_max_bytes else 0
+                taken = 1
+                carry = None
+                deadline = time.monotonic() + self.batch_linger
+
+            while len(batch) < self.batch_size:
+                try:
+                    if deadline is None:
+                        item = self._queue.get()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining > 0:
+                            item = self._queue.get(timeout=remaining)
+                        else:
+                            # Linger is over, but take whatever is already queued
+                            item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+                if item is _STOP:
+                    stopping = True
+                    break
+                if item is _FLUSH:
+                    break
+
+                if self.prepare_func is not None:
+                    try:
+                        item = self.prepare_func(item)
+                    except Exception as e:
+                        if self.error_func:
+                            self.error_func(f"Background sender failed to prepare item: {e}")
+                        continue
+
+                if self.batch_max_bytes:
+                    item_bytes = len(item)
+                    if batch and batch_bytes + item_bytes > self.batch_max_bytes:
+                        carry = item
+                        taken -= 1
+                        break
+                    batch_bytes += item_bytes
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.batch_linger
+
+            try:
+                if batch:
+                    self.send_func(batch if self.batch_size > 1 else batch[0])
+            except Exception as e:
+                if self.error_func:
+                    self.error_func(f"Background sender failed: {e}")
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every queued item has been processed.
+
+        :param timeout: Max seconds to wait. None waits forever.
+        :return: True if the queue drained before the deadline.
+        """
+        if self._closed:
+            # Nothing is sent after close(), e.g. when logging.shutdown() flushes closed handlers
+            return not self._queue.unfinished_tasks
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if self.batch_linger > 0:
+            # Cut the linger short so a partial batch goes out now
+            try:
+                self._queue.put_nowait(_FLUSH)
+            except queue.Full:
+                pass
+        all_tasks_done = self._queue.all_tasks_done
+        with all_tasks_done:
+            while self._queue.unfinished_tasks:
+                if deadline is None:
+                    all_tasks_done.wait()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = None) -> bool:
+        """
+        Stop accepting items, drain the queue and stop the sender thread.
+
+        :param timeout: Max seconds to wait for the queue to drain. None waits forever.
+        :return: True if everything queued was processed before the deadline.
+        """
+        if self._closed:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        drained = self.flush(timeout)
+        self._closed = True
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            # Sender is stuck on a slow request; it runs as a daemon thread so
+            # it will not keep the interpreter alive.
+            return False
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        self._thread.join(remaining)
+        return drained and not self._thread.is_alive()
+
+
+class SpoolingSender(BackgroundSender):
+    """
+    Background sender that writes every item to a DiskSpool before sending it.
+
+    The sender thread moves queued items into the spool, then sends from the
+    spool and acknowledges what was delivered. ``send_func`` must return True
+    once the server has taken the items (or rejected them for good) and False
+    if they should be sent again later. After a failure, delivery is paused
+    with exponential backoff between ``retry_interval`` and ``retry_max``
+    seconds while new items keep being spooled. Records left in the spool by a
+    previous process are sent first.
+
+    ``flush()`` returns once queued items are in the spool and one delivery
+    attempt has been made; records the server did not take stay on disk.
+    """
+    def __init__(self, send_func, spool,
+                 retry_interval: float = 1.0,
+                 retry_max: float = 60.0,
+                 **kwargs):
+        """
+        :param send_func: Callable taking an encoded record (or a list of them when
+                          batching) and returning True when delivered.
+        :param spool: DiskSpool used as write-ahead storage.
+        :param retry_interval: Initial pause after a failed delivery. Defaults to 1.0.
+        :param retry_max: Maximum pause after repeated failures. Defaults to 60.0.
+        :param kwargs: Passed on to BackgroundSender.
+        """
+        self.spool = spool
+        self.retry_interval = retry_interval
+        self.retry_max = retry_max
+        self._failures = 0
+        self._retry_at = 0.0
+        self._pending_since = time.monotonic() if spool.has_pending() else None
+        self._unsent = 0
+        super().__init__(send_func, **kwargs)
+
+    def _wait_timeout(self):
+        # Seconds until the spool should be sent; None when there is nothing to send
+        if not self.spool.has_pending():
+            return None
+        send_at = self._retry_at
+        if self.batch_size > 1 and self._unsent < self.batch_size and self._pending_since is not None:
+            send_at = max(send_at, self._pending_since + self.batch_linger)
+        return max(0.0, send_at - time.monotonic())
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            items = []
+            timeout = self._wait_timeout()
+            try:
+                if timeout is None:
+                    items.append(self._queue.get())
+                elif timeout > 0:
+                    items.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                pass
+            # Take everything else already queued, without waiting
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                urgent = False
+                for item in items:
+                    if item is _STOP:
+                        stopping = urgent = True
+                        continue
+                    if item is _FLUSH:
+                        urgent = True
+                        continue
+                    self._spool_item(item)
+                if items:
+                    self.spool.sync()
+
+                now = time.monotonic()
+                ready = urgent or self.batch_size == 1 or self._unsent >= self.batch_size or (
+                    self._pending_since is not None and now >= self._pending_since + self.batch_linger
+                )
+                if ready and now >= self._retry_at and self.spool.has_pending():
+                    self._deliver()
+            except Exception as e:
+                if self.error_func:
+                    self.error_func(f"Spooling sender failed: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+        self.spool.close()
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until queued items are spooled and a delivery attempt has been made.
+        """
+        if self._closed:
+            return super().flush(timeout)
+        # Wake the sender thread even if nothing new is queued, e.g. to replay the spool
+        try:
+            self._queue.put_nowait(_FLUSH)
+        except queue.Full:
+            pass
+        return super().flush(timeout)
+
+    def _spool_item(self, item):
+        if self.prepare_func is not None:
+            try:
+                item = self.prepare_func(item)
+            except Exception as e:
+                if self.error_func:
+                    self.error_func(f"Background sender failed to prepare item: {e}")
+                return
+        if not self.spool.append(item):
+            return  # Already counted in the spool's evicted_records
+        self._unsent += 1
+        if self._pending_since is None:
+            self._pending_since = time.monotonic()
+
+    def _deliver(self):
+        while self.spool.has_pending():
+            # Do not let the queue overflow while catching up on a large spool
+            if self._queue.qsize() > self._queue.maxsize // 2:
+                return
+            records, position = self.spool.read(self.batch_size, self.batch_max_bytes)
+            if not records:
+                self.spool.ack(position)
+                continue
+            try:
+                delivered = self.send_func(records if self.batch_size > 1 else records[0])
+            except Exception as e:
+                if self.error_func:
+                    self.error_func(f"Background sender failed: {e}")
+                delivered = False
+            if not delivered:
+                self._failures += 1
+                delay = min(self.retry_max, self.retry_interval * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + delay
+                return
+            self._failures = 0
+            self.spool.ack(position)
+        self._pending_since = None
+        self._unsent = 0
+
+
+class ParallelSender:
+    """
+    Several BackgroundSenders, each with its own queue and thread, so that
+    requests to a slow server are in flight at the same time.
+
+    Items are routed by ``key``: all items with the same key go to the same
+    worker and are sent in the order they were queued, while items with
+    different keys may be sent in parallel and out of order relative to each
+    other. Items without a key all go to the first worker.
+
+    ``queue_size`` is split between the workers, so the total number of
+    queued items stays bounded by it.
+    """
+    def __init__(self, send_func, workers: int = 2,
+                 queue_size: int = 1000,
+                 name: str = "LogAggregatorSender",
+                 **kwargs):
+        """
+        :param send_func: Callable invoked on the worker threads; must be thread-safe.
+        :param workers: Number of sender threads. Defaults to 2.
+        :param queue_size: Maximum number of queued items, across all workers. Defaults to 1000.
+        :param name: Prefix of the sender thread names.
+        :param kwargs: Passed on to every BackgroundSender.
+        """
+        workers = max(1, workers)
+        per_worker, extra = divmod(queue_size, workers)
+        self.name = name
+        self.workers = [BackgroundSender(send_func, queue_size=per_worker + (i < extra),
+                                         name=f"{name}-{i}", **kwargs)
+                        for i in range(workers)]
+
+    def _worker(self, key) -> BackgroundSender:
+        if key is None or len(self.workers) == 1:
+            return self.workers[0]
+        if not isinstance(key, bytes):
+            key = str(key).encode("utf-8", "surrogatepass")
+        # Not hash(): string hashes change between processes, and routing should not
+        return self.workers[zlib.crc32(key) % len(self.workers)]
+
+    def put(self, item, key=None) -> bool:
+        """
+        Queue an item on the worker of its key. Returns False if the item was dropped.
+        """
+        return self._worker(key).put(item)
+
+    @property
+    def dropped(self) -> int:
+        return sum(worker.dropped for worker in self.workers)
+
+    @property
+    def capacity(self) -> int:
+        """
+        Maximum number of queued items, across all workers.
+        """
+        return sum(worker.capacity for worker in self.workers)
+
+    def qsize(self) -> int:
+        """
+        Approximate number of queued items, across all workers.
+        """
+        return sum(worker.qsize() for worker in self.workers)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until every worker's queue has been processed. The workers drain
+        in parallel, so this takes as long as the slowest of them.
+
+        :param timeout: Max seconds to wait in total. None waits forever.
+        :return: True if all queues drained before the deadline.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in self.workers:
+            if not worker._closed and worker.batch_linger > 0:
+                # Cut every worker's linger short now, not when its turn to be waited on comes
+                try:
+                    worker._queue.put_nowait(_FLUSH)
+                except queue.Full:
+                    pass
+        drained = True
+        for worker in self.workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            drained = worker.flush(remaining) and drained
+        return drained
+
+    def close(self, timeout: float = None) -> bool:
+        """
+        Stop accepting items, drain every worker's queue and stop the sender threads.
+
+        :param timeout: Max seconds to wait in total. None waits forever.
+        :return: True if everything queued was processed before the deadline.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Drain all workers at once before stopping them one after the other
+        drained = self.flush(timeout)
+        for worker in self.workers:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            drained = worker.close(remaining) and drained
+        return drained
+
+
+# Sentinel telling the sender thread to exit
+_STOP = object()
+# Sentinel telling the sender thread to send its partial batch immediately
+_FLUSH = object()
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import logging
+import sys
+import traceback
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder is used without it
+    orjson = None
+
+# LogRecord attributes that are never shipped as "extra"
+RESERVED_ATTRS = frozenset((
+    'args', 'asctime', 'created', 'exc_info', 'exc_text', 'levelno',
+    'levelname', 'message', 'module', 'msecs', 'msg', 'name',
+    'pathname', 'process', 'processName', 'relativeCreated',
+    'stack_info', 'thread', 'threadName', 'filename', 'lineno', 'funcName',
+    # Keys of the formatted entry itself
+    'timestamp', 'level', 'host', 'host_process', 'logger_name',
+))
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+# Arguments left unrendered by capture_record(): their value cannot change before formatting
+_IMMUTABLE_TYPES = frozenset((str, int, float, bool, bytes, type(None)))
+
+# As traceback.format_exception() renders exceptions since Python 3.10
+_TRACEBACK_OPTIONS = {"compact": True} if sys.version_info >= (3, 10) else {}
+
+
+def _stdlib_dumps(entry: dict) -> bytes:
+    # Same bytes as orjson for the types log records contain
+    return json.dumps(entry, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class RecordSerializer:
+    """
+    Turns log records into entry dicts and JSON bytes with as little per-record work as possible.
+
+    Static fields (host, level names) are resolved once, the timestamp is
+    formatted once per second with only the microseconds filled in per record,
+    and encoding goes straight to bytes, through orjson when it is installed.
+    Both encoders produce the same compact UTF-8 JSON.
+    """
+    def __init__(self, host: str, level_map: dict):
+        """
+        :param host: Value of the "host" field.
+        :param level_map: Mapping from log level numbers to API level strings.
+        """
+        self.host = host
+        self.level_map = dict(level_map)
+        # (whole UTC second, "YYYY-MM-DDTHH:MM:SS") of the last formatted timestamp
+        self._ts_cache = (None, None)
+
+    def format_timestamp(self, timestamp: float) -> str:
+        """
+        Format UNIX timestamp to ISO 8601 string, identical to
+        datetime.fromtimestamp(timestamp, tz=utc).isoformat(timespec='microseconds').
+        """
+        if timestamp < 0:
+            dt = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+            return dt.isoformat(timespec='microseconds')
+
+        # Round to microseconds the way datetime.fromtimestamp does (half to even)
+        seconds = int(timestamp)
+        micros = round((timestamp - seconds) * 1e6)
+        if micros >= 1000000:
+            seconds += 1
+            micros -= 1000000
+
+        cached_second, prefix = self._ts_cache
+        if cached_second != seconds:
+            dt = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc)
+            prefix = dt.strftime('%Y-%m-%dT%H:%M:%S')
+            self._ts_cache = (seconds, prefix)
+        return f"{prefix}.{micros:06d}+00:00"
+
+    def to_dict(self, record: logging.LogRecord, message: str, exception: str = None) -> dict:
+        """
+        Build the entry dict for a record, given its already formatted message.
+
+        :param exception: The record's rendered traceback, if it was rendered already
+                          (see CapturedRecord); otherwise it is rendered from exc_info.
+        """
+        log_entry = {
+            "timestamp": self.format_timestamp(record.created),
+            "level": self.level_map.get(record.levelno, record.levelname),
+            "message": message,
+            "host": self.host,
+            "host_process": record.name, # Use logger name as host_process
+            "logger_name": record.name,
+            "module": record.module,
+            "filename": record.filename,
+            "lineno": record.lineno,
+            "funcName": record.funcName,
+            "process": record.process,
+            "thread": record.thread,
+            "threadName": record.threadName,
+        }
+
+        # Include exception information if available
+        if exception is not None:
+            log_entry["exception"] = exception
+        elif record.exc_info:
+            log_entry["exception"] = "".join(
+                traceback.format_exception(*record.exc_info)
+            )
+        elif record.exc_text:
+            log_entry["exception"] = record.exc_text
+
+        # Include extra attributes
+        extra_attrs = {
+            key: value
+            for key, value in record.__dict__.items()
+            if key not in RESERVED_ATTRS
+        }
+        if extra_attrs:
+            if "exception" in log_entry:
+                extra_attrs.pop("exception", None)
+            if extra_attrs:
+                log_entry["extra"] = extra_attrs
+
+        return log_entry
+
+    @staticmethod
+    def encode(entry: dict) -> bytes:
+        """
+        Encode an entry dict to compact UTF-8 JSON bytes.
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(entry, option=_ORJSON_OPTIONS)
+            except TypeError:
+                pass  # e.g. integers beyond 64 bits; let the stdlib encoder decide
+        return _stdlib_dumps(entry)
+
+
+class CapturedRecord:
+    """
+    What emit() keeps of a record when formatting is deferred to the sender thread.
+
+    ``record`` is a copy of the LogRecord whose message is already rendered if
+    its arguments could change before the sender formats it. ``traceback`` is
+    the record's exception as a traceback.TracebackException: it holds the
+    file names, line numbers and exception texts, but no frames, so the
+    frames and their locals are freed when the caller's exception is. Source
+    lines are read only when the traceback is rendered.
+    """
+    __slots__ = ("record", "traceback")
+
+    def __init__(self, record: logging.LogRecord, traceback_exception=None):
+        self.record = record
+        self.traceback = traceback_exception
+
+    def render_traceback(self) -> str:
+        """
+        The traceback as traceback.format_exception() renders it, or None.
+        Also sets the record's exc_text, as logging.Formatter.formatException() would.
+        """
+        if self.traceback is None:
+            return None
+        text = "".join(self.traceback.format())
+        if not self.record.exc_text:
+            self.record.exc_text = text[:-1] if text.endswith("\n") else text
+        return text
+
+
+def must_render_message(record: logging.LogRecord) -> bool:
+    """
+    Whether a record's message must be rendered now to be logged as it was:
+    msg or args are not immutable primitives, so they could change before formatting.
+    """
+    args = record.args
+    return type(record.msg) is not str or bool(args and (
+        type(args) is not tuple or not _IMMUTABLE_TYPES.issuperset(map(type, args))))
+
+
+def frame_free_traceback(exc_info) -> traceback.TracebackException:
+    """
+    The exception of exc_info as a TracebackException that holds no frames and
+    reads source lines only when rendered.
+    """
+    return traceback.TracebackException(type(exc_info[1]), exc_info[1], exc_info[2],
+                                        lookup_lines=False, **_TRACEBACK_OPTIONS)
+
+
+def capture_record(record: logging.LogRecord, capture_traceback: bool = True) -> CapturedRecord:
+    """
+    Snapshot a record on the logging thread, doing as little as possible.
+
+    The message is rendered now only if msg or args are not immutable
+    primitives; otherwise rendering is left to the sender thread.
+
+    :param capture_traceback: Replace exc_info by a frame-free TracebackException.
+                              Pass False when a formatter overrides formatException(),
+                              which then needs exc_info itself.
+    :raises Exception: Whatever record.getMessage() raises for a bad format string.
+    """
+    snapshot = type(record).__new__(type(record))
+    snapshot.__dict__.update(record.__dict__)
+
+    if must_render_message(record):
+        snapshot.msg = record.getMessage()
+        snapshot.args = None
+
+    traceback_exception = None
+    exc_info = record.exc_info
+    if capture_traceback and exc_info and exc_info[1] is not None:
+        traceback_exception = frame_free_traceback(exc_info)
+        snapshot.exc_info = None
+    return CapturedRecord(snapshot, traceback_exception)
@@ -0,0 +1,706 @@
+# -*- coding: utf-8 -*-
+"""
+Reference ingest server, for small deployments and for load testing handlers.
+
+Serves POST /api/logs, POST /api/logs/batch and GET /api/health like the PHP
+app, and stores entries in SQLite with the schema of
+php_app/database/create_table.php. Request threads only parse entries and add
+them to an in-memory write-behind buffer; a single writer thread takes
+everything buffered and commits it in one transaction, so the cost of a commit
+is shared by all the entries that arrived meanwhile.
+
+With ack="commit" a request is answered once its entries are committed, with
+ack="buffer" as soon as they are buffered. A commit that takes longer than
+ack_timeout is answered with 202 Accepted: the entries stay buffered and are
+committed later, and a 5xx would have the client send them again. The server assigns ids itself, so it
+must be the only process writing to the database; the PHP app can read it
+alongside.
+
+Run the server with the ``log-aggregator-server`` command.
+"""
+import argparse
+import collections
+import json
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from . import wire
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib decoder is used without it
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zstd bodies are answered with 415 without it
+    zstandard = None
+
+ACK_BUFFER = "buffer"
+ACK_COMMIT = "commit"
+ACK_MODES = (ACK_BUFFER, ACK_COMMIT)
+SYNCHRONOUS_MODES = ("off", "normal", "full")
+
+DEFAULT_DATABASE = "logs.sqlite"
+# As LogController
+MAX_BATCH_SIZE = 5000
+# Larger request bodies, compressed or not, are answered with 413
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Rows the table refused, kept until the request that submitted them reports them
+MAX_FAILED_KEPT = 100000
+
+# The SQLite statements of create_table.php; the full-text index needs FTS5
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS logs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  host VARCHAR(100) NOT NULL,
+  host_process VARCHAR(100),
+  log_level VARCHAR(20) NOT NULL,
+  log_message TEXT NOT NULL,
+  timestamp DATETIME NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_host_timestamp ON logs (host, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_host_process_timestamp ON logs (host_process, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_logs_log_level_timestamp ON logs (log_level, timestamp)",
+    """CREATE TABLE IF NOT EXISTS log_rollups (
+  minute CHAR(19) NOT NULL,
+  host VARCHAR(100) NOT NULL,
+  host_process VARCHAR(100) NOT NULL DEFAULT '',
+  log_level VARCHAR(20) NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (minute, host, host_process, log_level)
+)""",
+    "CREATE INDEX IF NOT EXISTS idx_log_rollups_host_minute ON log_rollups (host, minute)",
+    "CREATE INDEX IF NOT EXISTS idx_log_rollups_host_process_minute ON log_rollups (host_process, minute)",
+    "CREATE INDEX IF NOT EXISTS idx_log_rollups_log_level_minute ON log_rollups (log_level, minute)",
+)
+FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts USING fts5(log_message, content='logs', content_rowid='id')",
+    """CREATE TRIGGER IF NOT EXISTS logs_ai AFTER INSERT ON logs BEGIN
+    INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_ad AFTER DELETE ON logs BEGIN
+    INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+END""",
+    """CREATE TRIGGER IF NOT EXISTS logs_au AFTER UPDATE OF log_message ON logs BEGIN
+    INSERT INTO logs_fts(logs_fts, rowid, log_message) VALUES ('delete', old.id, old.log_message);
+    INSERT INTO logs_fts(rowid, log_message) VALUES (new.id, new.log_message);
+END""",
+)
+
+_COLUMNS = "id, host, host_process, log_level, log_message, timestamp"
+_INSERT_SQL = f"INSERT INTO logs ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)"
+_ROLLUP_SQL = ("INSERT INTO log_rollups (minute, host, host_process, log_level, count) VALUES (?, ?, ?, ?, ?)"
+               " ON CONFLICT (minute, host, host_process, log_level) DO UPDATE SET count = count + excluded.count")
+
+_MINUTE = re.compile(r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2})")
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}$")
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+
+def _text(value, default):
+    # A column value as PDO binds it: scalars as strings, a missing or null field as the default
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "1" if value else ""
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise ValueError(f"Field is not a scalar: {type(value).__name__}")
+
+
+def build_row(entry: dict) -> tuple:
+    """
+    The (host, host_process, log_level, log_message, timestamp) stored for an
+    entry, with the defaults of LogController::buildLog().
+
+    :raises ValueError: If one of these fields is an array or object.
+    """
+    timestamp = _text(entry.get("timestamp"), None)
+    return (
+        _text(entry.get("host"), "unknown"),
+        _text(entry.get("host_process"), None),
+        _text(entry.get("log_level"), "INFO"),
+        _text(entry.get("log_message"), ""),
+        timestamp if timestamp is not None else time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
+def rollup_minute(timestamp: str) -> str:
+    """
+    The minute a timestamp is counted at in log_rollups, as LogRollup::minute().
+    """
+    match = _MINUTE.match(timestamp)
+    if match:
+        return f"{match.group(1)} {match.group(2)}:00"
+    if _DATE.match(timestamp):
+        return f"{timestamp} 00:00:00"
+    return time.strftime("%Y-%m-%d %H:%M:00")
+
+
+def create_schema(db: sqlite3.Connection):
+    """
+    Create the tables, indexes and triggers of create_table.php if they do not exist.
+    Without FTS5 in the SQLite library the full-text index is left out.
+    """
+    existing = {row[0] for row in db.execute("SELECT name FROM sqlite_master")}
+    for statement in SCHEMA:
+        db.execute(statement)
+    if "log_rollups" not in existing:
+        # Count the entries logged before the rollups existed
+        db.execute("""INSERT INTO log_rollups (minute, host, host_process, log_level, count)
+            SELECT SUBSTR(REPLACE(timestamp, 'T', ' '), 1, 16) || ':00', host, COALESCE(host_process, ''), log_level,
+                   COUNT(*) FROM logs GROUP BY 1, 2, 3, 4""")
+    try:
+        for statement in FTS_SCHEMA:
+            db.execute(statement)
+    except sqlite3.OperationalError as e:
+        print(f"Full-text index not created: {e}", file=sys.stderr)
+        return
+    if "logs_fts" not in existing:
+        # Index the entries logged before the search index existed
+        db.execute("INSERT INTO logs_fts(logs_fts) VALUES ('rebuild')")
+
+
+class LogWriter:
+    """
+    Write-behind buffer of log rows and the single thread that commits them to SQLite.
+
+    submit() assigns ids and buffers rows; the writer thread takes the whole
+    buffer, lets it grow for up to commit_interval after its first row, and
+    commits it in one transaction. Rows are staged in a temporary table and
+    moved into logs by one statement, so the full-text index is updated once
+    per transaction rather than once per row. A transaction that fails with an
+    operational error (e.g. the database is locked, or the disk is full) is
+    retried with the same rows until it succeeds or the writer is closed.
+    """
+    def __init__(self, database: str = DEFAULT_DATABASE,
+                 synchronous: str = "normal",
+                 commit_interval: float = 0.01,
+                 commit_rows: int = 10000,
+                 max_buffered: int = 100000,
+                 retry_delay: float = 0.5):
+        """
+        :param database: Path of the SQLite database; created with the schema if needed.
+        :param synchronous: SQLite's synchronous setting: "full" syncs every commit to disk,
+                            "normal" (the default) survives a crash of the process but may
+                            lose the last commits on power loss, "off" leaves syncing to the OS.
+        :param commit_interval: Max seconds a row waits in the buffer for more rows to
+                                share its transaction. Defaults to 0.01.
+        :param commit_rows: Buffered rows that start a commit without waiting for
+                            commit_interval. Defaults to 10000.
+        :param max_buffered: Max rows buffered; submit() refuses rows beyond it. Defaults to 100000.
+        :param retry_delay: Seconds between attempts of a failed transaction. Defaults to 0.5.
+        """
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"synchronous must be one of {', '.join(SYNCHRONOUS_MODES)}, got {synchronous!r}")
+        self.database = database
+        self.commit_interval = commit_interval
+        self.commit_rows = max(1, commit_rows)
+        self.max_buffered = max(MAX_BATCH_SIZE, max_buffered)
+        self.retry_delay = retry_delay
+        self.committed = 0  # Rows committed or failed, in submission order
+        self.failed = 0
+        self.commits = 0
+        self.error = None  # Error of the last transaction if it failed
+        self._failed_rows = collections.OrderedDict()  # id -> error, for take_failed()
+
+        # Used by the writer thread only once __init__ returns
+        self._db = sqlite3.connect(database, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(f"PRAGMA synchronous={synchronous.upper()}")
+        self._db.execute("PRAGMA temp_store=MEMORY")
+        create_schema(self._db)
+        self._db.execute(f"CREATE TEMP TABLE pending ({_COLUMNS})")
+        # Ids continue after the highest ever used, as AUTOINCREMENT would
+        self._next_id = 1 + max(
+            self._db.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0],
+            self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'logs'").fetchone()[0],
+        )
+
+        self._buffer = []
+        self._submitted = 0
+        self._first_buffered_at = 0.0
+        self._closing = False
+        self._abandoned = False
+        self._lock = threading.Lock()
+        self._has_rows = threading.Condition(self._lock)
+        self._has_committed = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name="LogAggregatorWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows: list):
+        """
+        Buffer rows (see build_row()) for the writer thread.
+
+        :return: (first id, ticket) for wait_committed(); the rows get consecutive ids.
+                 None if the buffer has no room for them, or the writer is closed.
+        """
+        with self._lock:
+            if self._closing or len(self._buffer) + len(rows) > self.max_buffered:
+                return None
+            first_id = self._next_id
+            self._next_id += len(rows)
+            if not self._buffer:
+                self._first_buffered_at = time.monotonic()
+                self._has_rows.notify()
+            self._buffer.extend((row_id,) + row for row_id, row in enumerate(rows, first_id))
+            self._submitted += len(rows)
+            if len(self._buffer) >= self.commit_rows:
+                self._has_rows.notify()
+            return first_id, self._submitted
+
+    def wait_committed(self, ticket: int, timeout: float = None) -> bool:
+        """
+        Wait until the rows of a submit() ticket are committed. Returns False on timeout.
+        """
+        with self._lock:
+            return self._has_committed.wait_for(lambda: self.committed >= ticket, timeout)
+
+    def take_failed(self, first_id: int, count: int) -> dict:
+        """
+        The rows of a submit() that could not be inserted, once committed.
+
+        :return: {id: error} of the rows first_id to first_id + count - 1 that failed.
+        """
+        with self._lock:
+            if not self._failed_rows:
+                return {}
+            return {row_id: self._failed_rows.pop(row_id)
+                    for row_id in range(first_id, first_id + count) if row_id in self._failed_rows}
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def healthy(self) -> bool:
+        return self._thread.is_alive() and self.error is None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "committed": self.committed,
+                "failed": self.failed,
+                "commits": self.commits,
+                "error": self.error,
+            }
+
+    def _take(self):
+        # The rows of the next transaction, or None once closed and drained
+        with self._lock:
+            while not self._buffer and not self._closing:
+                self._has_rows.wait()
+            deadline = self._first_buffered_at + self.commit_interval
+            while not self._closing and len(self._buffer) < self.commit_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._has_rows.wait(remaining)
+            rows, self._buffer = self._buffer, []
+            return rows or None
+
+    def _run(self):
+        while True:
+            rows = self._take()
+            if rows is None:
+                return
+            failed = self._commit(rows)
+            with self._lock:
+                self.committed += len(rows)
+                self.failed += len(failed)
+                self._failed_rows.update(failed)
+                while len(self._failed_rows) > MAX_FAILED_KEPT:
+                    self._failed_rows.popitem(last=False)  # Of requests that did not wait for them
+                self._has_committed.notify_all()
+
+    def _commit(self, rows: list) -> dict:
+        # Returns {id: error} of the rows that could not be inserted
+        while True:
+            try:
+                failed = self._write(rows)
+                self.commits += 1
+                self.error = None
+                return failed
+            except sqlite3.Error as e:
+                self.error = str(e)
+                print(f"Failed to commit {len(rows)} logs, retrying: {e}", file=sys.stderr)
+            if self._abandoned:
+                return {row[0]: self.error for row in rows}
+            time.sleep(self.retry_delay)
+
+    def _write(self, rows: list) -> dict:
+        db = self._db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            try:
+                db.executemany("INSERT INTO temp.pending VALUES (?, ?, ?, ?, ?, ?)", rows)
+                db.execute(f"INSERT INTO logs ({_COLUMNS}) SELECT {_COLUMNS} FROM temp.pending ORDER BY id")
+                inserted, failed = rows, {}
+            except sqlite3.OperationalError:
+                raise
+            except sqlite3.Error:
+                # A row the table does not take: insert them one by one, skipping the bad ones
+                db.execute("ROLLBACK")
+                db.execute("BEGIN IMMEDIATE")
+                inserted, failed = self._insert_each(rows)
+            db.execute("DELETE FROM temp.pending")
+            self._add_rollups(inserted)
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        return failed
+
+    def _insert_each(self, rows: list):
+        # Returns (inserted rows, {id: error} of the others)
+        inserted = []
+        failed = {}
+        for row in rows:
+            try:
+                self._db.execute(_INSERT_SQL, row)
+                inserted.append(row)
+            except sqlite3.OperationalError:
+                raise
+            except sqlite3.Error as e:
+                print(f"Failed to insert log {row[0]}: {e}", file=sys.stderr)
+                failed[row[0]] = f"Failed to store log: {e}"
+        return inserted, failed
+
+    def _add_rollups(self, rows: list):
+        # As LogRollup: one upsert per (minute, host, host_process, log_level); the minute only
+        # depends on the first 16 characters of the timestamp
+        counts = collections.Counter((row[5][:16], row[1], row[2] or "", row[3]) for row in rows)
+        minutes = collections.Counter()
+        for (prefix, host, host_process, log_level), count in counts.items():
+            minutes[(rollup_minute(prefix), host, host_process, log_level)] += count
+        self._db.executemany(_ROLLUP_SQL, [key + (count,) for key, count in minutes.items()])
+
+    def close(self, timeout: float = None):
+        """
+        Commit what is buffered (waiting up to timeout seconds) and close the database.
+        """
+        with self._lock:
+            self._closing = True
+            self._has_rows.notify()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self._abandoned = True
+            print(f"Gave up writing {len(self._buffer)} buffered logs", file=sys.stderr)
+            return
+        self._db.close()
+
+
+def _decode_body(body: bytes, encoding: str) -> bytes:
+    """
+    Undo a Content-Encoding, as RequestBodyDecoder does.
+
+    :raises NotImplementedError: If the encoding is not supported.
+    :raises ValueError: If the body is corrupt for its encoding or decompresses to more than MAX_BODY_BYTES.
+    """
+    encoding = encoding.strip().lower() or "identity"
+    if encoding == "identity":
+        return body
+    if encoding in ("gzip", "x-gzip", "deflate"):
+        # wbits: gzip header, or the zlib header of deflate as PHP's ZLIB_ENCODING_DEFLATE
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS if encoding != "deflate" else zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, MAX_BODY_BYTES + 1)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt {encoding} request body") from e
+        if len(data) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        return data
+    if encoding == "zstd" and zstandard is not None:
+        try:
+            # Read one byte past the limit: a small body may decompress to gigabytes
+            with zstandard.ZstdDecompressor().stream_reader(body) as reader:
+                chunks = []
+                size = 0
+                while size <= MAX_BODY_BYTES:
+                    chunk = reader.read(MAX_BODY_BYTES + 1 - size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+            data = b"".join(chunks)
+        except zstandard.ZstdError as e:
+            raise ValueError("Corrupt zstd request body") from e
+        if len(data) > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        return data
+    raise NotImplementedError(f"Unsupported Content-Encoding: {encoding}")
+
+
+class _IngestRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients reuse their connections
+    # Send headers and body in one segment; separate writes stall on delayed ACKs
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers=()):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/api/health":
+            self._reply(404, {"error": "Not found"})
+        elif self.server.ingest.writer.healthy():
+            self._reply(200, {"status": "OK"})
+        else:
+            self._reply(503, {"status": "ERROR", "error": self.server.ingest.writer.error or "Writer stopped"})
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path not in ("/api/logs", "/api/logs/batch"):
+            self._reply(404, {"error": "Not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._reply(413, {"error": "Request body too large"})
+            return
+        body = self.rfile.read(length)
+        try:
+            body = _decode_body(body, self.headers.get("Content-Encoding") or "")
+        except NotImplementedError as e:
+            self._reply(415, {"error": str(e)})
+            return
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+
+        if path == "/api/logs":
+            self._add_log(body)
+        else:
+            self._add_logs(body, (self.headers.get("Content-Type") or "").lower())
+
+    def _add_log(self, body: bytes):
+        try:
+            entry = _loads(body)
+        except ValueError:
+            self._reply(400, {"error": "Invalid JSON"})
+            return
+        if not isinstance(entry, dict):
+            self._reply(400, {"error": "Expected a JSON object"})
+            return
+        try:
+            row = build_row(entry)
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+        stored = self._store([row])
+        if stored is None:
+            return
+        ids, status, failed = stored
+        if failed:
+            self._reply(400, {"error": failed[ids[0]]})  # Refused by the table, would be again
+        else:
+            self._reply(status or 201, {"id": ids[0]})
+
+    def _add_logs(self, body: bytes, content_type: str):
+        if content_type.startswith(("application/x-ndjson", "application/ndjson")):
+            entries = []
+            for line in body.splitlines():
+                if line.strip():
+                    try:
+                        entries.append(_loads(line))
+                    except ValueError:
+                        entries.append(None)
+        elif content_type.split(";", 1)[0].strip() in ("application/x-msgpack", "application/msgpack",
+                                                       "application/vnd.msgpack"):
+            if wire.msgpack is None:
+                self._reply(415, {"error": "Unsupported Content-Type: MessagePack needs the msgpack package"})
+                return
+            try:
+                entries = wire.unpack_batch(body)
+            except ValueError as e:
+                self._reply(400, {"error": str(e)})
+                return
+        else:
+            try:
+                entries = _loads(body)
+            except ValueError:
+                entries = None
+            if not isinstance(entries, list):
+                self._reply(400, {"error": "Expected a JSON array"})
+                return
+        if len(entries) > MAX_BATCH_SIZE:
+            self._reply(413, {"error": f"Batch exceeds {MAX_BATCH_SIZE} items"})
+            return
+
+        results = [None] * len(entries)
+        rows = []
+        positions = []
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                results[index] = {"error": "Item is not a JSON object"}
+                continue
+            try:
+                rows.append(build_row(entry))
+            except ValueError as e:
+                results[index] = {"error": str(e)}
+                continue
+            positions.append(index)
+
+        stored = self._store(rows) if rows else ([], None, {})
+        if stored is None:
+            return
+        ids, status, failed = stored
+        for index, row_id in zip(positions, ids):
+            results[index] = {"error": failed[row_id]} if row_id in failed else {"id": row_id}
+        inserted = len(rows) - len(failed)
+        self._reply(status or 200, {"inserted": inserted, "failed": len(entries) - inserted, "results": results})
+
+    def _store(self, rows: list):
+        # (ids of the rows, status replacing the success status or None, {id: error} of
+        # the rows the table refused) once they are acknowledged; None if an error was
+        # answered instead. Failed rows are only known once committed, not with ack="buffer".
+        ingest = self.server.ingest
+        submitted = ingest.writer.submit(rows)
+        if submitted is None:
+            self._reply(503, {"error": "Ingest buffer is full"}, headers=[("Retry-After", "1")])
+            return None
+        first_id, ticket = submitted
+        ids = range(first_id, first_id + len(rows))
+        if ingest.ack == ACK_COMMIT and not ingest.writer.wait_committed(ticket, ingest.ack_timeout):
+            # Still buffered, and committed later: a 5xx would have clients send them again
+            return ids, 202, {}
+        if ingest.ack == ACK_COMMIT:
+            return ids, None, ingest.writer.take_failed(first_id, len(rows))
+        return ids, None, {}
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Many clients may connect at once
+
+
+class IngestServer:
+    """
+    HTTP front end of a LogWriter.
+    """
+    def __init__(self, address=("127.0.0.1", 8080), database: str = DEFAULT_DATABASE,
+                 ack: str = ACK_COMMIT, ack_timeout: float = 3.0, writer: LogWriter = None, **writer_options):
+        """
+        :param address: (host, port) to listen on; port 0 picks a free port.
+        :param database: Path of the SQLite database, used if writer is None.
+        :param ack: When requests are answered: "commit" (the default) once their entries
+                    are committed, "buffer" once they are buffered. Entries answered
+                    with "buffer" are lost if the server dies before committing them.
+        :param ack_timeout: Max seconds an ack="commit" request waits for the commit
+                            before it is answered with 202 Accepted; its entries are
+                            committed later. Keep it below the clients' request
+                            timeout. Defaults to 3.0.
+        :param writer: Writer storing the entries. Defaults to a LogWriter built from
+                       database and writer_options.
+        :param writer_options: LogWriter arguments, used if writer is None.
+        """
+        if ack not in ACK_MODES:
+            raise ValueError(f"ack must be one of {', '.join(ACK_MODES)}, got {ack!r}")
+        self.ack = ack
+        self.ack_timeout = ack_timeout
+        self.writer = writer if writer is not None else LogWriter(database, **writer_options)
+        self._thread = None
+        self._server = _HTTPServer(address, _IngestRequestHandler)
+        self._server.ingest = self
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def serve_forever(self):
+        """
+        Serve until shutdown() is called from another thread.
+        """
+        self._server.serve_forever()
+
+    def start(self):
+        """
+        Serve on a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, name="LogAggregatorServer", daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        """
+        Stop serving. Safe to call from any thread but the one running serve_forever().
+        """
+        self._server.shutdown()
+
+    def close(self, timeout: float = 10.0):
+        """
+        Stop listening and commit what is buffered, waiting up to timeout seconds.
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        self.writer.close(timeout)
+
+
+def main(argv=None):
+    """
+    Entry point of the log-aggregator-server command.
+    """
+    parser = argparse.ArgumentParser(
+        prog="log-aggregator-server",
+        description="Receive logs over the log aggregation API and store them in SQLite.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="SQLite database path (default: %(default)s)")
+    parser.add_argument("--ack", choices=ACK_MODES, default=ACK_COMMIT,
+                        help="Answer requests once their logs are committed or once they are buffered")
+    parser.add_argument("--synchronous", choices=SYNCHRONOUS_MODES, default="normal",
+                        help="SQLite synchronous setting; full syncs every commit to disk")
+    parser.add_argument("--commit-interval", type=float, default=0.01,
+                        help="Max seconds a log waits for more logs to share its transaction")
+    parser.add_argument("--max-buffered", type=int, default=100000,
+                        help="Max logs buffered; requests beyond it are answered with 503")
+    args = parser.parse_args(argv)
+
+    server = IngestServer((args.host, args.port), args.database, ack=args.ack, synchronous=args.synchronous,
+                          commit_interval=args.commit_interval, max_buffered=args.max_buffered)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to return, so it cannot run on its thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    host, port = server.server_address[:2]
+    print(f"log-aggregator-server listening on http://{host}:{port}/api/logs, writing to {args.database}",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
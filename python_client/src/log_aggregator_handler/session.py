@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Endpoint, session and auth setup shared by the handler and the query client.
+"""
+import argparse
+import os
+
+import requests
+from requests.adapters import HTTPAdapter, DEFAULT_POOLSIZE
+
+
+def resolve_api_endpoint(api_endpoint: str = None) -> str:
+    """
+    Return api_endpoint, or the LOG_AGGREGATOR_API_ENDPOINT environment variable
+    (also read from a .env file if python-dotenv is installed).
+
+    :raises ValueError: If no endpoint is configured.
+    """
+    # First check if api_endpoint was provided directly
+    if api_endpoint:
+        return api_endpoint
+
+    # If not provided, try loading from environment
+    api_endpoint = os.environ.get("LOG_AGGREGATOR_API_ENDPOINT")
+
+    # Load .env file if python-dotenv is installed
+    if not api_endpoint:
+        try:
+            import dotenv
+            dotenv.load_dotenv()
+            api_endpoint = os.environ.get("LOG_AGGREGATOR_API_ENDPOINT")
+        except ImportError:
+            pass  # python-dotenv not installed, ignore
+
+    # Raise error if still not found
+    if not api_endpoint:
+        raise ValueError(
+            "api_endpoint must be provided either as a constructor argument or via the LOG_AGGREGATOR_API_ENDPOINT environment variable"
+        )
+    return api_endpoint
+
+
+def create_session(auth=None, verify_ssl: bool = True, error_func=None,
+                   pool_maxsize: int = DEFAULT_POOLSIZE) -> requests.Session:
+    """
+    Create a requests session for connection pooling, with static auth applied.
+
+    :param auth: ('user', 'pass') for Basic Auth, a dict of headers, or a callable
+                 returning either; a callable is resolved per request by request_auth().
+    :param verify_ssl: Whether to verify the server's TLS certificate.
+    :param error_func: Called with a message if auth has an invalid type.
+    :param pool_maxsize: Connections kept open per host. Should be at least the number
+                         of threads sending at once; connections opened beyond it are
+                         closed after their request instead of being reused.
+    """
+    session = requests.Session()
+    session.verify = verify_ssl
+    if pool_maxsize > DEFAULT_POOLSIZE:
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    # Set auth if provided
+    if auth:
+        if isinstance(auth, dict):
+            # Assume it's a header dictionary
+            session.headers.update(auth)
+        elif isinstance(auth, tuple) and len(auth) == 2:
+            # Assume it's basic auth (user, pass)
+            session.auth = auth
+        elif callable(auth):
+            # Defer auth handling to the callable during request
+            pass  # Handled in request_auth
+        elif error_func is not None:
+            error_func("Invalid auth type provided. Must be tuple, dict, or callable.")
+    return session
+
+
+def request_auth(session: requests.Session, auth=None):
+    """
+    Resolve the headers and basic auth to use for a request.
+    Calls the auth callable, if one was configured.
+
+    :return: (headers, basic auth tuple or None)
+    """
+    basic_auth = session.auth  # Use session auth if set (e.g., basic)
+    request_headers = session.headers.copy()  # Start with session headers
+
+    # Handle callable auth - call it to get dynamic headers/auth
+    if callable(auth):
+        auth_result = auth()
+        if isinstance(auth_result, dict):
+            request_headers.update(auth_result)  # Update headers
+            basic_auth = None  # Clear basic auth if headers are provided
+        elif isinstance(auth_result, tuple):
+            basic_auth = auth_result  # Use tuple as basic auth
+        # else: ignore invalid result from callable
+    return request_headers, basic_auth
+
+
+def parse_header(value: str):
+    """
+    Parse a 'Name: value' request header given on the command line.
+
+    :return: (name, value)
+    :raises argparse.ArgumentTypeError: If value has no name or no colon.
+    """
+    name, sep, header_value = value.partition(":")
+    if not sep or not name.strip():
+        raise argparse.ArgumentTypeError(f"expected 'Name: value', got {value!r}")
+    return name.strip(), header_value.strip()
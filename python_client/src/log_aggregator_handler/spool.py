@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+import os
+import struct
+
+# Eviction policies when the spool reaches its maximum size
+EVICT_DROP_OLDEST = "drop_oldest"
+EVICT_DROP_NEWEST = "drop_newest"
+EVICTION_POLICIES = (EVICT_DROP_OLDEST, EVICT_DROP_NEWEST)
+
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint"
+
+# Every record is stored as a 4-byte big-endian length followed by the payload
+_FRAME_HEADER = struct.Struct(">I")
+# Checkpoint: segment sequence number and offset of the first unacknowledged record
+_CHECKPOINT = struct.Struct(">QQ")
+
+
+class DiskSpool:
+    """
+    Write-ahead spool of encoded records in fixed-size segment files.
+
+    Records are appended to the active segment; a new segment is started once
+    the active one would grow past ``segment_bytes``. The reader walks the
+    segments in order with sequential reads, and a segment file is deleted as
+    soon as every record in it has been acknowledged. The read position is
+    checkpointed after each acknowledgement, so segments left over by a
+    previous process are replayed from where it stopped (at-least-once: a batch
+    sent but not yet acknowledged when the process died is sent again).
+
+    When appending would take the spool past ``max_bytes``:
+
+    - ``"drop_oldest"``: whole segments are deleted, oldest first, acknowledged or not.
+    - ``"drop_newest"``: the record being appended is discarded.
+
+    Not thread-safe: meant to be used from a single sender thread.
+    """
+    def __init__(self, directory: str,
+                 segment_bytes: int = 4 * 1024 * 1024,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 eviction: str = EVICT_DROP_OLDEST):
+        """
+        :param directory: Directory holding the segment files. Created if missing.
+        :param segment_bytes: Size at which a new segment file is started. Defaults to 4 MiB.
+        :param max_bytes: Maximum total size of all segment files. Must be at least
+                          twice segment_bytes. Defaults to 256 MiB.
+        :param eviction: "drop_oldest" or "drop_newest". Defaults to "drop_oldest".
+        """
+        if eviction not in EVICTION_POLICIES:
+            raise ValueError(f"eviction must be one of {', '.join(EVICTION_POLICIES)}, got {eviction!r}")
+        if max_bytes < 2 * segment_bytes:
+            raise ValueError("max_bytes must be at least twice segment_bytes")
+
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.evicted_records = 0
+        self.evicted_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        # Sequence number -> size in bytes, in order; the last one is the active segment
+        self._segments = {}
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(SEGMENT_SUFFIX):
+                try:
+                    seq = int(name[:-len(SEGMENT_SUFFIX)])
+                except ValueError:
+                    continue
+                self._segments[seq] = os.path.getsize(self._path(seq))
+        self._segments = dict(sorted(self._segments.items()))
+        self._total_bytes = sum(self._segments.values())
+
+        # Segments from a previous process are never appended to again
+        self._active_seq = (max(self._segments) + 1) if self._segments else 0
+        self._active = None
+
+        self._read_seq, self._read_offset = self._load_checkpoint()
+        self._reader = None
+        self._reader_seq = None
+        self._drop_acknowledged()
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:020d}{SEGMENT_SUFFIX}")
+
+    def _load_checkpoint(self):
+        first_seq = min(self._segments) if self._segments else self._active_seq
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE), "rb") as f:
+                seq, offset = _CHECKPOINT.unpack(f.read(_CHECKPOINT.size))
+        except (OSError, struct.error):
+            return first_seq, 0
+        if seq in self._segments and offset <= self._segments[seq]:
+            return seq, offset
+        return first_seq, 0
+
+    def _save_checkpoint(self):
+        with open(os.path.join(self.directory, CHECKPOINT_FILE), "wb") as f:
+            f.write(_CHECKPOINT.pack(self._read_seq, self._read_offset))
+
+    def append(self, payload: bytes) -> bool:
+        """
+        Append an encoded record. Returns False if it was discarded by the eviction policy.
+        """
+        frame_bytes = _FRAME_HEADER.size + len(payload)
+        if self._total_bytes + frame_bytes > self.max_bytes:
+            if self.eviction == EVICT_DROP_NEWEST:
+                self.evicted_records += 1
+                self.evicted_bytes += frame_bytes
+                return False
+            while self._total_bytes + frame_bytes > self.max_bytes and self._evict_oldest():
+                pass
+
+        active_bytes = self._segments.get(self._active_seq, 0)
+        if self._active is not None and active_bytes and active_bytes + frame_bytes > self.segment_bytes:
+            self._rotate()
+
+        if self._active is None:
+            self._active = open(self._path(self._active_seq), "ab")
+            self._segments.setdefault(self._active_seq, 0)
+
+        self._active.write(_FRAME_HEADER.pack(len(payload)))
+        self._active.write(payload)
+        self._segments[self._active_seq] += frame_bytes
+        self._total_bytes += frame_bytes
+        return True
+
+    def sync(self):
+        """
+        Hand buffered appends to the operating system (they survive a process crash).
+        """
+        if self._active is not None:
+            self._active.flush()
+
+    def has_pending(self) -> bool:
+        """
+        Whether there are records that have not been acknowledged yet.
+        """
+        return self._read_offset < self._segments.get(self._read_seq, 0) or any(
+            seq > self._read_seq and size for seq, size in self._segments.items()
+        )
+
+    def pending_bytes(self) -> int:
+        """
+        Bytes of segment data not acknowledged yet.
+        """
+        return self._total_bytes - (self._read_offset if self._read_seq in self._segments else 0)
+
+    def read(self, max_records: int, max_bytes: int = None):
+        """
+        Read the next unacknowledged records, without acknowledging them.
+
+        A read never spans two segments.
+
+        :return: (records, position); pass position to ack() once the records are delivered.
+        """
+        self._advance()
+        if self._read_seq == self._active_seq:
+            self.sync()
+        size = self._segments.get(self._read_seq, 0)
+        if self._read_offset >= size:
+            return [], (self._read_seq, self._read_offset)
+
+        if self._reader_seq != self._read_seq:
+            self._close_reader()
+            self._reader = open(self._path(self._read_seq), "rb")
+            self._reader_seq = self._read_seq
+        self._reader.seek(self._read_offset)
+
+        records = []
+        offset = self._read_offset
+        total = 0
+        while len(records) < max_records and offset < size:
+            header = self._reader.read(_FRAME_HEADER.size)
+            if len(header) < _FRAME_HEADER.size:
+                break
+            (length,) = _FRAME_HEADER.unpack(header)
+            if records and max_bytes and total + length > max_bytes:
+                break
+            payload = self._reader.read(length)
+            if len(payload) < length:
+                break
+            records.append(payload)
+            offset += _FRAME_HEADER.size + length
+            total += length
+
+        if not records and self._read_seq != self._active_seq:
+            # Torn write at the end of a segment from a crashed process: skip the rest
+            offset = size
+        return records, (self._read_seq, offset)
+
+    def ack(self, position):
+        """
+        Acknowledge everything up to a position returned by read().
+        """
+        seq, offset = position
+        if (seq, offset) < (self._read_seq, self._read_offset):
+            return
+        self._read_seq, self._read_offset = seq, offset
+        self._drop_acknowledged()
+        self._save_checkpoint()
+
+    def _advance(self):
+        # Move the read position past fully acknowledged sealed segments
+        while self._read_seq != self._active_seq and self._read_offset >= self._segments.get(self._read_seq, 0):
+            later = [seq for seq in self._segments if seq > self._read_seq]
+            self._read_seq = later[0] if later else self._active_seq
+            self._read_offset = 0
+
+    def _drop_acknowledged(self):
+        self._advance()
+        for seq in [seq for seq in self._segments if seq < self._read_seq]:
+            self._delete(seq)
+
+    def _rotate(self):
+        self._active.close()
+        self._active = None
+        self._active_seq += 1
+        self._drop_acknowledged()
+
+    def _evict_oldest(self) -> bool:
+        sealed = [seq for seq in self._segments if seq != self._active_seq]
+        if not sealed:
+            if self._active is None or not self._segments.get(self._active_seq):
+                return False
+            self._rotate()
+            sealed = [seq for seq in self._segments if seq != self._active_seq]
+            if not sealed:
+                return False
+        seq = sealed[0]
+        self.evicted_records += self._count_unacked_records(seq)
+        self.evicted_bytes += self._segments[seq]
+        self._delete(seq)
+        if self._read_seq == seq:
+            self._read_offset = self._segments.get(seq, 0)
+            self._advance()
+        return True
+
+    def _count_unacked_records(self, seq: int) -> int:
+        offset = self._read_offset if seq == self._read_seq else 0
+        if seq < self._read_seq:
+            return 0
+        count = 0
+        with open(self._path(seq), "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_FRAME_HEADER.size)
+                if len(header) < _FRAME_HEADER.size:
+                    return count
+                (length,) = _FRAME_HEADER.unpack(header)
+                f.seek(length, os.SEEK_CUR)
+                count += 1
+
+    def _delete(self, seq: int):
+        if self._reader_seq == seq:
+            self._close_reader()
+        self._total_bytes -= self._segments.pop(seq)
+        try:
+            os.remove(self._path(seq))
+        except FileNotFoundError:
+            pass
+
+    def _close_reader(self):
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = None
+        self._reader_seq = None
+
+    def close(self):
+        """
+        Close open segment files. Unacknowledged records stay on disk for the next run.
+        """
+        self._close_reader()
+        if self._active is not None:
+            self._active.close()
+            self._active = None
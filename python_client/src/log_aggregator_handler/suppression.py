@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+import collections
+import logging
+import random
+import threading
+import time
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class _Repeats:
+    __slots__ = ("started", "count", "first_created", "last_record")
+
+    def __init__(self, started: float):
+        self.started = started
+        self.count = 0
+        self.first_created = None
+        self.last_record = None
+
+
+class LogSuppressor:
+    """
+    Pre-send stage that keeps log storms from turning into request storms.
+
+    Runs on the LogRecord before it is formatted, so suppressed records cost
+    a few dict lookups and nothing else. In order:
+
+    - Sampling: records of a level listed in ``sample_rates`` are kept with that
+      probability (meant for DEBUG and INFO).
+    - Duplicate collapsing: the first record of a (logger, lineno, msg template)
+      passes; repeats within ``collapse_window`` seconds are held back and later
+      sent as one record, a copy of the last repeat with ``repeat_count``,
+      ``first_timestamp`` and ``last_timestamp`` extra fields.
+    - Rate limiting: a token bucket per (logger, level) lets through ``rate_limit``
+      records per second, with bursts of up to ``rate_burst``.
+
+    Collapsed repeats are released by the first record processed after their
+    window has ended, or by drain().
+    """
+    def __init__(self, rate_limit: float = None,
+                 rate_burst: int = None,
+                 sample_rates: dict = None,
+                 collapse_window: float = None,
+                 collapse_max_keys: int = 10000,
+                 format_timestamp=None):
+        """
+        :param rate_limit: Records per second allowed per (logger, level). Defaults to None (no limit).
+        :param rate_burst: Bucket size of the rate limit. Defaults to max(1, rate_limit).
+        :param sample_rates: Mapping from log level numbers to the fraction of records kept,
+                             e.g. {logging.DEBUG: 0.01, logging.INFO: 0.1}. Defaults to None.
+        :param collapse_window: Seconds during which repeats of a record are collapsed.
+                                Defaults to None (no collapsing).
+        :param collapse_max_keys: Maximum distinct records tracked for collapsing; records
+                                  beyond that pass through. Defaults to 10000.
+        :param format_timestamp: Callable formatting the first/last timestamps of collapsed
+                                 records. Defaults to the UNIX timestamp itself.
+        """
+        if rate_limit is not None and rate_limit <= 0:
+            raise ValueError("rate_limit must be positive")
+        for level, rate in (sample_rates or {}).items():
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError(f"sample rate for level {logging.getLevelName(level)} must be between 0 and 1")
+
+        self.rate_limit = rate_limit
+        self.rate_burst = float(rate_burst if rate_burst is not None else max(1.0, rate_limit or 0.0))
+        self.sample_rates = dict(sample_rates or {})
+        self.collapse_window = collapse_window or None
+        self.collapse_max_keys = collapse_max_keys
+        self.format_timestamp = format_timestamp or (lambda timestamp: timestamp)
+
+        # Suppression counters
+        self.sampled_out = 0
+        self.rate_limited = 0
+        self.collapsed = 0
+
+        self._buckets = {}
+        # Key -> _Repeats, in window start order
+        self._repeats = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> list:
+        """
+        Run a record through the stage.
+
+        :return: The records to send now: collapsed records whose window has ended,
+                 followed by the record itself unless it was suppressed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            released = self._release_expired(now) if self._repeats else []
+
+            rate = self.sample_rates.get(record.levelno)
+            if rate is not None and random.random() >= rate:
+                self.sampled_out += 1
+                return released
+
+            if self.collapse_window is not None and self._collapse(record, now):
+                self.collapsed += 1
+                return released
+
+            if self.rate_limit is not None and not self._take_token((record.name, record.levelno), now):
+                self.rate_limited += 1
+                return released
+
+            released.append(record)
+            return released
+
+    def drain(self) -> list:
+        """
+        Release all collapsed records, whether their window has ended or not.
+        """
+        with self._lock:
+            return self._release_expired(None)
+
+    def counters(self) -> dict:
+        """
+        Number of records suppressed so far, per reason.
+        """
+        return {
+            "sampled_out": self.sampled_out,
+            "rate_limited": self.rate_limited,
+            "collapsed": self.collapsed,
+        }
+
+    def _collapse(self, record: logging.LogRecord, now: float) -> bool:
+        # True if the record is a repeat and has been held back
+        try:
+            key = (record.name, record.lineno, record.msg)
+            repeats = self._repeats.get(key)
+        except TypeError:  # Unhashable msg
+            return False
+        if repeats is None:
+            if len(self._repeats) < self.collapse_max_keys:
+                self._repeats[key] = _Repeats(now)
+            return False
+        if repeats.count == 0:
+            repeats.first_created = record.created
+        repeats.count += 1
+        repeats.last_record = record
+        return True
+
+    def _release_expired(self, now) -> list:
+        released = []
+        while self._repeats:
+            key, repeats = next(iter(self._repeats.items()))
+            if now is not None and now - repeats.started < self.collapse_window:
+                break
+            del self._repeats[key]
+            if repeats.count:
+                released.append(self._summary(repeats))
+        return released
+
+    def _summary(self, repeats: _Repeats) -> logging.LogRecord:
+        summary = logging.makeLogRecord(repeats.last_record.__dict__)
+        summary.repeat_count = repeats.count
+        summary.first_timestamp = self.format_timestamp(repeats.first_created)
+        summary.last_timestamp = self.format_timestamp(repeats.last_record.created)
+        return summary
+
+    def _take_token(self, key, now: float) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(self.rate_burst, now)
+        else:
+            bucket.tokens = min(self.rate_burst, bucket.tokens + (now - bucket.updated) * self.rate_limit)
+            bucket.updated = now
+        if bucket.tokens < 1.0:
+            return False
+        bucket.tokens -= 1.0
+        return True
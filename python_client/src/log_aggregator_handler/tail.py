@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""
+Live tail of the log aggregation API.
+
+LogAggregatorClient.tail() polls for entries newer than the highest id seen
+so far; TailCache keeps recent entries and those high-water marks, so a new
+or restarted tail takes its backlog from the cache and fetches only the
+entries logged after it.
+
+Run it with the ``log-aggregator-tail`` command.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from .session import parse_header, resolve_api_endpoint
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "log-aggregator")
+
+# Filters of a tail query; other query parameters do not change which entries match
+TAIL_FILTERS = ("host", "host_process", "log_level")
+
+
+def _filter_key(filters: dict) -> str:
+    return json.dumps({name: filters[name] for name in TAIL_FILTERS if filters.get(name) is not None},
+                      sort_keys=True)
+
+
+def default_cache_path(api_endpoint: str) -> str:
+    """
+    Cache file of the tail command: one per endpoint, so tailing another endpoint
+    does not discard the cache of the first.
+    """
+    digest = hashlib.sha256(api_endpoint.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DEFAULT_CACHE_DIR, f"tail-{digest}.json")
+
+
+def _matches(entry: dict, filters: dict) -> bool:
+    return all(entry.get(name) == value for name, value in filters.items())
+
+
+class TailCache:
+    """
+    Bounded cache of recently tailed entries, optionally kept in a JSON file.
+
+    It holds the entries of one endpoint: ids are only unique per endpoint, so
+    storing entries of another endpoint first discards what it held, and it
+    has nothing for any endpoint but the last one stored. For every query (its
+    host, host_process and log_level filters) it records the id range it has
+    fetched completely: all matching entries with start < id <= high are in
+    the cache. A query is covered by any query with a subset of its filters,
+    e.g. ``host=web-1`` covers ``host=web-1, log_level=ERROR``, so a narrower
+    tail can be served from a broader one. When entries are evicted, the
+    ranges shrink accordingly.
+    """
+    def __init__(self, path: str = None, max_entries: int = 10000):
+        """
+        :param path: JSON file to load the cache from and save() it to. Defaults to None
+                     (memory only).
+        :param max_entries: Maximum entries kept; the lowest ids are evicted first. Defaults to 10000.
+        """
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.api_endpoint = None  # Endpoint the entries were fetched from
+        self._entries = {}  # id -> entry
+        self._ranges = {}   # filter key -> [start, high]
+        self._dirty = False
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def resume(self, api_endpoint: str, filters: dict, since_id: int = None, backlog: int = 10):
+        """
+        Find what the cache already has for a tail query.
+
+        :param api_endpoint: The logs endpoint of the query.
+        :param filters: host, host_process and log_level of the query (None values ignored).
+        :param since_id: Highest id the caller has seen, or None for a new tail.
+        :param backlog: For a new tail, how many of the most recent entries to return.
+        :return: (entries, oldest first, and the highest id they are complete up to),
+                 or None if no cached query covers this one. For a new tail, newer
+                 entries may exist beyond that id.
+        """
+        if api_endpoint != self.api_endpoint:
+            return None
+        filters = {name: value for name, value in filters.items() if name in TAIL_FILTERS and value is not None}
+        best = None
+        for key, (start, high) in self._ranges.items():
+            covering = json.loads(key)
+            if not all(filters.get(name) == value for name, value in covering.items()):
+                continue
+            if since_id is not None and not start <= since_id <= high:
+                continue  # Entries right after since_id are missing
+            if best is None or high > best[1]:
+                best = (start, high)
+        if best is None:
+            return None
+
+        start, high = best
+        if since_id is None:
+            # Display only: the most recent entries, whether or not their range is complete
+            entries = self._select(filters, None, high)
+            return (entries[-backlog:] if backlog > 0 else []), high
+        return self._select(filters, since_id, high), high
+
+    def _select(self, filters: dict, low, high: int) -> list:
+        return sorted((entry for entry_id, entry in self._entries.items()
+                       if (low is None or low < entry_id) and entry_id <= high and _matches(entry, filters)),
+                      key=lambda entry: int(entry["id"]))
+
+    def store(self, api_endpoint: str, filters: dict, since_id, entries: list):
+        """
+        Add the entries a query fetched after since_id.
+
+        :param api_endpoint: The logs endpoint the entries were fetched from.
+        :param since_id: The id the query polled after. None for a backlog that does not
+                         cover an id range completely; its entries are kept for display
+                         and the range starts after the highest of them.
+        """
+        if api_endpoint != self.api_endpoint:
+            self._entries, self._ranges = {}, {}
+            self.api_endpoint = api_endpoint
+        key = _filter_key(filters)
+        high = since_id
+        for entry in entries:
+            entry_id = int(entry["id"])
+            self._entries[entry_id] = entry
+            high = entry_id if high is None else max(high, entry_id)
+
+        current = self._ranges.get(key)
+        if since_id is None:
+            if high is not None and (current is None or current[1] < high):
+                self._ranges[key] = [high, high]
+        elif current is not None and current[0] <= since_id <= current[1]:
+            current[1] = max(current[1], high)  # Contiguous with what is cached
+        elif current is None or current[1] < high:
+            self._ranges[key] = [since_id, high]
+
+        self._dirty = True
+        if len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        # Drop the lowest ids; ranges then only start after the last evicted id
+        ids = sorted(self._entries)
+        evicted = ids[:len(ids) - self.max_entries]
+        for entry_id in evicted:
+            del self._entries[entry_id]
+        cutoff = evicted[-1]
+        for key, (start, high) in list(self._ranges.items()):
+            if high <= cutoff:
+                del self._ranges[key]
+            elif start < cutoff:
+                self._ranges[key][0] = cutoff
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.api_endpoint = data.get("api_endpoint")
+            self._entries = {int(entry["id"]): entry for entry in data.get("entries", [])}
+            self._ranges = {key: list(bounds) for key, bounds in data.get("ranges", {}).items()}
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError, AttributeError):
+            # A corrupt cache only costs a refetch
+            self.api_endpoint, self._entries, self._ranges = None, {}, {}
+
+    def save(self):
+        """
+        Write the cache to its file, atomically. Does nothing without a path or changes.
+        """
+        if self.path is None or not self._dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        data = {"api_endpoint": self.api_endpoint, "ranges": self._ranges, "entries": [self._entries[entry_id] for entry_id in sorted(self._entries)]}
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tail-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._dirty = False
+
+
+def format_entry(entry: dict) -> str:
+    """
+    One line per entry, like a plain text log file.
+    """
+    return " ".join(str(entry.get(name) if entry.get(name) is not None else "-")
+                    for name in ("timestamp", "host", "host_process", "log_level", "log_message"))
+
+
+def main(argv=None):
+    """
+    Entry point of the log-aggregator-tail command.
+    """
+    from .client import LogAggregatorClient
+
+    parser = argparse.ArgumentParser(
+        prog="log-aggregator-tail",
+        description="Print log entries from the log aggregation API as they arrive.",
+    )
+    parser.add_argument("--api-endpoint", default=None,
+                        help="Logs endpoint URL (default: $LOG_AGGREGATOR_API_ENDPOINT)")
+    parser.add_argument("--header", action="append", type=parse_header, default=[],
+                        help="Request header 'Name: value' sent to the API, e.g. for authentication. Repeatable.")
+    parser.add_argument("--host", default=None, help="Only entries of this host")
+    parser.add_argument("--host-process", default=None, help="Only entries of this host process")
+    parser.add_argument("--level", default=None, help="Only entries of this level, e.g. ERROR")
+    parser.add_argument("-n", "--lines", type=int, default=10, help="Recent entries to print first (default: %(default)s)")
+    parser.add_argument("--wait", type=float, default=20.0,
+                        help="Seconds the server may hold a poll open waiting for new entries (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Minimum seconds between polls that found nothing (default: %(default)s)")
+    parser.add_argument("--cache", default=None,
+                        help=f"Cache file (default: one per endpoint in {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the cache file")
+    parser.add_argument("--json", action="store_true", help="Print each entry as a JSON object")
+    args = parser.parse_args(argv)
+
+    try:
+        api_endpoint = resolve_api_endpoint(args.api_endpoint)
+    except ValueError as e:
+        parser.error(str(e))
+
+    cache = TailCache(None if args.no_cache else args.cache or default_cache_path(api_endpoint))
+    client = LogAggregatorClient(api_endpoint=api_endpoint, auth=dict(args.header) or None)
+    entries = client.tail(host=args.host, host_process=args.host_process, log_level=args.level,
+                          backlog=args.lines, wait=args.wait, poll_interval=args.interval, cache=cache)
+    try:
+        for entry in entries:
+            print(json.dumps(entry) if args.json else format_entry(entry), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        entries.close()  # Saves the cache
+        client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+MessagePack batch format, an alternative to JSON for the batch endpoint.
+
+Most fields of an entry (host, logger, module, file, process, thread) are the
+same for many records of a batch. A batch sends each distinct combination of
+them once, as a context, and every record only the index of its context and
+the fields that vary:
+
+    {"version": 1,
+     "context_fields": ["host", "host_process", ...],
+     "contexts": [["web-1", "app.db", ...], ...],
+     "records": [[context index, timestamp, level, message, lineno, {other fields}], ...]}
+
+Timestamps are integer microseconds since the epoch (UTC) instead of ISO
+strings. The server expands a batch back into the entries JSON would have
+sent (see php_app/app/services/MessagePackBatch.php).
+"""
+import calendar
+import datetime
+import json
+import operator
+import struct
+import threading
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, batches are sent as JSON without it
+    msgpack = None
+
+WIRE_JSON = "json"
+WIRE_MSGPACK = "msgpack"
+WIRE_FORMATS = (WIRE_JSON, WIRE_MSGPACK)
+
+MSGPACK_CONTENT_TYPE = "application/x-msgpack"
+BATCH_VERSION = 1
+
+# Entry fields sent once per batch, in this order
+CONTEXT_FIELDS = ("host", "host_process", "logger_name", "module", "filename", "process", "thread", "threadName")
+# Fields every record has, after its context index; the rest of the entry follows as a map
+RECORD_FIELDS = ("timestamp", "level", "message", "lineno")
+_FIXED_FIELDS = CONTEXT_FIELDS + RECORD_FIELDS
+_FIXED_FIELD_SET = frozenset(_FIXED_FIELDS)
+_get_context = operator.itemgetter(*CONTEXT_FIELDS)
+
+# First byte of a packed record; never the first byte of a JSON record (0xc1 is unused by MessagePack too)
+_PACKED_MARK = b"\xc1"
+_CONTEXT_LENGTH = struct.Struct("<I")
+_HEADER_SIZE = 1 + _CONTEXT_LENGTH.size
+
+# Distinct contexts remembered by an encoder; a host rarely has more loggers and threads
+MAX_CACHED_CONTEXTS = 4096
+
+
+def _array_header(length: int) -> bytes:
+    if length < 16:
+        return bytes((0x90 | length,))
+    if length < 0x10000:
+        return b"\xdc" + length.to_bytes(2, "big")
+    return b"\xdd" + length.to_bytes(4, "big")
+
+
+def _default(value):
+    # Types orjson encodes natively but msgpack does not
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Type is not MessagePack serializable: {type(value).__name__}")
+
+
+def is_packed(payload: bytes) -> bool:
+    """
+    Whether an encoded record was packed by MsgpackEncoder rather than encoded to JSON.
+    """
+    return payload[:1] == _PACKED_MARK
+
+
+def format_micros(micros: int) -> str:
+    """
+    Epoch microseconds as the ISO 8601 timestamp of a JSON entry.
+    """
+    seconds, fraction = divmod(micros, 1000000)
+    prefix = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S')
+    return f"{prefix}.{fraction:06d}+00:00"
+
+
+def unpack_record(payload: bytes) -> dict:
+    """
+    The entry dict of a packed record, as JSON would have sent it.
+    """
+    length = _CONTEXT_LENGTH.unpack_from(payload, 1)[0]
+    context = msgpack.unpackb(payload[_HEADER_SIZE:_HEADER_SIZE + length])
+    timestamp, level, message, lineno, fields = msgpack.unpackb(
+        b"\x95" + payload[_HEADER_SIZE + length:], strict_map_key=False)
+    entry = {
+        "timestamp": format_micros(timestamp) if isinstance(timestamp, int) else timestamp,
+        "level": level,
+        "message": message,
+    }
+    entry.update(zip(CONTEXT_FIELDS, context))
+    entry["lineno"] = lineno
+    entry.update(fields)
+    return entry
+
+
+def unpack_batch(body: bytes) -> list:
+    """
+    The entries of a batch request body, as JSON would have sent them, like the
+    PHP app's MessagePackBatch::decode(). Records that cannot be read are None.
+
+    :raises ValueError: If body is not a MessagePack batch.
+    """
+    try:
+        batch = msgpack.unpackb(body, strict_map_key=False)
+    except Exception as e:
+        raise ValueError(f"Invalid MessagePack batch: {e}") from e
+    if (not isinstance(batch, dict) or batch.get("version") != BATCH_VERSION
+            or not all(isinstance(batch.get(key), list) for key in ("context_fields", "contexts", "records"))):
+        raise ValueError("Invalid MessagePack batch")
+
+    fields = batch["context_fields"]
+    contexts = [dict(zip(fields, context)) if isinstance(context, list) and len(context) == len(fields) else None
+                for context in batch["contexts"]]
+    entries = []
+    for record in batch["records"]:
+        if (not isinstance(record, list) or len(record) < 5 or type(record[0]) is not int
+                or not 0 <= record[0] < len(contexts) or contexts[record[0]] is None):
+            entries.append(None)
+            continue
+        entry = dict(contexts[record[0]])
+        timestamp = record[1]
+        entry["timestamp"] = format_micros(timestamp) if type(timestamp) is int else timestamp
+        entry["level"], entry["message"], entry["lineno"] = record[2:5]
+        if len(record) > 5 and isinstance(record[5], dict):
+            for key, value in record[5].items():
+                entry.setdefault(key, value)
+        entries.append(entry)
+    return entries
+
+
+class MsgpackEncoder:
+    """
+    Packs entry dicts into records of the MessagePack batch format and joins them into batches.
+
+    A packed record is bytes holding a marker, its packed context and its packed
+    record fields, so it is queued, spooled and limited by batch_max_bytes like
+    a JSON record. A context is packed once and reused while it is cached.
+    batch() also takes JSON records (forwarded by an agent, or spooled before
+    MessagePack was enabled) and packs them on the way.
+    """
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The MessagePack wire format requires msgpack. "
+                              "Install it with: pip install log-aggregator-handler[msgpack]")
+        self._contexts = {}  # context values -> context header of a packed record
+        self._local = threading.local()  # A Packer per sender thread; Packers are not thread-safe
+        self._second = (None, None)  # ("YYYY-MM-DDTHH:MM:SS", epoch seconds) of the last timestamp
+        self._batch_head = b"".join((
+            b"\x84",  # A map of 4
+            msgpack.packb("version"), msgpack.packb(BATCH_VERSION),
+            msgpack.packb("context_fields"), msgpack.packb(CONTEXT_FIELDS),
+            msgpack.packb("contexts"),
+        ))
+        self._records_key = msgpack.packb("records")
+
+    def _packer(self):
+        packer = getattr(self._local, "packer", None)
+        if packer is None:
+            packer = self._local.packer = msgpack.Packer(default=_default)
+        return packer
+
+    def _micros(self, timestamp):
+        # Entries carry the serializer's "YYYY-MM-DDTHH:MM:SS.ffffff+00:00"; anything else is sent as it is
+        cached_prefix, seconds = self._second
+        if type(timestamp) is not str or len(timestamp) != 32:
+            return timestamp
+        prefix = timestamp[:19]
+        if cached_prefix != prefix:
+            if timestamp[19] != "." or not timestamp.endswith("+00:00"):
+                return timestamp
+            try:
+                seconds = calendar.timegm(datetime.datetime.strptime(prefix, '%Y-%m-%dT%H:%M:%S').timetuple())
+            except ValueError:
+                return timestamp
+            self._second = (prefix, seconds)
+        return seconds * 1000000 + int(timestamp[20:26])
+
+    def pack(self, entry: dict) -> bytes:
+        """
+        Pack an entry dict (see RecordSerializer.to_dict()) into a record.
+
+        :raises TypeError: If a value cannot be serialized.
+        """
+        packer = self._packer()
+        try:
+            context = _get_context(entry)
+        except KeyError:
+            context = tuple(entry.get(name) for name in CONTEXT_FIELDS)
+        # Its length and the packed context, the start of every record with this context
+        context_header = self._contexts.get(context)
+        if context_header is None:
+            if len(self._contexts) >= MAX_CACHED_CONTEXTS:
+                self._contexts.clear()
+            packed_context = packer.pack(context)
+            context_header = self._contexts[context] = _CONTEXT_LENGTH.pack(len(packed_context)) + packed_context
+        fields = entry.copy()
+        try:
+            for key in _FIXED_FIELDS:
+                del fields[key]
+        except KeyError:
+            fields = {key: value for key, value in entry.items() if key not in _FIXED_FIELD_SET}
+        # A 5-element array; its 1-byte header is replaced by a 6-element one in batch()
+        packed = packer.pack((self._micros(entry.get("timestamp")), entry.get("level"), entry.get("message"),
+                              entry.get("lineno"), fields))
+        return b"".join((_PACKED_MARK, context_header, memoryview(packed)[1:]))
+
+    def batch(self, payloads: list) -> bytes:
+        """
+        Join packed (or JSON) records into a batch request body.
+        """
+        contexts = {}  # packed context -> record prefix: 6-element array header and context index
+        parts = []
+        unpack_length = _CONTEXT_LENGTH.unpack_from
+        for payload in payloads:
+            if not is_packed(payload):
+                payload = self.pack(json.loads(payload))
+            end = _HEADER_SIZE + unpack_length(payload, 1)[0]
+            packed_context = payload[_HEADER_SIZE:end]
+            prefix = contexts.get(packed_context)
+            if prefix is None:
+                prefix = contexts[packed_context] = b"\x96" + msgpack.packb(len(contexts))
+            parts.append(prefix)
+            parts.append(memoryview(payload)[end:])
+        return b"".join((self._batch_head, _array_header(len(contexts)), *contexts,
+                         self._records_key, _array_header(len(payloads)), *parts))
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import logging
+
+
+def make_record(msg="Message %d", args=(0,), level=logging.INFO, name="test_logger", lineno=10,
+                exc_info=None, **attrs):
+    """
+    Build a LogRecord as a logging call in /path/to/test.py would.
+
+    :param attrs: Other attributes to set on the record, e.g. thread and threadName.
+    """
+    record = logging.LogRecord(name=name, level=level, pathname="/path/to/test.py", lineno=lineno,
+                               msg=msg, args=args, exc_info=exc_info, func="test_function")
+    record.__dict__.update(attrs)
+    return record
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import os
+import time
+
+import pytest
+
+from log_aggregator_handler import AgentHandler
+from log_aggregator_handler.agent import LogAgent, main, parse_address
+from .helpers import make_record
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+TEST_BATCH_ENDPOINT = TEST_API_ENDPOINT + "/batch"
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _shipped_messages(requests_mock):
+    messages = []
+    for request in requests_mock.request_history:
+        messages.extend(entry["message"] for entry in json.loads(request.text))
+    return messages
+
+
+def test_parse_address():
+    """
+    Test the unix:, udp: and plain path address forms.
+    """
+    assert parse_address("unix:/run/agent.sock")[2] == "/run/agent.sock"
+    assert parse_address("/run/agent.sock")[2] == "/run/agent.sock"
+    assert parse_address("udp:127.0.0.1:5140")[2] == ("127.0.0.1", 5140)
+    with pytest.raises(ValueError):
+        parse_address("udp:5140")
+
+
+@pytest.mark.parametrize("address", ["unix:{tmp}/agent.sock", "udp:127.0.0.1:0"])
+def test_agent_ships_batches(requests_mock, tmp_path, address):
+    """
+    Test that records written by AgentHandler are shipped in batches by the agent.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, json={"inserted": 5, "failed": 0, "results": []}, status_code=200)
+    agent = LogAgent(address.format(tmp=tmp_path), api_endpoint=TEST_API_ENDPOINT, batch_linger=0.05)
+    agent.start()
+    if address.startswith("udp:"):
+        address = "udp:127.0.0.1:%d" % agent._server.server_address[1]
+
+    handler = AgentHandler(address.format(tmp=tmp_path))
+    for i in range(5):
+        handler.emit(make_record(args=(i,), name="worker"))
+    _wait_for(lambda: agent.received == 5)
+    agent.close()
+    handler.close()
+
+    assert _shipped_messages(requests_mock) == [f"Message {i}" for i in range(5)]
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_reconnects(requests_mock, tmp_path):
+    """
+    Test that a forked child gets its own connection to the agent.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, json={"inserted": 1, "failed": 0, "results": []}, status_code=200)
+    address = f"unix:{tmp_path}/agent.sock"
+    agent = LogAgent(address, api_endpoint=TEST_API_ENDPOINT, batch_linger=0.05)
+    agent.start()
+
+    handler = AgentHandler(address)
+    handler.emit(make_record(args=(0,), name="worker"))
+    parent_sock = handler._sock
+
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            assert handler._sock is None
+            handler.emit(make_record(args=(1,), name="worker"))
+            status = 0 if handler._sock is not None and handler.dropped == 0 else 1
+        finally:
+            os._exit(status)
+    _, status = os.waitpid(pid, 0)
+    assert status == 0
+
+    handler.emit(make_record(args=(2,), name="worker"))
+    assert handler._sock is parent_sock
+    _wait_for(lambda: agent.received == 3)
+    agent.close()
+    handler.close()
+
+    assert sorted(_shipped_messages(requests_mock)) == ["Message 0", "Message 1", "Message 2"]
+
+
+def test_agent_unreachable_drops(tmp_path, capsys):
+    """
+    Test that records are counted as dropped when no agent is listening.
+    """
+    handler = AgentHandler(f"unix:{tmp_path}/missing.sock", reconnect_delay=60)
+    handler.emit(make_record(args=(0,), name="worker"))
+    handler.emit(make_record(args=(1,), name="worker"))
+    assert handler.dropped == 2
+    assert capsys.readouterr().err.count("Cannot connect to agent") == 1
+    handler.close()
+
+
+def test_agent_unreachable_quiet_without_raise_exceptions(tmp_path, capsys, monkeypatch):
+    """
+    Test that connection errors are not printed when logging.raiseExceptions is off.
+    """
+    monkeypatch.setattr(logging, "raiseExceptions", False)
+    handler = AgentHandler(f"unix:{tmp_path}/missing.sock", reconnect_delay=60)
+    handler.emit(make_record(args=(0,), name="worker"))
+    assert handler.dropped == 1
+    assert capsys.readouterr().err == ""
+    handler.close()
+
+
+def test_agent_keeps_file_at_socket_path(tmp_path):
+    """
+    Test that the agent refuses to replace a file at its socket path that is not a socket.
+    """
+    path = tmp_path / "agent.sock"
+    path.write_text("not a socket")
+    with pytest.raises(FileExistsError):
+        LogAgent(f"unix:{path}", api_endpoint=TEST_API_ENDPOINT)
+    assert path.read_text() == "not a socket"
+
+
+def test_main_rejects_bad_header():
+    """
+    Test that the command line validates --header.
+    """
+    with pytest.raises(SystemExit):
+        main(["--api-endpoint", TEST_API_ENDPOINT, "--header", "no-colon"])
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from log_aggregator_handler import AsyncLogAggregatorHandler
+from .helpers import make_record
+
+
+async def _start_standin_server(batch_status=200):
+    """
+    Start an in-process stand-in for the aggregation API on a free local port.
+    Returns (runner, base_url, received) where received collects request details.
+    """
+    received = []
+
+    async def add_log(request):
+        received.append(("single", dict(request.headers), await request.json()))
+        return web.json_response({"id": len(received)}, status=201)
+
+    async def add_logs(request):
+        if batch_status != 200:
+            return web.json_response({"error": "Not Found"}, status=batch_status)
+        items = await request.json()
+        received.append(("batch", dict(request.headers), items))
+        return web.json_response({"inserted": len(items), "failed": 0, "results": [{"id": i} for i in range(len(items))]})
+
+    async def health(request):
+        return web.json_response({"status": "OK"})
+
+    app = web.Application()
+    app.router.add_post("/api/logs", add_log)
+    app.router.add_post("/api/logs/batch", add_logs)
+    app.router.add_get("/api/health", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", received
+
+
+def test_async_emit_batched():
+    """
+    Test that records are shipped in batches from the event loop and aflush() waits for them.
+    """
+    async def main():
+        runner, base_url, received = await _start_standin_server()
+        handler = AsyncLogAggregatorHandler(api_endpoint=base_url + "/api/logs", retry_attempts=0,
+                                            batch_size=3, batch_linger=5.0, auth={"Authorization": "Bearer token"})
+        for i in range(5):
+            handler.emit(make_record(args=(i,)))
+        assert await handler.aflush(timeout=5.0)
+        await handler.aclose()
+        await runner.cleanup()
+        return received
+
+    received = asyncio.run(main())
+
+    assert [kind for kind, headers, body in received] == ["batch", "batch"]
+    assert [len(body) for kind, headers, body in received] == [3, 2]
+    assert all(headers["Authorization"] == "Bearer token" for kind, headers, body in received)
+    messages = [entry["message"] for kind, headers, body in received for entry in body]
+    assert messages == [f"Message {i}" for i in range(5)]
+
+
+def test_async_same_format_as_sync_handler():
+    """
+    Test that the async handler ships the same record format as LogAggregatorHandler.
+    """
+    async def main():
+        runner, base_url, received = await _start_standin_server()
+        handler = AsyncLogAggregatorHandler(api_endpoint=base_url + "/api/logs", retry_attempts=0, batch_size=1)
+        record = make_record(args=(7,))
+        handler.emit(record)
+        await handler.aclose(timeout=5.0)
+        await runner.cleanup()
+        return received, handler.format_record(record)
+
+    received, expected = asyncio.run(main())
+
+    assert len(received) == 1
+    kind, headers, body = received[0]
+    assert kind == "single"
+    assert body == json.loads(json.dumps(expected))
+
+
+def test_async_fallback_to_single_posts():
+    """
+    Test that the async handler falls back to single posts without a batch endpoint.
+    """
+    async def main():
+        runner, base_url, received = await _start_standin_server(batch_status=404)
+        handler = AsyncLogAggregatorHandler(api_endpoint=base_url + "/api/logs", retry_attempts=0,
+                                            batch_size=10, batch_linger=0.01)
+        for i in range(3):
+            handler.emit(make_record(args=(i,)))
+        await handler.aclose(timeout=5.0)
+        await runner.cleanup()
+        return received
+
+    received = asyncio.run(main())
+
+    assert [kind for kind, headers, body in received] == ["single"] * 3
+
+
+def test_async_health_check():
+    """
+    Test the non-blocking health check against the stand-in server.
+    """
+    async def main():
+        runner, base_url, received = await _start_standin_server()
+        handler = AsyncLogAggregatorHandler(api_endpoint=base_url + "/api/logs")
+        healthy = await handler.acheck_connection()
+        handler_down = AsyncLogAggregatorHandler(api_endpoint="http://127.0.0.1:1/api/logs", timeout=1.0)
+        unhealthy = await handler_down.acheck_connection()
+        await handler.aclose()
+        await handler_down.aclose()
+        await runner.cleanup()
+        return healthy, unhealthy
+
+    assert asyncio.run(main()) == (True, False)
+
+
+def test_async_health_check_reuses_running_session(monkeypatch):
+    """
+    Test that a started handler checks the API over its sending session instead of opening one.
+    """
+    async def main():
+        runner, base_url, received = await _start_standin_server()
+        handler = AsyncLogAggregatorHandler(api_endpoint=base_url + "/api/logs")
+        handler.start()
+        await asyncio.sleep(0)  # Let the task open its session
+        sessions = []
+        monkeypatch.setattr(aiohttp, "ClientSession", lambda *args, **kwargs: sessions.append(args) or None)
+        healthy = await handler.acheck_connection()
+        monkeypatch.undo()
+        await handler.aclose()
+        await runner.cleanup()
+        return healthy, sessions
+
+    assert asyncio.run(main()) == (True, [])
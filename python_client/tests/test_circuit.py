@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import time
+
+from log_aggregator_handler.circuit import CircuitBreaker, backoff_delay
+
+
+def test_backoff_delay_is_capped_and_jittered():
+    """
+    Test that the delay doubles per attempt, stays within [delay/2, delay] and respects the cap.
+    """
+    for attempt, expected in ((1, 1.0), (2, 2.0), (3, 4.0), (10, 30.0)):
+        for _ in range(20):
+            delay = backoff_delay(attempt, 1.0, 30.0)
+            assert expected / 2 <= delay <= expected
+
+
+def test_opens_after_threshold_and_closes_on_probe():
+    """
+    Test closed -> open after consecutive failures, and open -> closed once the probe succeeds.
+    """
+    probes = []
+    healthy = [False]
+
+    def probe():
+        probes.append(time.monotonic())
+        return healthy[0]
+
+    circuit = CircuitBreaker(failure_threshold=3, backoff_base=0.05, backoff_max=0.05, probe=probe)
+    circuit.record_failure()
+    circuit.record_failure()
+    circuit.record_success()  # Resets the count
+    circuit.record_failure()
+    circuit.record_failure()
+    assert circuit.state == "closed"
+    circuit.record_failure()
+    assert circuit.state == "open"
+
+    # Refused without probing during the open period
+    assert not circuit.allow_request()
+    assert probes == []
+
+    time.sleep(0.06)
+    assert not circuit.allow_request()  # Probe fails: open again
+    assert circuit.state == "open"
+    assert len(probes) == 1
+
+    healthy[0] = True
+    time.sleep(0.06)
+    assert circuit.allow_request()
+    assert circuit.state == "closed"
+    assert circuit.trips == 2
+
+
+def test_half_open_trial_request_without_probe():
+    """
+    Test that without a probe, the first request after the open period is the trial.
+    """
+    circuit = CircuitBreaker(failure_threshold=1, backoff_base=0.02, backoff_max=0.02)
+    circuit.record_failure()
+    time.sleep(0.03)
+    assert circuit.allow_request()
+    assert circuit.state == "half_open"
+    assert not circuit.allow_request()  # Only one trial at a time
+    circuit.record_failure()
+    assert circuit.state == "open"
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from log_aggregator_handler import LogAggregatorClient, LogAggregatorHandler
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+
+
+def _entries(first, count):
+    return [{"id": i, "host": "web-1", "log_level": "INFO", "log_message": f"Message {i}"}
+            for i in range(first, first + count)]
+
+
+def test_iter_logs_follows_cursor(requests_mock):
+    """
+    Test that pages are walked through the X-Next-Cursor header, with the filters on every request.
+    """
+    requests_mock.get(TEST_API_ENDPOINT, [
+        {"json": _entries(0, 2), "headers": {"X-Next-Cursor": "c1"}},
+        {"json": _entries(2, 2), "headers": {"X-Next-Cursor": "c2"}},
+        {"json": _entries(4, 1)},
+    ])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT, page_size=2)
+
+    ids = [entry["id"] for entry in client.iter_logs(host="web-1", log_level="INFO")]
+
+    assert ids == [0, 1, 2, 3, 4]
+    queries = [request.qs for request in requests_mock.request_history]
+    assert [query.get("cursor") for query in queries] == [None, ["c1"], ["c2"]]
+    assert all(query["host"] == ["web-1"] and query["limit"] == ["2"] for query in queries)
+    client.close()
+
+
+def test_iter_logs_ndjson(requests_mock):
+    """
+    Test that NDJSON pages are requested with the Accept header and parsed line by line.
+    """
+    body = "\n".join(json.dumps(entry) for entry in _entries(0, 3)) + "\n"
+    requests_mock.get(TEST_API_ENDPOINT, text=body, headers={"Content-Type": "application/x-ndjson"})
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT, ndjson=True)
+
+    assert [entry["id"] for entry in client.iter_logs()] == [0, 1, 2]
+    assert requests_mock.last_request.headers["Accept"] == "application/x-ndjson"
+    client.close()
+
+
+def test_iter_logs_retries_server_errors_and_raises_client_errors(requests_mock):
+    """
+    Test that 5xx pages are retried, and that 4xx errors are raised from the generator.
+    """
+    requests_mock.get(TEST_API_ENDPOINT, [
+        {"status_code": 503, "text": "Unavailable"},
+        {"json": _entries(0, 1), "headers": {"X-Next-Cursor": "c1"}},
+        {"status_code": 400, "json": {"error": "Invalid cursor"}},
+    ])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT, retry_delay=0.1, retry_max_delay=0.1)
+
+    received = []
+    with pytest.raises(requests.exceptions.HTTPError):
+        for entry in client.iter_logs():
+            received.append(entry["id"])
+
+    assert received == [0]
+    assert requests_mock.call_count == 3
+    client.close()
+
+
+def test_iter_logs_stops_prefetching_when_closed(requests_mock):
+    """
+    Test that closing the generator early stops the prefetch thread.
+    """
+    requests_mock.get(TEST_API_ENDPOINT, json=_entries(0, 2), headers={"X-Next-Cursor": "again"})
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT, page_size=2)
+
+    logs = client.iter_logs()
+    assert next(logs)["id"] == 0
+    logs.close()
+
+    threads = [thread for thread in threading.enumerate() if thread.name == "LogAggregatorClientPrefetch"]
+    for thread in threads:
+        thread.join(timeout=2.0)
+        assert not thread.is_alive()
+    # One page being read, one queued and at most one more that was waiting for room
+    assert requests_mock.call_count <= 3
+    client.close()
+
+
+def test_from_handler_shares_auth(requests_mock):
+    """
+    Test that a client created from a handler uses its endpoint and auth headers.
+    """
+    requests_mock.get(TEST_API_ENDPOINT, json=[])
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, auth={"Authorization": "Bearer token"})
+    client = LogAggregatorClient.from_handler(handler)
+
+    assert list(client.iter_logs()) == []
+    assert requests_mock.last_request.headers["Authorization"] == "Bearer token"
+    client.close()
+    handler.close()
+
+
+def test_search_sends_query_and_follows_cursor(requests_mock):
+    """
+    Test that search() sends q with the filters on every page and walks the cursor.
+    """
+    requests_mock.get(TEST_API_ENDPOINT, [
+        {"json": [dict(entry, score=2.0) for entry in _entries(0, 2)], "headers": {"X-Next-Cursor": "c1"}},
+        {"json": [dict(entry, score=1.0) for entry in _entries(2, 1)]},
+    ])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT, page_size=2)
+
+    entries = list(client.search("Disk Quota", host="web-1"))
+
+    assert [entry["id"] for entry in entries] == [0, 1, 2]
+    assert [entry["score"] for entry in entries] == [2.0, 2.0, 1.0]
+    # requests_mock lowercases request.qs values
+    queries = [parse_qs(urlparse(request.url).query) for request in requests_mock.request_history]
+    assert all(query["q"] == ["Disk Quota"] and query["host"] == ["web-1"] for query in queries)
+    assert [query.get("cursor") for query in queries] == [None, ["c1"]]
+    client.close()
+
+
+def test_search_requires_words():
+    """
+    Test that an empty search is rejected before any request is made.
+    """
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    with pytest.raises(ValueError):
+        client.search("  ")
+    client.close()
+
+
+def test_stats(requests_mock):
+    """
+    Test that stats() queries the stats endpoint next to the logs endpoint.
+    """
+    rows = [{"bucket": "2024-01-01 10:00:00", "log_level": "ERROR", "count": 3}]
+    requests_mock.get(TEST_API_ENDPOINT + "/stats", json=rows)
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+
+    assert client.stats(bucket="hour", group_by=["host", "log_level"], host="web-1") == rows
+    query = parse_qs(urlparse(requests_mock.last_request.url).query)
+    assert query == {"bucket": ["hour"], "group_by": ["host,log_level"], "host": ["web-1"]}
+    client.close()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import csv
+import gzip
+import io
+
+import pytest
+
+from log_aggregator_handler import LogAggregatorClient
+from log_aggregator_handler import export
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+
+
+def _entries(first, count):
+    return [{"id": i, "host": f"web-{i % 2}", "host_process": None if i % 3 == 0 else "api",
+             "log_level": "ERROR" if i % 5 == 0 else "INFO", "log_message": f"Message, \"{i}\"",
+             "timestamp": f"2024-01-01 00:00:{i:02d}", "created_at": None}
+            for i in range(first, first + count)]
+
+
+def _mock_pages(requests_mock, pages):
+    responses = []
+    for index, page in enumerate(pages):
+        headers = {"X-Next-Cursor": f"c{index + 1}"} if index + 1 < len(pages) else {}
+        responses.append({"json": page, "headers": headers})
+    requests_mock.get(TEST_API_ENDPOINT, responses)
+
+
+def test_export_csv_gzip(requests_mock, tmp_path):
+    """
+    Test that a .csv.gz export walks every page and round-trips through the csv module.
+    """
+    _mock_pages(requests_mock, [_entries(0, 3), _entries(3, 2)])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    path = tmp_path / "logs.csv.gz"
+
+    assert client.export(path, chunk_size=2, log_level="INFO") == 5
+
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["id"] for row in rows] == ["0", "1", "2", "3", "4"]
+    assert rows[1]["log_message"] == 'Message, "1"'
+    assert rows[0]["host_process"] == ""
+    assert requests_mock.request_history[0].qs["log_level"] == ["info"]  # requests_mock lowercases values
+    client.close()
+
+
+def test_export_csv_to_file_object_leaves_it_open(requests_mock):
+    """
+    Test that exporting to a caller's file object writes to it without closing it.
+    """
+    _mock_pages(requests_mock, [_entries(0, 2)])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    buffer = io.BytesIO()
+
+    assert client.export(buffer, format="csv") == 2
+
+    assert not buffer.closed
+    assert buffer.getvalue().decode("utf-8").splitlines()[0] == ",".join(export.EXPORT_COLUMNS)
+    client.close()
+
+
+def test_resolve_format():
+    """
+    Test the format chosen from the extension, and the errors for unknown formats.
+    """
+    assert export.resolve_format("logs.CSV") == "csv"
+    assert export.resolve_format("logs.csv.gz") == "csv"
+    with pytest.raises(ValueError):
+        export.resolve_format("logs.csv", format="xlsx")
+
+
+def test_export_parquet_dictionary_encodes(requests_mock, tmp_path):
+    """
+    Test that a Parquet export has typed columns, with host, host_process and log_level as dictionaries.
+    """
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet
+
+    _mock_pages(requests_mock, [_entries(0, 3), _entries(3, 3)])
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    path = tmp_path / "logs.parquet"
+
+    assert client.export(path, chunk_size=4) == 6
+
+    table = pyarrow.parquet.read_table(path)
+    assert table.column("id").to_pylist() == list(range(6))
+    assert table.schema.field("id").type == pyarrow.int64()
+    for name in export.DICTIONARY_COLUMNS:
+        assert pyarrow.types.is_dictionary(table.schema.field(name).type)
+    assert table.column("host_process").to_pylist() == [entry["host_process"] for entry in _entries(0, 6)]
+    assert pyarrow.parquet.ParquetFile(path).num_row_groups == 2
+    client.close()
+
+
+def test_export_arrow_search_with_growing_dictionaries(requests_mock, tmp_path):
+    """
+    Test an Arrow IPC export of search results whose later chunks add dictionary values.
+    """
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    pages = [[dict(entry, score=1.0 / (entry["id"] + 1)) for entry in _entries(first, 2)] for first in (0, 2, 4)]
+    pages[2][1]["host"] = "web-new"
+    _mock_pages(requests_mock, pages)
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    path = tmp_path / "logs.arrow"
+
+    assert client.export(path, q="Message", chunk_size=2) == 6
+
+    with pyarrow.ipc.open_file(path) as reader:
+        assert reader.num_record_batches == 3
+        table = reader.read_all()
+    assert table.column("host").to_pylist() == ["web-0", "web-1", "web-0", "web-1", "web-0", "web-new"]
+    assert table.column("score").to_pylist()[0] == 1.0
+    assert requests_mock.request_history[0].qs["q"] == ["message"]
+    client.close()
+
+
+def test_export_without_pyarrow(monkeypatch, tmp_path):
+    """
+    Test that without pyarrow the default format is CSV and Parquet is refused.
+    """
+    monkeypatch.setattr(export, "_import_pyarrow", lambda: None)
+
+    assert export.resolve_format(tmp_path / "logs") == "csv"
+    with pytest.raises(ImportError):
+        export.resolve_format(tmp_path / "logs.parquet")
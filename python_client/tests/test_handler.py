@@ -2,12 +2,18 @@
 import logging
 import pytest
 import requests_mock
+import gzip
 import json
 import socket
 import os
+import signal
+import sys
+import threading
+import time
 from datetime import datetime, timezone
 
 from log_aggregator_handler import LogAggregatorHandler
+from .helpers import make_record
 
 # Define a dummy API endpoint for testing
 TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
@@ -206,6 +212,594 @@ def test_emit_api_endpoint_from_argument(requests_mock):
     # Clean up handler session
     handler.close()
 
+
+def test_emit_background_mode(requests_mock):
+    """
+    Test that background mode queues records and flush() waits until they are sent.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, background=True)
+
+    for i in range(5):
+        handler.emit(make_record(args=(i,)))
+
+    handler.flush()
+
+    assert requests_mock.call_count == 5
+    messages = [json.loads(h.text)["message"] for h in requests_mock.request_history]
+    assert messages == [f"Message {i}" for i in range(5)]
+
+    handler.close()
+
+
+def test_background_mode_invalid_overflow_policy():
+    """
+    Test that an unknown overflow policy is rejected.
+    """
+    with pytest.raises(ValueError, match="overflow_policy"):
+        LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, background=True, overflow_policy="spill")
+
+
+def test_emit_parallel_workers(requests_mock):
+    """
+    Test that several workers send every record, each logger's records in order.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, workers=3)
+    assert handler.session.get_adapter(TEST_API_ENDPOINT)._pool_maxsize >= 3
+    for i in range(10):
+        for name in ("app.a", "app.b", "app.c"):
+            handler.emit(make_record(args=(i,), name=name))
+    handler.flush()
+
+    entries = [json.loads(h.text) for h in requests_mock.request_history]
+    assert len(entries) == 30
+    for name in ("app.a", "app.b", "app.c"):
+        assert [e["message"] for e in entries if e["logger_name"] == name] == [f"Message {i}" for i in range(10)]
+    assert handler.stats()["queue"]["capacity"] == 1000
+
+    handler.close()
+
+
+def test_workers_with_spool_rejected(tmp_path):
+    """
+    Test that several workers cannot send from a disk spool.
+    """
+    with pytest.raises(ValueError, match="workers"):
+        LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, workers=2, spool_dir=str(tmp_path))
+
+
+TEST_BATCH_ENDPOINT = TEST_API_ENDPOINT + "/batch"
+
+
+def test_emit_parallel_workers_zstd(requests_mock):
+    """
+    Test that parallel workers compressing with zstd at the same time send batches that
+    all decompress to the records they hold.
+    """
+    zstandard = pytest.importorskip("zstandard")
+    requests_mock.post(TEST_BATCH_ENDPOINT, text='{"inserted": 5, "failed": 0}', status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, workers=4,
+                                   batch_size=5, compression="zstd")
+    for i in range(400):
+        handler.emit(make_record(msg="Message %d " + "x" * 200, args=(i,), name=f"app.{i % 8}"))
+    handler.flush()
+
+    decompressor = zstandard.ZstdDecompressor()
+    messages = []
+    for request in requests_mock.request_history:
+        assert request.headers["Content-Encoding"] == "zstd"
+        lines = decompressor.decompress(request.body).decode("utf-8").splitlines()
+        messages.extend(json.loads(line)["message"] for line in lines)
+    assert sorted(messages) == sorted(f"Message {i} " + "x" * 200 for i in range(400))
+    handler.close()
+
+
+def test_emit_batched(requests_mock):
+    """
+    Test that batching sends records as JSON arrays to the batch endpoint.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, json={"inserted": 3, "failed": 0, "results": []}, status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   batch_size=3, batch_linger=5.0)
+    for i in range(7):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    history = requests_mock.request_history
+    assert all(h.url == TEST_BATCH_ENDPOINT for h in history)
+    batches = [json.loads(h.text) for h in history]
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [entry["message"] for batch in batches for entry in batch] == [f"Message {i}" for i in range(7)]
+
+    handler.close()
+
+
+def test_emit_batched_max_bytes(requests_mock):
+    """
+    Test that a batch is cut when the byte limit would be exceeded.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, json={"inserted": 1, "failed": 0, "results": []}, status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   batch_size=100, batch_max_bytes=1, batch_linger=5.0)
+    for i in range(3):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    assert [len(json.loads(h.text)) for h in requests_mock.request_history] == [1, 1, 1]
+
+    handler.close()
+
+
+def test_emit_batched_fallback_to_single(requests_mock):
+    """
+    Test that the handler falls back to single posts if the server has no batch endpoint.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, text='Not Found', status_code=404)
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   batch_size=10, batch_linger=0.01)
+    for i in range(2):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+    handler.emit(make_record(args=(2,)))
+    handler.flush()
+
+    urls = [h.url for h in requests_mock.request_history]
+    assert urls.count(TEST_BATCH_ENDPOINT) == 1
+    assert urls.count(TEST_API_ENDPOINT) == 3
+    singles = [json.loads(h.text) for h in requests_mock.request_history if h.url == TEST_API_ENDPOINT]
+    assert [entry["message"] for entry in singles] == ["Message 0", "Message 1", "Message 2"]
+
+    handler.close()
+
+
+def test_emit_batched_gzip_ndjson(requests_mock):
+    """
+    Test that compressed batches are sent as gzip-encoded NDJSON.
+    """
+    requests_mock.post(TEST_BATCH_ENDPOINT, json={"inserted": 3, "failed": 0, "results": []}, status_code=200)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   batch_size=3, batch_linger=5.0, compression="gzip")
+    for i in range(3):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    request = requests_mock.request_history[0]
+    assert request.headers["Content-Encoding"] == "gzip"
+    assert request.headers["Content-Type"] == "application/x-ndjson"
+    lines = gzip.decompress(request.body).decode("utf-8").splitlines()
+    assert [json.loads(line)["message"] for line in lines] == ["Message 0", "Message 1", "Message 2"]
+
+    handler.close()
+
+
+def test_compression_unsupported_by_server(requests_mock):
+    """
+    Test that the handler resends uncompressed if the server answers 415.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, [
+        {"text": "Unsupported Content-Encoding", "status_code": 415},
+        {"text": "OK", "status_code": 201},
+        {"text": "OK", "status_code": 201},
+    ])
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, compression="gzip")
+    handler.emit(make_record(args=(0,)))
+    handler.emit(make_record(args=(1,)))
+
+    history = requests_mock.request_history
+    assert len(history) == 3
+    assert history[0].headers["Content-Encoding"] == "gzip"
+    assert "Content-Encoding" not in history[1].headers
+    assert json.loads(history[1].text)["message"] == "Message 0"
+    assert "Content-Encoding" not in history[2].headers
+
+    handler.close()
+
+
+def test_spool_replays_after_outage(requests_mock, tmp_path):
+    """
+    Test that records spooled while the API is down are sent by the next handler.
+    """
+    spool_dir = str(tmp_path / "spool")
+    requests_mock.post(TEST_API_ENDPOINT, text='Service Unavailable', status_code=503)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, spool_dir=spool_dir)
+    for i in range(3):
+        handler.emit(make_record(args=(i,)))
+    handler.close()
+    assert requests_mock.call_count >= 1
+
+    requests_mock.reset_mock()
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, spool_dir=spool_dir)
+    handler.flush()
+
+    messages = [json.loads(h.text)["message"] for h in requests_mock.request_history]
+    assert messages == ["Message 0", "Message 1", "Message 2"]
+
+    handler.close()
+
+def test_circuit_open_sends_to_file_fallback(requests_mock, tmp_path):
+    """
+    Test that once the circuit opens, records go to the fallback file without requests.
+    """
+    fallback_path = str(tmp_path / "fallback.ndjson")
+    requests_mock.post(TEST_API_ENDPOINT, text='Service Unavailable', status_code=503)
+    requests_mock.get("http://test-log-api.com/api/health", status_code=503)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   retry_delay=5.0, circuit_failure_threshold=2,
+                                   fallback="file", fallback_path=fallback_path)
+    for i in range(5):
+        handler.emit(make_record(args=(i,)))
+    handler.close()
+
+    assert handler.circuit.state == "open"
+    assert requests_mock.call_count == 2
+    with open(fallback_path, "rb") as f:
+        messages = [json.loads(line)["message"] for line in f]
+    assert messages == [f"Message {i}" for i in range(5)]
+
+
+def test_buffer_fallback_replayed_after_recovery(requests_mock):
+    """
+    Test that buffered records are sent once the health probe closes the circuit.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='Service Unavailable', status_code=503)
+    health = requests_mock.get("http://test-log-api.com/api/health", status_code=503)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   retry_delay=0.1, circuit_failure_threshold=1,
+                                   fallback="buffer")
+    for i in range(3):
+        handler.emit(make_record(args=(i,)))
+    assert len(handler.fallback) == 3
+
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+    requests_mock.get("http://test-log-api.com/api/health", text='OK', status_code=200)
+    time.sleep(0.15)  # Longer than the first open period
+    handler.emit(make_record(args=(3,)))
+
+    assert handler.circuit.state == "closed"
+    assert len(handler.fallback) == 0
+    posts = [h for h in requests_mock.request_history if h.method == 'POST' and h.text]
+    messages = [json.loads(h.text)["message"] for h in posts[1:]]
+    assert messages == ["Message 3", "Message 0", "Message 1", "Message 2"]
+    handler.close()
+
+
+def test_collapse_repeats_before_send(requests_mock):
+    """
+    Test that repeated records are collapsed into one request with a repeat_count.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, collapse_window=60)
+    for i in range(100):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    assert requests_mock.call_count == 2
+    first, summary = [json.loads(h.text) for h in requests_mock.request_history]
+    assert first["message"] == "Message 0"
+    assert summary["message"] == "Message 99"
+    assert summary["extra"]["repeat_count"] == 99
+    assert summary["extra"]["first_timestamp"] <= summary["extra"]["last_timestamp"] == summary["timestamp"]
+    assert handler.suppressor.counters()["collapsed"] == 99
+    handler.close()
+
+
+def _deferred_records():
+    """
+    Records covering what formatting depends on.
+    """
+    def fail():
+        try:
+            {}["missing"]
+        except KeyError as e:
+            raise RuntimeError("lookup failed") from e
+
+    try:
+        fail()
+    except RuntimeError:
+        exc_info = sys.exc_info()
+    records = [
+        logging.LogRecord("app", logging.INFO, "/p.py", 1, "plain %s %d %.1f", ("a", 1, 2.5), None),
+        logging.LogRecord("app", logging.INFO, "/p.py", 2, "list %s", ([1, 2],), None),
+        logging.LogRecord("app", logging.INFO, "/p.py", 3, "map %(user)s", ({"user": "bob"},), None),
+        logging.LogRecord("app", logging.INFO, "/p.py", 4, {"not": "a string"}, None, None),
+        logging.LogRecord("app", logging.ERROR, "/p.py", 5, "failed", None, exc_info),
+        logging.LogRecord("app", logging.WARNING, "/p.py", 6, "stack", None, None, sinfo="Stack (most recent call last):"),
+    ]
+    records[0].request_id = 7
+    return records
+
+
+@pytest.mark.parametrize("formatter", [
+    None,
+    logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"),
+    type("OwnTraceback", (logging.Formatter,), {"formatException": lambda self, ei: "custom traceback"})(),
+])
+def test_defer_format_matches_format_record(formatter):
+    """
+    Test that formatting a captured record on the sender gives what format_record() gives on the caller.
+    """
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, host="h", defer_format=True)
+    handler.setFormatter(formatter)
+    try:
+        records = _deferred_records()
+        copies = [logging.makeLogRecord(dict(record.__dict__)) for record in records]
+        captured = [handler.capture_record(record) for record in records]
+        expected = [handler.format_record(record) for record in copies]
+        assert [handler.format_captured(item) for item in captured] == expected
+        assert "RuntimeError: lookup failed" in expected[4]["exception"]
+    finally:
+        handler.close()
+
+
+def test_defer_format_snapshot():
+    """
+    Test that mutable arguments are rendered at capture and the traceback keeps no frames alive.
+    """
+    import gc
+    import weakref
+
+    class Payload:
+        pass
+
+    def fail():
+        payload = Payload()
+        ref = weakref.ref(payload)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            return ref, sys.exc_info()
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, host="h", defer_format=True)
+    try:
+        items = [1]
+        record = logging.LogRecord("app", logging.INFO, "/p.py", 1, "items %s", (items,), None)
+        captured = handler.capture_record(record)
+        items.append(2)
+        assert handler.format_captured(captured)["message"] == "items [1]"
+
+        ref, exc_info = fail()
+        record = logging.LogRecord("app", logging.ERROR, "/p.py", 1, "failed", None, exc_info)
+        captured = handler.capture_record(record)
+        del record, exc_info
+        gc.collect()
+        assert ref() is None
+        assert "ValueError: boom" in handler.format_captured(captured)["exception"]
+    finally:
+        handler.close()
+
+
+def test_emit_defer_format(requests_mock):
+    """
+    Test that deferred formatting implies background mode and sends the formatted record.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, defer_format=True)
+    assert handler._sender is not None
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = logging.LogRecord("app", logging.ERROR, "/p.py", 1, "failed %s", ("x",), sys.exc_info())
+    handler.emit(record)
+    handler.flush()
+
+    sent = json.loads(requests_mock.last_request.text)
+    assert sent["message"].startswith("failed x\nTraceback (most recent call last):")
+    assert sent["exception"].endswith("ValueError: boom\n")
+    handler.close()
+
+def test_emit_batched_msgpack(requests_mock):
+    """
+    Test that MessagePack batches are sent, and JSON once the server answers 415.
+    """
+    msgpack = pytest.importorskip("msgpack")
+    requests_mock.post(TEST_BATCH_ENDPOINT, [
+        {"json": {"inserted": 2, "failed": 0, "results": []}, "status_code": 200},
+        {"json": {"error": "Unsupported Content-Type"}, "status_code": 415},
+        {"json": {"inserted": 2, "failed": 0, "results": []}, "status_code": 200},
+    ])
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0,
+                                   batch_size=2, batch_linger=5.0, wire_format="msgpack")
+    handler.handleError = lambda record, message=None: None
+    for i in range(4):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    first, rejected, resent = requests_mock.request_history
+    assert first.headers["Content-Type"] == "application/x-msgpack"
+    batch = msgpack.unpackb(first.body)
+    assert [record[3] for record in batch["records"]] == ["Message 0", "Message 1"]
+    assert len(batch["contexts"]) == 1
+    assert rejected.headers["Content-Type"] == "application/x-msgpack"
+    assert resent.headers["Content-Type"] == "application/json"
+    assert [entry["message"] for entry in json.loads(resent.text)] == ["Message 2", "Message 3"]
+    handler.close()
+
+
+def test_msgpack_kept_when_compression_rejected(requests_mock):
+    """
+    Test that a 415 for the Content-Encoding of a MessagePack batch turns off compression, not MessagePack.
+    """
+    msgpack = pytest.importorskip("msgpack")
+    requests_mock.post(TEST_BATCH_ENDPOINT, [
+        {"json": {"error": "Unsupported Content-Encoding: zstd"}, "status_code": 415},
+        {"json": {"inserted": 2, "failed": 0, "results": []}, "status_code": 200},
+        {"json": {"inserted": 2, "failed": 0, "results": []}, "status_code": 200},
+    ])
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, compression="gzip",
+                                   batch_size=2, batch_linger=5.0, wire_format="msgpack")
+    handler.handleError = lambda record, message=None: None
+    for i in range(4):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    rejected, resent, after = requests_mock.request_history
+    assert rejected.headers["Content-Encoding"] == "gzip"
+    for request in (resent, after):
+        assert request.headers["Content-Type"] == "application/x-msgpack"
+        assert "Content-Encoding" not in request.headers
+    assert [record[3] for record in msgpack.unpackb(after.body)["records"]] == ["Message 2", "Message 3"]
+    handler.close()
+
+
+def test_compression_kept_when_msgpack_rejected(requests_mock):
+    """
+    Test that a 415 for the Content-Type of a compressed MessagePack batch turns off MessagePack, not compression.
+    """
+    pytest.importorskip("msgpack")
+    requests_mock.post(TEST_BATCH_ENDPOINT, [
+        {"json": {"error": "Unsupported Content-Type"}, "status_code": 415},
+        {"json": {"error": "Unsupported Content-Type"}, "status_code": 415},
+        {"json": {"inserted": 2, "failed": 0, "results": []}, "status_code": 200},
+    ])
+
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, compression="gzip",
+                                   batch_size=2, batch_linger=5.0, wire_format="msgpack")
+    handler.handleError = lambda record, message=None: None
+    for i in range(2):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    rejected, retried, resent = requests_mock.request_history
+    assert retried.headers["Content-Type"] == "application/x-msgpack"
+    assert "Content-Encoding" not in retried.headers
+    assert resent.headers["Content-Type"] == "application/x-ndjson"
+    assert resent.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(resent.body).splitlines()
+    assert [json.loads(line)["message"] for line in lines] == ["Message 0", "Message 1"]
+    handler.close()
+
+
+def test_invalid_wire_format():
+    """
+    Test that an unknown wire format is rejected.
+    """
+    with pytest.raises(ValueError, match="wire_format"):
+        LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, batch_size=10, wire_format="xml")
+
+
+def test_priority_lane_not_stuck_behind_bulk(requests_mock):
+    """
+    Test that an ERROR record is sent right away while INFO records wait for their
+    batch to fill up, and that flush() sends both lanes.
+    """
+    error_sent = threading.Event()
+
+    def respond(request, context):
+        if any(entry["level"] == "ERROR" for entry in json.loads(request.text)):
+            error_sent.set()
+        return {"inserted": 1, "failed": 0, "results": [{"id": 1}]}
+
+    requests_mock.post(TEST_BATCH_ENDPOINT, json=respond)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, batch_size=100,
+                                   batch_linger=60, priority_level=logging.ERROR)
+    for i in range(5):
+        handler.emit(make_record(args=(i,)))
+    handler.emit(make_record(args=(5,), level=logging.ERROR))
+    assert error_sent.wait(5)
+    queue = handler.stats()["queue"]
+    assert (queue["priority_depth"], queue["capacity"]) == (0, 2000)
+    assert requests_mock.call_count == 1
+
+    handler.flush()
+    batches = [[entry["message"] for entry in json.loads(h.text)] for h in requests_mock.request_history]
+    assert batches == [["Message 5"], [f"Message {i}" for i in range(5)]]
+    handler.close()
+
+
+def test_priority_retry_attempts(requests_mock):
+    """
+    Test that priority records have their own retry budget.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='Service Unavailable', status_code=503)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, retry_delay=0.1,
+                                   circuit_failure_threshold=0, priority_level=logging.ERROR,
+                                   priority_retry_attempts=2)
+    handler.emit(make_record(args=(0,), level=logging.ERROR))
+    handler.flush()
+    assert requests_mock.call_count == 3
+    handler.emit(make_record(args=(1,)))
+    handler.flush()
+    assert requests_mock.call_count == 4
+    handler.close()
+
+
+def test_priority_level_with_spool_rejected(tmp_path):
+    with pytest.raises(ValueError, match="priority_level"):
+        LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, priority_level=logging.ERROR, spool_dir=str(tmp_path))
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="needs SIGUSR1")
+def test_exit_signal_flushes_before_previous_handler(requests_mock):
+    """
+    Test that an exit signal sends queued records before its previous handler runs,
+    and that close() puts the previous handler back.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+    calls = []
+    previous = signal.signal(signal.SIGUSR1, lambda signum, frame: calls.append(requests_mock.call_count))
+    try:
+        handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, batch_size=10,
+                                       batch_linger=60, priority_level=logging.ERROR,
+                                       exit_signals=(signal.SIGUSR1,))
+        for i in range(3):
+            handler.emit(make_record(args=(i,)))
+        handler.emit(make_record(args=(3,), level=logging.ERROR))
+        os.kill(os.getpid(), signal.SIGUSR1)
+        time.sleep(0.01)  # The signal handler runs between bytecodes of the main thread
+        assert calls == [2]  # The priority batch, then the lingering one
+        handler.close()
+        assert signal.getsignal(signal.SIGUSR1) is not handler._on_exit_signal
+        os.kill(os.getpid(), signal.SIGUSR1)
+        time.sleep(0.01)
+        assert calls == [2, 2]
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="needs SIGUSR1")
+def test_exit_signal_while_suppressor_lock_held(requests_mock):
+    """
+    Test that an exit signal arriving while the main thread holds the suppressor's lock
+    hands the signal on after flush_timeout instead of deadlocking, and that the
+    records are sent once the lock is released.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+    calls = []
+    previous = signal.signal(signal.SIGUSR1, lambda signum, frame: calls.append(requests_mock.call_count))
+    try:
+        handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, collapse_window=60,
+                                       background=True, flush_timeout=0.2, exit_signals=(signal.SIGUSR1,))
+        handler.emit(make_record(args=(0,)))
+        handler.emit(make_record(args=(1,)))  # Held back by collapsing until released
+        with handler.suppressor._lock:
+            os.kill(os.getpid(), signal.SIGUSR1)
+            time.sleep(0.01)
+            assert len(calls) == 1
+        handler.flush()
+        assert requests_mock.call_count == 2
+        handler.close()
+    finally:
+        signal.signal(signal.SIGUSR1, previous)
+
 # Add more tests here for:
 # - Different log levels
 # - Exception formatting
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+import urllib.request
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler.metrics import Histogram, render_prometheus, start_prometheus_server
+from .helpers import make_record
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+
+
+def test_histogram_buckets_are_cumulative():
+    """
+    Test that buckets count values up to and including their bound.
+    """
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {0.1: 2, 1.0: 3, float("inf"): 4}
+    assert snapshot["count"] == 4
+    assert snapshot["sum"] == 2.65
+
+
+def test_handler_stats(requests_mock):
+    """
+    Test the record and request counters for sent, rejected and failed records.
+    """
+    def respond(request, context):
+        message = request.json()["message"]
+        context.status_code = {"bad": 400, "down": 503}.get(message, 201)
+        return "{}"
+
+    requests_mock.post(TEST_API_ENDPOINT, text=respond)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=1, retry_delay=0.1)
+    for msg in ("ok", "ok", "bad", "down"):
+        handler.emit(make_record(msg, args=()))
+
+    stats = handler.stats()
+    assert stats["records"] == {"emitted": 4, "sent": 2, "rejected": 1, "failed": 1}
+    assert stats["requests"]["sent"] == 3
+    assert stats["requests"]["failed"] == 2
+    assert stats["requests"]["retried"] == 1
+    assert stats["requests"]["bytes_sent"] > 0
+    assert stats["requests"]["last_success"] <= stats["requests"]["last_failure"]
+    assert stats["request_seconds"]["count"] == 5
+    assert stats["format_seconds"]["count"] == 4
+    assert stats["encode_seconds"]["count"] == 4
+    assert stats["dropped"]["fallback"] == 1
+    assert stats["queue"]["depth"] == 0
+    assert stats["circuit"] == {"state": "closed", "trips": 0}
+    handler.close()
+
+
+def test_spool_drops_counted_once(requests_mock, tmp_path):
+    """
+    Test that records a full drop_newest spool discards count as evicted only, not also as queue_full.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text="Service Unavailable", status_code=503)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, spool_dir=str(tmp_path),
+                                   spool_segment_bytes=256, spool_max_bytes=512, spool_eviction="drop_newest")
+    for i in range(20):
+        handler.emit(make_record(args=(i,)))
+    handler.flush()
+
+    stats = handler.stats()
+    assert stats["dropped"]["queue_full"] == 0
+    assert 0 < stats["dropped"]["spool_evicted"] < 20
+    assert 'log_aggregator_records_dropped_total{reason="queue_full"} 0' in handler.prometheus_text().splitlines()
+    handler.close()
+
+
+def test_prometheus_text(requests_mock):
+    """
+    Test the Prometheus export of one handler and of several handlers at once.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text="{}", status_code=201)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, background=True)
+    handler.emit(make_record("ok", args=()))
+    handler.flush()
+
+    text = handler.prometheus_text(labels={"app": "web"})
+    lines = text.splitlines()
+    assert "# TYPE log_aggregator_records_total counter" in lines
+    assert 'log_aggregator_records_total{app="web",outcome="sent"} 1' in lines
+    assert 'log_aggregator_request_seconds_bucket{app="web",le="+Inf"} 1' in lines
+    assert 'log_aggregator_queue_capacity{app="web"} 1000' in lines
+    assert not any(line.startswith("log_aggregator_spool_pending_bytes") for line in lines)
+
+    combined = render_prometheus([({"handler": "a"}, handler.stats()), ({"handler": "b"}, handler.stats())])
+    assert combined.count("# TYPE log_aggregator_records_total counter") == 1
+    assert 'log_aggregator_records_total{handler="b",outcome="sent"} 1' in combined
+    handler.close()
+
+
+def test_prometheus_server():
+    """
+    Test that the exporter serves /metrics with a handler label.
+    """
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT)
+    handler.set_name("app")
+    server = start_prometheus_server([handler], port=0)
+    try:
+        url = "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode("utf-8")
+        assert 'log_aggregator_records_total{handler="app",outcome="emitted"} 0' in body
+    finally:
+        server.shutdown()
+        server.server_close()
+        handler.close()
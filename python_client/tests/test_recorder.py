@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import functools
+import json
+import logging
+import sys
+
+import pytest
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler.recorder import FlightRecorder, CORRELATION_FIELD
+from .helpers import make_record
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+
+_step_record = functools.partial(make_record, msg="Step %d", args=(1,), level=logging.DEBUG, name="app",
+                                thread=1, threadName="Thread-1")
+
+
+def test_keeps_last_records_per_thread():
+    """
+    Test that a buffer keeps its newest records, and take() empties it and links them by one id.
+    """
+    recorder = FlightRecorder(3)
+    for i in range(5):
+        recorder.record(_step_record(args=(i,)))
+    recorder.record(_step_record(args=(99,), thread=2, threadName="Thread-2"))
+
+    records, correlation_id = recorder.take(_step_record(level=logging.ERROR))
+    assert [captured.record.getMessage() for captured in records] == ["Step 2", "Step 3", "Step 4"]
+    assert {getattr(captured.record, CORRELATION_FIELD) for captured in records} == {correlation_id}
+    assert recorder.take(_step_record(level=logging.ERROR)) == ([], None)
+    assert recorder.counters() == {"buffered": 6, "overwritten": 2, "evicted": 0, "shipped": 3, "triggers": 1,
+                                   "held": 1, "buffers": 1}
+
+
+def test_logger_scope_and_max_buffers():
+    recorder = FlightRecorder(10, scope="logger", max_buffers=2)
+    for name in ("a", "b", "a", "c"):
+        recorder.record(_step_record(name=name, thread=len(name), threadName=f"Thread-{len(name)}"))
+    # "a" was used after "b", so "b" was the least recently used buffer when "c" needed one
+    assert recorder.take(_step_record(name="b")) == ([], None)
+    records, _ = recorder.take(_step_record(name="a", thread=5, threadName="Thread-5"))
+    assert len(records) == 2
+    assert recorder.counters()["evicted"] == 1
+
+    with pytest.raises(ValueError, match="flight_recorder_scope"):
+        FlightRecorder(10, scope="process")
+
+
+def test_snapshots_mutable_args_and_exceptions():
+    """
+    Test that records are shipped as they were logged, without holding frames,
+    and that the records passed in are left as they were.
+    """
+    recorder = FlightRecorder(10)
+    items = ["a"]
+    mutable = _step_record(msg="Items %s", args=(items,))
+    recorder.record(mutable)
+    items.append("b")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        failed = _step_record(msg="Lookup failed", args=(), exc_info=sys.exc_info())
+    recorder.record(failed)
+
+    (first, second), _ = recorder.take(_step_record())
+    assert first.record.getMessage() == "Items ['a']"
+    assert second.record.exc_info is None
+    assert "ValueError: boom" in second.render_traceback()
+    assert not hasattr(mutable, CORRELATION_FIELD) and failed.exc_info is not None
+
+
+def test_handler_ships_recorded_records_with_error(requests_mock):
+    """
+    Test that DEBUG records are only sent with a later ERROR of their thread,
+    formatted as they would have been, and linked to it by the correlation id.
+    """
+    requests_mock.post(TEST_API_ENDPOINT, text='OK', status_code=201)
+    handler = LogAggregatorHandler(api_endpoint=TEST_API_ENDPOINT, retry_attempts=0, flight_recorder_size=100)
+    debug = [_step_record(args=(i,)) for i in range(3)]
+    for record in debug:
+        handler.emit(record)
+    handler.emit(_step_record(msg="Started", args=(), level=logging.INFO))
+    handler.emit(_step_record(msg="Step %d", args=(9,), thread=2, threadName="Thread-2"))
+    assert [json.loads(h.text)["message"] for h in requests_mock.request_history] == ["Started"]
+
+    handler.emit(_step_record(msg="Failed", args=(), level=logging.ERROR))
+    entries = [json.loads(h.text) for h in requests_mock.request_history[1:]]
+    assert [entry["message"] for entry in entries] == ["Step 0", "Step 1", "Step 2", "Failed"]
+    correlation_id = entries[-1]["extra"][CORRELATION_FIELD]
+    assert all(entry["extra"] == {CORRELATION_FIELD: correlation_id} for entry in entries)
+    expected = handler.format_record(debug[0])
+    expected["extra"] = {CORRELATION_FIELD: correlation_id}
+    assert entries[0] == expected
+
+    stats = handler.stats()["flight_recorder"]
+    assert (stats["buffered"], stats["shipped"], stats["held"]) == (4, 3, 1)
+    handler.close()
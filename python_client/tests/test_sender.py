@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from log_aggregator_handler.sender import BackgroundSender, ParallelSender
+
+
+def _blocked_sender(**kwargs):
+    """
+    Create a sender whose thread is stuck on the first item until released.
+    """
+    release = threading.Event()
+    started = threading.Event()
+    sent = []
+
+    def send(item):
+        started.set()
+        release.wait()
+        sent.append(item)
+
+    sender = BackgroundSender(send, **kwargs)
+    sender.put("first")
+    assert started.wait(1.0)
+    return sender, release, sent
+
+
+def test_drop_newest_policy():
+    """
+    Test that a full queue discards the items being added.
+    """
+    sender, release, sent = _blocked_sender(queue_size=2, overflow_policy="drop_newest")
+
+    assert sender.put(1) is True
+    assert sender.put(2) is True
+    assert sender.put(3) is False
+
+    release.set()
+    assert sender.close(timeout=1.0)
+    assert sent == ["first", 1, 2]
+    assert sender.dropped == 1
+
+
+def test_drop_oldest_policy():
+    """
+    Test that a full queue evicts the oldest queued items.
+    """
+    sender, release, sent = _blocked_sender(queue_size=2, overflow_policy="drop_oldest")
+
+    for i in range(1, 5):
+        assert sender.put(i) is True
+
+    release.set()
+    assert sender.close(timeout=1.0)
+    assert sent == ["first", 3, 4]
+    assert sender.dropped == 2
+
+
+def test_block_policy_times_out():
+    """
+    Test that the block policy gives up after block_timeout.
+    """
+    sender, release, sent = _blocked_sender(queue_size=1, overflow_policy="block", block_timeout=0.05)
+
+    assert sender.put(1) is True
+    assert sender.put(2) is False
+    assert sender.dropped == 1
+
+    release.set()
+    assert sender.close(timeout=1.0)
+
+
+def test_flush_deadline():
+    """
+    Test that flush() returns False when the queue does not drain in time.
+    """
+    sender, release, sent = _blocked_sender(queue_size=10)
+
+    assert sender.flush(timeout=0.05) is False
+
+    release.set()
+    assert sender.flush(timeout=1.0) is True
+    sender.close()
+
+
+def test_flush_after_close_returns_immediately():
+    """
+    Test that flushing a closed sender (as logging.shutdown() does) does not wait.
+    """
+    sent = []
+    sender = BackgroundSender(sent.append, batch_size=10, batch_linger=0.5)
+    sender.put("item")
+    assert sender.close(timeout=1.0) is True
+    assert sent == [["item"]]
+
+    started = time.monotonic()
+    assert sender.flush(timeout=5.0) is True
+    assert time.monotonic() - started < 1.0
+
+
+def test_parallel_sender_keeps_order_per_key():
+    """
+    Test that items of one key are sent in order by one worker while keys are spread over workers.
+    """
+    sent = []
+    threads = {}
+    lock = threading.Lock()
+
+    def send(item):
+        key, i = item
+        with lock:
+            sent.append(item)
+            threads.setdefault(key, set()).add(threading.current_thread().name)
+
+    sender = ParallelSender(send, workers=4, queue_size=1000)
+    keys = [f"logger.{n}" for n in range(16)]
+    for i in range(50):
+        for key in keys:
+            assert sender.put((key, i), key=key)
+    assert sender.close(timeout=5.0)
+
+    assert len(sent) == 50 * len(keys)
+    for key in keys:
+        assert [i for k, i in sent if k == key] == list(range(50))
+        assert len(threads[key]) == 1
+    assert len(set().union(*threads.values())) > 1
+
+
+def test_parallel_sender_sends_concurrently():
+    """
+    Test that slow sends to different keys overlap.
+    """
+    sender = ParallelSender(lambda item: time.sleep(0.1), workers=4, queue_size=100)
+    assert sender.capacity == 100
+    # Keys landing on four different workers
+    keys = {}
+    n = 0
+    while len(keys) < 4:
+        keys.setdefault(sender.workers.index(sender._worker(f"k{n}")), f"k{n}")
+        n += 1
+
+    started = time.monotonic()
+    for key in keys.values():
+        sender.put(key, key=key)
+    assert sender.flush(timeout=5.0)
+    assert time.monotonic() - started < 0.3
+    sender.close()
+
+
+def test_parallel_sender_flush_deadline():
+    """
+    Test that flush() and close() share one deadline across the workers.
+    """
+    release = threading.Event()
+    sender = ParallelSender(lambda item: release.wait(), workers=3, queue_size=30)
+    for n in range(9):
+        sender.put(n, key=str(n))
+
+    started = time.monotonic()
+    assert sender.flush(timeout=0.1) is False
+    assert time.monotonic() - started < 0.5
+    assert sender.qsize() > 0
+
+    release.set()
+    assert sender.close(timeout=1.0) is True
+    assert sender.put("late") is False
+    assert sender.dropped == 1
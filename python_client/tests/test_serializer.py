@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import logging
+import sys
+import traceback
+
+import pytest
+
+from log_aggregator_handler import serializer
+from log_aggregator_handler.handler import DEFAULT_LEVEL_MAP
+from log_aggregator_handler.serializer import RecordSerializer
+
+
+def legacy_format_record(record, host, level_map, message):
+    """
+    The format_record implementation the serializer replaced, kept as reference.
+    """
+    log_entry = {
+        "timestamp": datetime.datetime.fromtimestamp(record.created, tz=datetime.timezone.utc).isoformat(timespec='microseconds'),
+        "level": level_map.get(record.levelno, record.levelname),
+        "message": message,
+        "host": host,
+        "host_process": record.name,
+        "logger_name": record.name,
+        "module": record.module,
+        "filename": record.filename,
+        "lineno": record.lineno,
+        "funcName": record.funcName,
+        "process": record.process,
+        "thread": record.thread,
+        "threadName": record.threadName,
+    }
+    if record.exc_info:
+        log_entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+    elif record.exc_text:
+        log_entry["exception"] = record.exc_text
+    extra_attrs = {
+        key: record.__dict__[key]
+        for key in record.__dict__
+        if key not in log_entry and key not in (
+            'args', 'asctime', 'created', 'exc_info', 'exc_text', 'levelno',
+            'levelname', 'message', 'module', 'msecs', 'msg', 'name',
+            'pathname', 'process', 'processName', 'relativeCreated',
+            'stack_info', 'thread', 'threadName', 'filename', 'lineno', 'funcName'
+        )
+    }
+    if extra_attrs:
+        log_entry["extra"] = extra_attrs
+    return log_entry
+
+
+def _records():
+    plain = logging.LogRecord("app.db", logging.INFO, "/srv/app/db.py", 42, "Connected to %s", ("db1",), None, "connect")
+    extra = logging.makeLogRecord({"name": "app", "levelno": logging.WARNING, "levelname": "WARNING",
+                                   "msg": "Slow request", "user_id": 123, "path": "/café", "host": "spoofed",
+                                   "exception": "not a traceback", "ratio": 0.1})
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        exc_info = sys.exc_info()
+    failed = logging.LogRecord("app", logging.ERROR, "/srv/app/main.py", 7, "Failed", (), exc_info, "main")
+    failed.exception = "shadowed by the traceback"
+    text_only = logging.LogRecord("app", 25, "/srv/app/main.py", 8, "Custom level", (), None, "main")
+    text_only.exc_text = "Traceback (most recent call last):\n  ..."
+    return [plain, extra, failed, text_only]
+
+
+@pytest.mark.parametrize("record", _records())
+def test_same_entry_as_legacy_format_record(record):
+    """
+    Test that the serializer builds exactly the entry the old format_record built.
+    """
+    message = record.getMessage()
+    expected = legacy_format_record(record, "host-1", DEFAULT_LEVEL_MAP, message)
+    assert RecordSerializer("host-1", DEFAULT_LEVEL_MAP).to_dict(record, message) == expected
+
+
+def test_timestamp_matches_datetime():
+    """
+    Test the cached timestamp formatting against datetime, including rounding edges.
+    """
+    serializer_ = RecordSerializer("host-1", DEFAULT_LEVEL_MAP)
+    timestamps = [0.0, 1.5, 1700000000.0, 1700000000.0000005, 1700000000.9999995,
+                  1700000000.9999996, 1700000001.25, 1700000001.999999, 1711929599.5]
+    for timestamp in timestamps:
+        expected = datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).isoformat(timespec='microseconds')
+        assert serializer_.format_timestamp(timestamp) == expected
+
+
+def test_orjson_and_stdlib_produce_same_bytes(monkeypatch):
+    """
+    Test that both encoders produce identical bytes that decode to the entry.
+    """
+    pytest.importorskip("orjson")
+    serializer_ = RecordSerializer("host-1", DEFAULT_LEVEL_MAP)
+    for record in _records():
+        entry = serializer_.to_dict(record, record.getMessage())
+        with_orjson = serializer_.encode(entry)
+        monkeypatch.setattr(serializer, "orjson", None)
+        with_stdlib = serializer_.encode(entry)
+        monkeypatch.undo()
+        assert with_orjson == with_stdlib
+        assert json.loads(with_orjson) == entry
+
+
+def test_encode_unserializable_extra():
+    """
+    Test that values neither encoder can handle still raise TypeError.
+    """
+    with pytest.raises(TypeError):
+        RecordSerializer.encode({"extra": {"value": object()}})
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import logging
+import sqlite3
+
+import pytest
+import requests
+
+from log_aggregator_handler import LogAggregatorHandler
+from log_aggregator_handler.server import (
+    IngestServer, LogWriter, MAX_BATCH_SIZE, build_row, rollup_minute,
+)
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / "logs.sqlite")
+
+
+def _start(database, **options):
+    server = IngestServer(("127.0.0.1", 0), database, **options)
+    server.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/api/logs"
+
+
+def _rows(database, sql="SELECT id, host, host_process, log_level, log_message, timestamp FROM logs ORDER BY id"):
+    db = sqlite3.connect(database)
+    try:
+        return db.execute(sql).fetchall()
+    finally:
+        db.close()
+
+
+def test_build_row():
+    """
+    Test that entries are stored with the defaults of LogController::buildLog().
+    """
+    row = build_row({"host": "web-1", "log_level": "ERROR", "log_message": 42, "timestamp": "2024-01-01 10:00:00"})
+    assert row == ("web-1", None, "ERROR", "42", "2024-01-01 10:00:00")
+    host, host_process, level, message, timestamp = build_row({"host": None, "host_process": True})
+    assert (host, host_process, level, message) == ("unknown", "1", "INFO", "")
+    assert len(timestamp) == 19
+    with pytest.raises(ValueError):
+        build_row({"log_message": {"nested": True}})
+
+
+def test_rollup_minute():
+    assert rollup_minute("2024-01-01T10:15:42.123456+00:00") == "2024-01-01 10:15:00"
+    assert rollup_minute("2024-01-01 10:15:42") == "2024-01-01 10:15:00"
+    assert rollup_minute("2024-01-01") == "2024-01-01 00:00:00"
+
+
+@pytest.mark.parametrize("ack", ["commit", "buffer"])
+def test_ingest(database, ack):
+    """
+    Test single and batch posts: ids, per-item errors, rollups and the full-text index.
+    """
+    server, url = _start(database, ack=ack)
+    try:
+        assert requests.get(url.replace("/logs", "/health")).json() == {"status": "OK"}
+        response = requests.post(url, json={"host": "web-1", "log_level": "ERROR", "log_message": "Disk full",
+                                            "timestamp": "2024-01-01T10:15:42+00:00"})
+        assert response.status_code == 201
+        assert response.json() == {"id": 1}
+
+        batch = [{"host": "web-1", "log_message": "Cache miss", "timestamp": "2024-01-01T10:15:50+00:00"},
+                 "not an object",
+                 {"log_message": ["not", "a", "string"]},
+                 {"host": "web-2", "log_level": "ERROR", "log_message": "Disk full again",
+                  "timestamp": "2024-01-01T10:16:01+00:00"}]
+        response = requests.post(url + "/batch", json=batch)
+        assert response.status_code == 200
+        body = response.json()
+        assert (body["inserted"], body["failed"]) == (2, 2)
+        assert body["results"][0] == {"id": 2}
+        assert "error" in body["results"][1] and "error" in body["results"][2]
+        assert body["results"][3] == {"id": 3}
+    finally:
+        server.close()
+
+    assert _rows(database) == [
+        (1, "web-1", None, "ERROR", "Disk full", "2024-01-01T10:15:42+00:00"),
+        (2, "web-1", None, "INFO", "Cache miss", "2024-01-01T10:15:50+00:00"),
+        (3, "web-2", None, "ERROR", "Disk full again", "2024-01-01T10:16:01+00:00"),
+    ]
+    assert _rows(database, "SELECT * FROM log_rollups ORDER BY minute, host, log_level") == [
+        ("2024-01-01 10:15:00", "web-1", "", "ERROR", 1),
+        ("2024-01-01 10:15:00", "web-1", "", "INFO", 1),
+        ("2024-01-01 10:16:00", "web-2", "", "ERROR", 1),
+    ]
+    assert _rows(database, "SELECT rowid FROM logs_fts WHERE logs_fts MATCH 'disk' ORDER BY rowid") == [(1,), (3,)]
+
+
+def test_batch_formats_and_errors(database):
+    """
+    Test gzip-encoded NDJSON, and the status codes of the PHP app for bad requests.
+    """
+    server, url = _start(database)
+    try:
+        ndjson = b'{"log_message": "one"}\n\n{"log_message": "two"}\nnot json\n'
+        response = requests.post(url + "/batch", data=gzip.compress(ndjson),
+                                 headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+        assert response.json()["results"] == [{"id": 1}, {"id": 2}, {"error": "Item is not a JSON object"}]
+
+        assert requests.post(url, data=b"{", headers={"Content-Type": "application/json"}).status_code == 400
+        assert requests.post(url + "/batch", json={"log_message": "not an array"}).status_code == 400
+        assert requests.post(url + "/batch", data=b"x", headers={"Content-Encoding": "br"}).status_code == 415
+        assert requests.post(url + "/batch", data=b"x", headers={"Content-Encoding": "gzip"}).status_code == 400
+        assert requests.post(url + "/batch", json=[{}] * (MAX_BATCH_SIZE + 1)).status_code == 413
+    finally:
+        server.close()
+    assert [row[4] for row in _rows(database)] == ["one", "two"]
+
+
+def test_decompression_bombs_rejected(monkeypatch):
+    """
+    Test that gzip and zstd bodies decompressing past MAX_BODY_BYTES are refused
+    without being decompressed in full.
+    """
+    from log_aggregator_handler import server
+    monkeypatch.setattr(server, "MAX_BODY_BYTES", 1024)
+    bomb = b"\0" * (1024 * 1024)
+    assert server._decode_body(gzip.compress(b"x" * 1024), "gzip") == b"x" * 1024
+    with pytest.raises(ValueError, match="too large"):
+        server._decode_body(gzip.compress(bomb), "gzip")
+    if server.zstandard is not None:
+        compressor = server.zstandard.ZstdCompressor()
+        assert server._decode_body(compressor.compress(b"x" * 1024), "zstd") == b"x" * 1024
+        with pytest.raises(ValueError, match="too large"):
+            server._decode_body(compressor.compress(bomb), "zstd")
+        with pytest.raises(ValueError, match="Corrupt"):
+            server._decode_body(b"not zstd", "zstd")
+
+
+def test_full_buffer_answers_503(database):
+    """
+    Test that requests beyond max_buffered are refused with 503 and buffered ones are committed on close.
+    """
+    writer = LogWriter(database, commit_interval=60, commit_rows=10 ** 9, max_buffered=MAX_BATCH_SIZE)
+    server, url = _start(database, ack="buffer", writer=writer)
+    try:
+        assert requests.post(url + "/batch", json=[{}] * MAX_BATCH_SIZE).json()["inserted"] == MAX_BATCH_SIZE
+        response = requests.post(url, json={"log_message": "one too many"})
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        server.close()
+    assert _rows(database, "SELECT COUNT(*) FROM logs") == [(MAX_BATCH_SIZE,)]
+
+
+def test_slow_commit_answers_202(database):
+    """
+    Test that entries not committed within ack_timeout are answered as accepted, not as
+    a server error clients would retry, and are committed once.
+    """
+    writer = LogWriter(database, commit_interval=60, commit_rows=10 ** 9)
+    server, url = _start(database, ack_timeout=0.05, writer=writer)
+    try:
+        response = requests.post(url, json={"log_message": "slow"})
+        assert (response.status_code, response.json()) == (202, {"id": 1})
+        response = requests.post(url + "/batch", json=[{"log_message": "slower"}])
+        assert (response.status_code, response.json()["results"]) == (202, [{"id": 2}])
+    finally:
+        server.close()
+    assert [row[4] for row in _rows(database)] == ["slow", "slower"]
+
+
+def test_rows_refused_by_table_reported_failed(database):
+    """
+    Test that entries the table refuses at commit are reported as failed, not with an id.
+    """
+    writer = LogWriter(database)
+    db = sqlite3.connect(database)
+    db.execute("CREATE TRIGGER refuse BEFORE INSERT ON logs WHEN NEW.log_message = 'refused'"
+               " BEGIN SELECT RAISE(ABORT, 'refused by trigger'); END")
+    db.commit()
+    db.close()
+    server, url = _start(database, writer=writer)
+    try:
+        body = requests.post(url + "/batch", json=[{"log_message": "kept"}, {"log_message": "refused"}]).json()
+        assert (body["inserted"], body["failed"]) == (1, 1)
+        assert body["results"][0] == {"id": 1}
+        assert "refused by trigger" in body["results"][1]["error"]
+        response = requests.post(url, json={"log_message": "refused"})
+        assert response.status_code == 400 and "refused by trigger" in response.json()["error"]
+        assert writer.stats()["failed"] == 2
+    finally:
+        server.close()
+    assert [row[4] for row in _rows(database)] == ["kept"]
+
+
+def test_ids_continue_after_restart(database):
+    server, url = _start(database)
+    try:
+        assert requests.post(url, json={}).json() == {"id": 1}
+    finally:
+        server.close()
+    db = sqlite3.connect(database)
+    with db:
+        db.execute("DELETE FROM logs")
+    db.close()
+
+    server, url = _start(database)
+    try:
+        # Ids are not reused, as with AUTOINCREMENT
+        assert requests.post(url, json={}).json() == {"id": 2}
+    finally:
+        server.close()
+
+
+@pytest.mark.parametrize("wire_format", ["json", "msgpack"])
+def test_handler_round_trip(database, wire_format):
+    """
+    Test that batches of LogAggregatorHandler, JSON or MessagePack, are stored.
+    """
+    if wire_format == "msgpack":
+        pytest.importorskip("msgpack")
+    server, url = _start(database)
+    handler = LogAggregatorHandler(api_endpoint=url, host="web-1", batch_size=50, wire_format=wire_format)
+    logger = logging.getLogger(f"test_server.{wire_format}")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(120):
+            logger.warning("Message %d", i)
+        handler.flush()
+        assert handler.stats()["records"]["sent"] == 120
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+        server.close()
+    rows = _rows(database)
+    assert len(rows) == 120
+    assert {row[1:3] for row in rows} == {("web-1", f"test_server.{wire_format}")}
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import os
+
+import pytest
+
+from log_aggregator_handler.spool import DiskSpool
+
+
+def _segment_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(".seg"))
+
+
+def test_read_and_ack(tmp_path):
+    """
+    Test that records are read back in order and segments are deleted once acknowledged.
+    """
+    spool = DiskSpool(str(tmp_path), segment_bytes=64, max_bytes=1024)
+    payloads = [f"record-{i}".encode() for i in range(10)]
+    for payload in payloads:
+        assert spool.append(payload)
+    assert len(_segment_files(tmp_path)) > 1
+
+    received = []
+    while spool.has_pending():
+        records, position = spool.read(max_records=3)
+        received.extend(records)
+        spool.ack(position)
+
+    assert received == payloads
+    assert spool.pending_bytes() == 0
+    # Only the (fully acknowledged) active segment is left
+    assert len(_segment_files(tmp_path)) == 1
+    spool.close()
+
+
+def test_unacknowledged_records_are_replayed(tmp_path):
+    """
+    Test that a new spool on the same directory resumes after the last acknowledgement.
+    """
+    spool = DiskSpool(str(tmp_path), segment_bytes=64, max_bytes=1024)
+    for i in range(6):
+        spool.append(f"record-{i}".encode())
+    records, position = spool.read(max_records=2)
+    spool.ack(position)
+    records, position = spool.read(max_records=2)  # read but never acknowledged
+    spool.close()
+
+    spool = DiskSpool(str(tmp_path), segment_bytes=64, max_bytes=1024)
+    replayed = []
+    while spool.has_pending():
+        records, position = spool.read(max_records=10)
+        replayed.extend(records)
+        spool.ack(position)
+    assert replayed == [f"record-{i}".encode() for i in range(2, 6)]
+    spool.close()
+
+
+def test_eviction_drop_oldest(tmp_path):
+    """
+    Test that the oldest segments are deleted when the spool is full.
+    """
+    spool = DiskSpool(str(tmp_path), segment_bytes=64, max_bytes=128)
+    for i in range(20):
+        assert spool.append(f"record-{i:02d}".encode())
+
+    assert spool.evicted_records > 0
+    assert spool.pending_bytes() <= 128
+    records, position = spool.read(max_records=100)
+    assert records[-1] == b"record-19" or spool.has_pending()
+    assert b"record-00" not in records
+    spool.close()
+
+
+def test_eviction_drop_newest(tmp_path):
+    """
+    Test that new records are refused when the spool is full.
+    """
+    spool = DiskSpool(str(tmp_path), segment_bytes=64, max_bytes=128, eviction="drop_newest")
+    results = [spool.append(f"record-{i:02d}".encode()) for i in range(20)]
+
+    assert results[0] is True
+    assert results[-1] is False
+    assert spool.evicted_records == results.count(False)
+    records, position = spool.read(max_records=100)
+    assert records[0] == b"record-00"
+    spool.close()
+
+
+def test_invalid_configuration(tmp_path):
+    """
+    Test that bad eviction policies and sizes are rejected.
+    """
+    with pytest.raises(ValueError, match="eviction"):
+        DiskSpool(str(tmp_path), eviction="drop_random")
+    with pytest.raises(ValueError, match="max_bytes"):
+        DiskSpool(str(tmp_path), segment_bytes=100, max_bytes=150)
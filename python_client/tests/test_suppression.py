@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import functools
+import logging
+import time
+
+import pytest
+
+from log_aggregator_handler.suppression import LogSuppressor
+from .helpers import make_record
+
+_storm_record = functools.partial(make_record, msg="Dependency failed: %s", args=("timeout",),
+                                  level=logging.ERROR, name="storm", lineno=42)
+
+
+def test_rate_limit_per_logger_and_level():
+    """
+    Test that the token bucket limits each (logger, level) separately.
+    """
+    suppressor = LogSuppressor(rate_limit=1.0, rate_burst=3)
+    passed = [r for _ in range(10) for r in suppressor.filter(_storm_record())]
+    assert len(passed) == 3
+    assert suppressor.filter(_storm_record(level=logging.WARNING))
+    assert suppressor.filter(_storm_record(name="other"))
+    assert suppressor.counters() == {"sampled_out": 0, "rate_limited": 7, "collapsed": 0}
+
+
+def test_sampling():
+    """
+    Test that sampled levels keep roughly their fraction and other levels are untouched.
+    """
+    suppressor = LogSuppressor(sample_rates={logging.DEBUG: 0.0, logging.INFO: 0.5})
+    assert not any(suppressor.filter(_storm_record(level=logging.DEBUG)) for _ in range(100))
+    kept = sum(len(suppressor.filter(_storm_record(level=logging.INFO))) for _ in range(1000))
+    assert 350 < kept < 650
+    assert all(suppressor.filter(_storm_record(level=logging.ERROR)) for _ in range(100))
+    assert suppressor.sampled_out == 100 + 1000 - kept
+
+    with pytest.raises(ValueError):
+        LogSuppressor(sample_rates={logging.DEBUG: 1.5})
+
+
+def test_collapse_duplicates():
+    """
+    Test that repeats within the window become one record with repeat_count and first/last timestamps.
+    """
+    suppressor = LogSuppressor(collapse_window=0.05)
+    first = _storm_record()
+    assert suppressor.filter(first) == [first]
+    repeats = [_storm_record(args=(f"timeout {i}",)) for i in range(5)]
+    for record in repeats:
+        assert suppressor.filter(record) == []
+    other = _storm_record(msg="Something else")
+    assert suppressor.filter(other) == [other]
+    assert suppressor.collapsed == 5
+
+    time.sleep(0.06)
+    later = _storm_record(lineno=7)
+    released = suppressor.filter(later)
+    assert released[-1] is later
+    summary = released[0]
+    assert summary.repeat_count == 5
+    assert summary.getMessage() == "Dependency failed: timeout 4"
+    assert summary.first_timestamp == repeats[0].created
+    assert summary.last_timestamp == repeats[-1].created
+    # Without repeats, an expired window releases nothing
+    assert len(released) == 2
+
+
+def test_drain_releases_pending_repeats():
+    """
+    Test that drain() releases collapsed records before their window ends.
+    """
+    suppressor = LogSuppressor(collapse_window=60)
+    suppressor.filter(_storm_record())
+    suppressor.filter(_storm_record())
+    suppressor.filter(_storm_record())
+    released = suppressor.drain()
+    assert [r.repeat_count for r in released] == [2]
+    assert suppressor.drain() == []
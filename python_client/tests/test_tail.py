@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from urllib.parse import parse_qs, urlparse
+
+from log_aggregator_handler import LogAggregatorClient
+from log_aggregator_handler.tail import TailCache, format_entry
+
+TEST_API_ENDPOINT = "http://test-log-api.com/api/logs"
+
+
+def _entry(entry_id, host="web-1", log_level="INFO"):
+    return {"id": entry_id, "host": host, "host_process": "app", "log_level": log_level,
+            "log_message": f"Message {entry_id}", "timestamp": "2025-03-27 08:00:00"}
+
+
+def _serve_table(requests_mock, table, api_endpoint=TEST_API_ENDPOINT):
+    """
+    Answer GET /api/logs like the server: newest first, or after since_id oldest first.
+    """
+    def respond(request, context):
+        query = parse_qs(urlparse(request.url).query)  # request.qs lowercases values
+        rows = [row for row in table if all(row[name] == query[name][0] for name in ("host", "log_level") if name in query)]
+        limit = int(query["limit"][0])
+        if "since_id" in query:
+            return [row for row in rows if row["id"] > int(query["since_id"][0])][:limit]
+        return list(reversed(rows))[:limit]
+
+    requests_mock.get(api_endpoint, json=respond)
+
+
+def _take(iterator, count):
+    items = [next(iterator) for _ in range(count)]
+    iterator.close()
+    return items
+
+
+def test_tail_yields_backlog_then_new_entries(requests_mock):
+    """
+    Test that tail() starts with the backlog, then polls after the highest id with long-polling.
+    """
+    table = [_entry(i) for i in range(1, 6)]
+    _serve_table(requests_mock, table)
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+
+    entries = client.tail(backlog=2, poll_interval=0)
+    assert [entry["id"] for entry in _take(entries, 2)] == [4, 5]
+
+    table.extend([_entry(6), _entry(7)])
+    entries = client.tail(since_id=5, poll_interval=0)
+    assert [entry["id"] for entry in _take(entries, 2)] == [6, 7]
+    poll = requests_mock.last_request.qs
+    assert poll["since_id"] == ["5"] and poll["wait"] == ["20.0"]
+    client.close()
+
+
+def test_tail_resumes_from_cache(requests_mock, tmp_path):
+    """
+    Test that a restarted tail, and a narrower one, continue from the saved cache without refetching.
+    """
+    table = [_entry(i, log_level="ERROR" if i % 2 else "INFO") for i in range(1, 5)]
+    _serve_table(requests_mock, table)
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    cache_path = str(tmp_path / "tail.json")
+
+    entries = client.tail(host="web-1", backlog=4, poll_interval=0, cache=TailCache(cache_path))
+    assert [entry["id"] for entry in _take(entries, 4)] == [1, 2, 3, 4]
+
+    table.append(_entry(5, log_level="ERROR"))
+    requests_mock.reset_mock()
+    # Same host, errors only: the backlog comes from the cache, then only id 5 is fetched
+    entries = client.tail(host="web-1", log_level="ERROR", backlog=10, poll_interval=0, cache=TailCache(cache_path))
+    assert [entry["id"] for entry in _take(entries, 3)] == [1, 3, 5]
+    assert requests_mock.request_history[0].qs["since_id"] == ["4"]
+    client.close()
+
+
+def test_restarted_tail_shows_only_backlog(requests_mock, tmp_path):
+    """
+    Test that a restarted tail starts with the newest backlog entries, not with everything
+    logged since the cached ones, and fetches only what the cache is missing.
+    """
+    table = [_entry(i) for i in range(1, 5)]
+    _serve_table(requests_mock, table)
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    cache_path = str(tmp_path / "tail.json")
+    assert [entry["id"] for entry in _take(client.tail(backlog=3, poll_interval=0, cache=TailCache(cache_path)), 3)] \
+        == [2, 3, 4]
+
+    table.extend(_entry(i) for i in range(5, 21))
+    entries = client.tail(backlog=3, poll_interval=0, cache=TailCache(cache_path))
+    assert [entry["id"] for entry in _take(entries, 3)] == [18, 19, 20]
+
+    table.append(_entry(21))
+    requests_mock.reset_mock()
+    entries = client.tail(backlog=3, poll_interval=0, cache=TailCache(cache_path))
+    assert [entry["id"] for entry in _take(entries, 3)] == [19, 20, 21]
+    assert [request.qs["since_id"] for request in requests_mock.request_history] == [["20"]]
+    client.close()
+
+
+def test_tail_cache_is_per_endpoint(requests_mock, tmp_path):
+    """
+    Test that a tail of another endpoint does not get the entries, or the high-water mark,
+    cached for the first one.
+    """
+    other_endpoint = "http://other-log-api.com/api/logs"
+    _serve_table(requests_mock, [_entry(i) for i in range(998, 1001)])
+    _serve_table(requests_mock, [_entry(i, host="db-1") for i in range(1, 4)], api_endpoint=other_endpoint)
+    cache_path = str(tmp_path / "tail.json")
+
+    client = LogAggregatorClient(api_endpoint=TEST_API_ENDPOINT)
+    assert [entry["id"] for entry in _take(client.tail(backlog=3, poll_interval=0, cache=TailCache(cache_path)), 3)] \
+        == [998, 999, 1000]
+    client.close()
+
+    requests_mock.reset_mock()
+    client = LogAggregatorClient(api_endpoint=other_endpoint)
+    entries = client.tail(backlog=3, poll_interval=0, cache=TailCache(cache_path))
+    assert [entry["id"] for entry in _take(entries, 3)] == [1, 2, 3]
+    assert requests_mock.request_history[0].url.startswith(other_endpoint)
+    assert "since_id" not in requests_mock.request_history[0].qs
+    client.close()
+    # Polls would continue after id 3, not after the first endpoint's 1000
+    assert TailCache(cache_path).resume(other_endpoint, {}) == ([_entry(i, host="db-1") for i in range(1, 4)], 3)
+    assert TailCache(cache_path).resume(TEST_API_ENDPOINT, {}) is None
+
+
+def test_tail_cache_evicts_oldest_and_shrinks_ranges():
+    """
+    Test that the cache stays bounded and no longer claims evicted ids.
+    """
+    cache = TailCache(max_entries=3)
+    cache.store(TEST_API_ENDPOINT, {}, 0, [_entry(i) for i in range(1, 6)])
+
+    assert len(cache) == 3
+    assert cache.resume(TEST_API_ENDPOINT, {}, since_id=1) is None
+    entries, high = cache.resume(TEST_API_ENDPOINT, {}, since_id=2)
+    assert [entry["id"] for entry in entries] == [3, 4, 5]
+    assert high == 5
+
+
+def test_format_entry():
+    """
+    Test the plain text line of the tail command.
+    """
+    entry = dict(_entry(1), host_process=None)
+    assert format_entry(entry) == "2025-03-27 08:00:00 web-1 - INFO Message 1"
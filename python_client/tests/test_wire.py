@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+
+import pytest
+
+msgpack = pytest.importorskip("msgpack")
+
+from log_aggregator_handler.serializer import RecordSerializer
+from log_aggregator_handler.wire import CONTEXT_FIELDS, MsgpackEncoder, is_packed, unpack_record
+
+
+def _entries(count):
+    serializer = RecordSerializer("web-1", {logging.INFO: "INFO", logging.ERROR: "ERROR"})
+    entries = []
+    for i in range(count):
+        record = logging.LogRecord(f"app.{i % 2}", logging.INFO if i % 3 else logging.ERROR, "/srv/app.py",
+                                   10 + i, "Handled %s", (i,), None, "handle")
+        record.created = 1698400800.25 + i
+        if i % 2:
+            record.user_id = i
+        entries.append(serializer.to_dict(record, record.getMessage()))
+    return entries
+
+
+def test_pack_round_trip():
+    """
+    Test that a packed record unpacks to the entry JSON would have sent.
+    """
+    encoder = MsgpackEncoder()
+    for entry in _entries(4):
+        packed = encoder.pack(entry)
+        assert is_packed(packed)
+        assert unpack_record(packed) == entry
+
+
+def test_batch_shares_contexts():
+    """
+    Test that a batch sends each context once and records refer to it, with epoch microsecond timestamps.
+    """
+    encoder = MsgpackEncoder()
+    entries = _entries(6)
+    payloads = [encoder.pack(entry) for entry in entries[:5]]
+    # A JSON record, e.g. forwarded by an agent, is packed on the way
+    payloads.append(json.dumps(entries[5]).encode())
+
+    batch = msgpack.unpackb(encoder.batch(payloads), strict_map_key=False)
+
+    assert batch["version"] == 1
+    assert batch["context_fields"] == list(CONTEXT_FIELDS)
+    assert len(batch["contexts"]) == 2
+    assert len(batch["records"]) == 6
+    for entry, (index, timestamp, level, message, lineno, fields) in zip(entries, batch["records"]):
+        context = dict(zip(batch["context_fields"], batch["contexts"][index]))
+        assert context["logger_name"] == entry["logger_name"]
+        assert timestamp == round((1698400800.25 + entry["lineno"] - 10) * 1e6)
+        assert (level, message, lineno) == (entry["level"], entry["message"], entry["lineno"])
+        assert fields.get("extra") == entry.get("extra")
+
+
+def test_batch_smaller_than_json():
+    """
+    Test that the shared contexts make a batch smaller than the JSON array.
+    """
+    encoder = MsgpackEncoder()
+    entries = _entries(100)
+    packed = encoder.batch([encoder.pack(entry) for entry in entries])
+    assert len(packed) < len(json.dumps(entries, separators=(",", ":"))) / 2